@@ -1,4 +1,7 @@
-from web_app import app
+# PDFの並列抽出（spawn）の子プロセスはこのファイルを __mp_main__ として読み込むので、
+# そのときはアプリ（ジョブのワーカースレッドなど）を起動しない
+if __name__ != '__mp_main__':
+    from web_app import app
 
 if __name__ == '__main__':
     import os
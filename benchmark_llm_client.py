@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Claude API クライアントのスループット計測（ローカルのスタブサーバーを使用、通信は外に出ません）
+
+従来の呼び出し方（呼び出しごとに requests.post、再試行なし）と、共有クライアント
+（llm_client.ClaudeClient: 接続プール + 再試行）を比較します。
+エラー率を指定すると、429/529/500 が混ざった状態での成功率も比較できます。
+
+使い方:
+    python benchmark_llm_client.py
+    python benchmark_llm_client.py --requests 400 --threads 8 --latency 0.02 --error-rate 0.1
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ['LLM_CACHE'] = '0'  # 接続・再試行だけを比べるため、レスポンスキャッシュは使わない
+
+from llm_client import ClaudeClient, DEFAULT_MODEL
+from llm_stub_server import start_stub_server
+
+
+def bare_post(base_url: str, prompt: str) -> int:
+    """従来方式: 毎回ヘッダーを組み立てて requests.post（接続は毎回新規）"""
+    headers = {
+        'Content-Type': 'application/json',
+        'x-api-key': 'dummy',
+        'anthropic-version': '2023-06-01'
+    }
+    data = {'model': DEFAULT_MODEL, 'max_tokens': 1024, 'messages': [{'role': 'user', 'content': prompt}]}
+    response = requests.post(f"{base_url}/v1/messages", headers=headers,
+                             data=json.dumps(data, ensure_ascii=False).encode('utf-8'), timeout=60)
+    return response.status_code
+
+
+def run(label: str, call, count: int, threads: int, stats_url: str) -> None:
+    before = requests.get(stats_url).json()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            statuses = list(executor.map(call, [f"質問{i}" for i in range(count)]))
+    elapsed = time.perf_counter() - start
+    after = requests.get(stats_url).json()
+
+    success = sum(1 for status in statuses if status == 200)
+    connections = after['connections'] - before['connections']
+    sent = after['requests'] - before['requests']
+    print(f"{label:<10} | {count / elapsed:>9.1f} | {success / count:>7.1%} | {sent:>8} | {connections:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Claude API クライアントのスループット計測')
+    parser.add_argument('--requests', type=int, default=300, help='リクエスト数')
+    parser.add_argument('--threads', type=int, default=8, help='同時実行数')
+    parser.add_argument('--latency', type=float, default=0.01, help='スタブの応答遅延（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='スタブが 429/529/500 を返す割合')
+    args = parser.parse_args()
+
+    server, _ = start_stub_server(latency=args.latency, error_rate=args.error_rate, retry_after=0.05)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    stats_url = f"{base_url}/stats"
+
+    client = ClaudeClient('dummy', base_url=base_url, pool_size=args.threads, backoff_base=0.05, backoff_max=0.5)
+
+    def pooled(prompt: str) -> int:
+        return client.create_message(prompt, max_tokens=1024).status_code
+
+    print(f"リクエスト数: {args.requests}, 同時実行数: {args.threads}, 遅延: {args.latency}秒, エラー率: {args.error_rate}")
+    print(f"{'方式':<10} | {'req/s':>9} | {'成功率':>7} | {'送信数':>8} | {'接続数':>6}")
+    print('-' * 56)
+    run('従来', lambda prompt: bare_post(base_url, prompt), args.requests, args.threads, stats_url)
+    run('共有クライアント', pooled, args.requests, args.threads, stats_url)
+    print(f"\n共有クライアントの再試行: {client.stats['retries']}回, 失敗: {client.stats['failures']}件")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
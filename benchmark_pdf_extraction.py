@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+PDFテキスト抽出のスループット計測（ワーカー数ごとの pages/sec）
+
+同梱の reference_docs/第2章.pdf（13ページ）を使います。大きなアップロードを想定して、
+--repeat でページを繰り返した一時PDFを作って計測できます。毎回空のキャッシュで抽出します。
+
+使い方:
+    python benchmark_pdf_extraction.py
+    python benchmark_pdf_extraction.py --repeat 8 --workers 1,2,4,8 --extractor pypdf2
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pdf_text import PDFTextStore, resolve_extractor
+
+DEFAULT_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reference_docs', '第2章.pdf')
+
+
+def build_pdf(source: str, repeat: int, path: str) -> int:
+    """source のページを repeat 回繰り返したPDFを作ってページ数を返す"""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(source)
+    writer = PyPDF2.PdfWriter()
+    for _ in range(repeat):
+        for page in reader.pages:
+            writer.add_page(page)
+    with open(path, 'wb') as file:
+        writer.write(file)
+    return len(reader.pages) * repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PDFテキスト抽出のスループット計測')
+    parser.add_argument('--pdf', default=DEFAULT_PDF, help='計測に使うPDF')
+    parser.add_argument('--repeat', type=int, default=4, help='ページを繰り返す回数')
+    parser.add_argument('--workers', default='1,2,4', help='計測するワーカー数（カンマ区切り）')
+    parser.add_argument('--extractor', default='pypdf2', help='pypdf2 / pdfminer')
+    parser.add_argument('--rounds', type=int, default=3, help='各設定の計測回数（最速値を採用）')
+    args = parser.parse_args()
+
+    extractor = resolve_extractor(args.extractor)
+    work_dir = tempfile.mkdtemp(prefix='pdf_bench_')
+    try:
+        pdf_path = os.path.join(work_dir, 'bench.pdf')
+        page_count = build_pdf(args.pdf, args.repeat, pdf_path)
+        print(f"PDF: {os.path.basename(args.pdf)} × {args.repeat} = {page_count}ページ, 抽出方法: {extractor}, CPU: {os.cpu_count()}")
+        print(f"{'ワーカー数':<6} | {'秒':>7} | {'pages/sec':>10} | {'倍率':>6}")
+        print('-' * 40)
+
+        baseline = None
+        reference_text = None
+        for workers in [int(w) for w in args.workers.split(',') if w.strip()]:
+            best = None
+            for round_no in range(args.rounds):
+                store = PDFTextStore(os.path.join(work_dir, f'cache_{workers}_{round_no}.sqlite3'))
+                start = time.perf_counter()
+                document = store.get(pdf_path, extractor=extractor, workers=workers)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+                if reference_text is None:
+                    reference_text = document.text
+                elif document.text != reference_text:
+                    print(f"[ERROR] ワーカー数 {workers} で抽出結果が一致しません")
+            baseline = baseline or best
+            print(f"{workers:<10} | {best:>7.2f} | {page_count / best:>10.1f} | {baseline / best:>5.2f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
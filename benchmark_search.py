@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+/search 相当の処理のスループット計測
+
+毎リクエストCSVを読み直す従来方式（load_faq_data + 全件走査）と、
+変更時のみ再読み込みする方式（refresh_faq_data + 全件走査）、さらにn-gramインデックスで
+候補を絞り込む方式の requests/sec を、FAQ件数 1k / 10k / 100k で比較します。
+インデックス方式については、全件走査と最上位の結果が一致した割合も表示します。
+
+使い方:
+    python benchmark_search.py
+    python benchmark_search.py --sizes 1000 10000 --seconds 5
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from faq_system import FAQSystem
+
+VISA_TYPES = ['B-1', 'B-2', 'H-1B', 'L-1', 'E-2', 'F-1', 'J-1', 'O-1', 'ESTA']
+TOPICS = ['申請料金', '審査期間', '面接の準備', '必要書類', '有効期限', '滞在期間', '延長手続き', '家族の同伴', 'サポート範囲']
+PATTERNS = [
+    '{visa}ビザの{topic}について教えてください',
+    '{visa}の{topic}はどうなりますか？',
+    '{topic}（{visa}）で注意する点は？',
+    '{visa}ビザで{topic}を確認したい',
+]
+
+QUERIES = [
+    'H-1Bビザの申請料金はいくらですか？',
+    'ESTAの有効期限を知りたい',
+    'L-1ビザの面接で必要な書類は？',
+    'F-1の滞在期間はどのくらい？',
+]
+
+
+def build_csv(path: str, size: int) -> None:
+    """合成FAQデータをCSVに書き出す"""
+    rng = random.Random(size)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=['question', 'answer', 'keywords', 'category'])
+        writer.writeheader()
+        for i in range(size):
+            visa = rng.choice(VISA_TYPES)
+            topic = rng.choice(TOPICS)
+            question = rng.choice(PATTERNS).format(visa=visa, topic=topic)
+            writer.writerow({
+                'question': f"{question}（{i}）",
+                'answer': f"{visa}ビザの{topic}に関する回答です。詳細は担当者にお問い合わせください。",
+                'keywords': f"{visa};{topic}",
+                'category': '一般'
+            })
+
+
+def measure(handler, seconds: float) -> float:
+    """指定秒数だけハンドラを繰り返し実行し、requests/secを返す"""
+    count = 0
+    start = time.perf_counter()
+    while True:
+        with contextlib.redirect_stdout(io.StringIO()):
+            handler(QUERIES[count % len(QUERIES)])
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/search スループット計測')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--seconds', type=float, default=3.0, help='各計測の実行秒数')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='faq_bench_')
+    os.chdir(work_dir)  # pending_qa.csv などを一時ディレクトリに作らせる
+
+    print(f"{'件数':>8} | {'従来 (req/s)':>14} | {'変更時のみ (req/s)':>18} | {'n-gram索引 (req/s)':>18} | {'上位一致率':>8}")
+    print('-' * 82)
+    for size in args.sizes:
+        csv_path = os.path.join(work_dir, f"faq_{size}.csv")
+        build_csv(csv_path, size)
+        with contextlib.redirect_stdout(io.StringIO()):
+            faq_system = FAQSystem(csv_path)
+
+        def before(question):
+            faq_system.load_faq_data(csv_path)
+            faq_system.search_faq(question, exhaustive=True)
+
+        def after(question):
+            faq_system.refresh_faq_data()
+            faq_system.search_faq(question, exhaustive=True)
+
+        def indexed(question):
+            faq_system.refresh_faq_data()
+            faq_system.search_faq(question)
+
+        before_rps = measure(before, args.seconds)
+        after_rps = measure(after, args.seconds)
+        indexed_rps = measure(indexed, args.seconds)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            agree = sum(
+                faq_system.search_faq(q)[:1] == faq_system.search_faq(q, exhaustive=True)[:1]
+                for q in QUERIES
+            )
+        print(f"{size:>8} | {before_rps:>14.2f} | {after_rps:>18.2f} | {indexed_rps:>18.2f} | {f'{agree}/{len(QUERIES)}':>8}")
+
+
+if __name__ == '__main__':
+    main()
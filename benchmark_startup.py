@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+起動時間（コールドスタート）の計測
+
+新しいPythonプロセスで以下を計測します（いずれもN回の中央値）:
+  - web_app のインポート完了まで（Flaskアプリが応答可能になるまで）
+  - FAQSystem の生成のみ
+  - セマンティックモデルの初回ロード（get_semantic_model）
+
+デプロイ環境で実行して、変更前後の値を比較してください。
+
+使い方:
+    python benchmark_startup.py
+    python benchmark_startup.py --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MEASUREMENTS = {
+    'web_app インポート': "import time; t = time.perf_counter(); import web_app; print(time.perf_counter() - t)",
+    'FAQSystem 生成': "import time; from faq_system import FAQSystem; t = time.perf_counter(); FAQSystem('faq_data-1.csv'); print(time.perf_counter() - t)",
+    'モデル初回ロード': "import time; from faq_system import get_semantic_model; t = time.perf_counter(); get_semantic_model(); print(time.perf_counter() - t)",
+}
+
+
+def run_once(code: str) -> float:
+    """新しいプロセスでコードを実行し、最終行に出力された秒数を返す"""
+    env = dict(os.environ, SEMANTIC_MODEL_WARMUP='0')
+    output = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='起動時間の計測')
+    parser.add_argument('--runs', type=int, default=3, help='計測回数')
+    args = parser.parse_args()
+
+    for name, code in MEASUREMENTS.items():
+        times = [run_once(code) for _ in range(args.runs)]
+        print(f"{name:<16}: 中央値 {statistics.median(times):.2f}秒 (最小 {min(times):.2f}秒, 最大 {max(times):.2f}秒)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+近傍検索インデックスの recall@K と検索レイテンシの計測
+
+ExactIndex（全件走査）を正解として、IVFIndex の nprobe ごとの recall@K と
+1クエリあたりの検索時間を比較します。あわせて構築時間と追加・削除の時間も表示します。
+ベクトルは埋め込みモデルと同じ384次元の合成データ（クラスタ構造あり）を使います。
+
+使い方:
+    python benchmark_vector_index.py
+    python benchmark_vector_index.py --size 300000 --queries 200 --k 10
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_store import normalize_rows
+from vector_index import ExactIndex, IVFIndex
+
+
+def make_vectors(size: int, dim: int, clusters: int, rng) -> np.ndarray:
+    """クラスタ構造を持つ正規化済みの合成ベクトルを作成"""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    return normalize_rows(vectors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='近傍検索インデックスの recall@K / レイテンシ計測')
+    parser.add_argument('--size', type=int, default=100000, help='登録するベクトル数')
+    parser.add_argument('--dim', type=int, default=384, help='次元数')
+    parser.add_argument('--queries', type=int, default=100, help='クエリ数')
+    parser.add_argument('--k', type=int, default=10, help='recall@K の K')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.size, args.dim, max(10, args.size // 500), rng)
+    keys = list(range(args.size))
+    queries = normalize_rows(vectors[rng.choice(args.size, args.queries)] +
+                             0.3 * rng.standard_normal((args.queries, args.dim)).astype(np.float32))
+
+    exact = ExactIndex()
+    exact.add(keys, vectors)
+
+    start = time.perf_counter()
+    ivf = IVFIndex(min_train_size=1)
+    ivf.add(keys, vectors)
+    build_time = time.perf_counter() - start
+    print(f"登録件数: {args.size}, 次元: {args.dim}, IVF構築: {build_time:.2f}秒")
+
+    start = time.perf_counter()
+    truth = [{key for key, _ in exact.search(query, args.k)} for query in queries]
+    exact_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    print(f"{'方式':<14} | {'recall@' + str(args.k):>10} | {'ms/クエリ':>10}")
+    print('-' * 42)
+    print(f"{'exact':<14} | {1.0:>10.3f} | {exact_ms:>10.2f}")
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        start = time.perf_counter()
+        found = [{key for key, _ in ivf.search(query, args.k)} for query in queries]
+        ivf_ms = (time.perf_counter() - start) / len(queries) * 1000
+        recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+        print(f"{'ivf nprobe=' + str(nprobe):<14} | {recall:>10.3f} | {ivf_ms:>10.2f}")
+
+    # 差分更新（追加・削除）の時間
+    extra = make_vectors(1000, args.dim, 10, rng)
+    start = time.perf_counter()
+    ivf.add(list(range(args.size, args.size + 1000)), extra)
+    add_ms = (time.perf_counter() - start)
+    start = time.perf_counter()
+    ivf.remove(list(range(args.size, args.size + 1000)))
+    remove_ms = (time.perf_counter() - start)
+    print(f"\nIVF 1000件追加: {add_ms * 1000:.1f}ms, 1000件削除: {remove_ms * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+プロセス間の変更通知（マルチプロセスで動かすときのFAQ・承認待ちデータの再読み込み用）
+
+16バイトのファイルを各プロセスが mmap で共有し、書き込んだプロセスが値を新しいトークンに書き換えます。
+他のプロセスは値を読んで前回と違えば再読み込みします。読み取りはメモリの比較だけなので、
+リクエストごとにファイルの更新時刻を調べるより軽く、書き込み直後に全ワーカーへ伝わります。
+"""
+
+import mmap
+import os
+import threading
+import time
+
+TOKEN_SIZE = 16
+
+
+class ChangeSignal:
+    """共有ファイル上の変更トークン"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if not os.path.exists(path) or os.path.getsize(path) < TOKEN_SIZE:
+            with open(path, 'ab') as f:
+                f.write(b'\0' * (TOKEN_SIZE - f.tell()))
+        self._file = open(path, 'r+b')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), TOKEN_SIZE)
+        except (OSError, ValueError) as e:
+            # mmap できない環境ではファイルを直接読み書きする
+            print(f"[WARNING] 変更通知ファイルを mmap できません（ファイルの読み書きで代用）: {e}")
+            self._map = None
+
+    def token(self) -> bytes:
+        """現在のトークン（変更のたびに変わる）"""
+        if self._map is not None:
+            return self._map[:TOKEN_SIZE]
+        with self._lock:
+            self._file.seek(0)
+            return self._file.read(TOKEN_SIZE)
+
+    def bump(self) -> bytes:
+        """変更を通知して、新しいトークンを返す"""
+        token = time.time_ns().to_bytes(8, 'little') + os.urandom(8)
+        with self._lock:
+            if self._map is not None:
+                self._map[:TOKEN_SIZE] = token
+            else:
+                self._file.seek(0)
+                self._file.write(token)
+                self._file.flush()
+        return token
+
+
+def create_change_signal():
+    """DATA_CHANGE_SIGNAL にパスが設定されていれば変更通知を作成（未設定ならNone）"""
+    path = os.getenv('DATA_CHANGE_SIGNAL')
+    if not path:
+        return None
+    try:
+        return ChangeSignal(path)
+    except OSError as e:
+        print(f"[WARNING] 変更通知ファイルを開けません（毎回ストレージを確認します）: {e}")
+        return None
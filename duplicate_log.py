@@ -0,0 +1,174 @@
+"""
+重複判定ログ（FAQ自動生成で却下された候補の記録）
+
+SQLite に保存するので、gunicorn の複数ワーカー・再起動をまたいで同じ記録が見え、IDも重複しません。
+一覧に出すのは直近 DUPLICATE_LOG_CAPACITY 件まで、保存は DUPLICATE_LOG_MAX_ROWS 件までで、古い行から削除します。
+クリアは表示の起点を進めるだけなので、記録自体は上限まで残ります。
+以前の duplicate_log.jsonl があれば初回だけ取り込みます。
+
+- DUPLICATE_LOG_PATH: SQLiteファイルのパス
+- DUPLICATE_LOG_CAPACITY: 一覧の対象にする直近の件数（既定 1000）
+- DUPLICATE_LOG_MAX_ROWS: 保存する最大件数（既定 50000）
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LOG_PATH = os.path.join(BASE_DIR, 'duplicate_log.sqlite3')
+LEGACY_JSONL_PATH = os.path.join(BASE_DIR, 'duplicate_log.jsonl')
+DEFAULT_CAPACITY = 1000
+DEFAULT_MAX_ROWS = 50000
+PRUNE_INTERVAL = 100  # この件数ごとに古い行を削除
+
+
+class DuplicateLog:
+    """ワーカー間で共有する重複判定ログ（IDが大きいほど新しい）"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS duplicates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            run_id TEXT,
+            reason TEXT NOT NULL DEFAULT '',
+            similarity REAL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_duplicates_run ON duplicates (run_id, id);
+        CREATE TABLE IF NOT EXISTS duplicate_log_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = DEFAULT_LOG_PATH, capacity: int = DEFAULT_CAPACITY,
+                 max_rows: int = DEFAULT_MAX_ROWS, legacy_path: Optional[str] = None):
+        self.path = path
+        self.capacity = capacity
+        self.max_rows = max(capacity, max_rows)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+        if legacy_path:
+            self._import_jsonl(legacy_path)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _row(record: Dict) -> Tuple:
+        data = {k: v for k, v in record.items() if k not in ('id', 'timestamp')}
+        similarity = record.get('similarity')
+        return (record.get('timestamp') or time.strftime('%Y-%m-%d %H:%M:%S'), record.get('run_id'),
+                record.get('reason') or '', None if similarity is None else float(similarity),
+                json.dumps(data, ensure_ascii=False))
+
+    def _import_jsonl(self, legacy_path: str) -> None:
+        """旧形式（JSON Lines）のログを一度だけ取り込む"""
+        if not os.path.exists(legacy_path):
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute("SELECT 1 FROM duplicate_log_meta WHERE key = 'legacy_imported'").fetchone():
+                return
+            rows = []
+            try:
+                with open(legacy_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            rows.append(self._row(json.loads(line)))
+                        except ValueError:
+                            continue  # 書き込み途中で終了した行
+            except OSError as e:
+                print(f"[WARNING] 旧重複判定ログの読み込みに失敗: {e}")
+            conn.executemany('INSERT INTO duplicates (timestamp, run_id, reason, similarity, data) VALUES (?, ?, ?, ?, ?)',
+                             rows[-self.max_rows:])
+            conn.execute("INSERT INTO duplicate_log_meta (key, value) VALUES ('legacy_imported', 1)")
+        if rows:
+            print(f"[INFO] 旧重複判定ログから {min(len(rows), self.max_rows)}件を取り込みました")
+
+    def append(self, record: Dict) -> Dict:
+        """記録を追加（ID・時刻を付けて返す）"""
+        row = self._row(record)
+        try:
+            with self._connect() as conn:
+                record_id = conn.execute(
+                    'INSERT INTO duplicates (timestamp, run_id, reason, similarity, data) VALUES (?, ?, ?, ?, ?)', row
+                ).lastrowid
+                if record_id % PRUNE_INTERVAL == 0:
+                    conn.execute('DELETE FROM duplicates WHERE id <= ?', (record_id - self.max_rows,))
+        except sqlite3.Error as e:
+            print(f"[WARNING] 重複判定ログの書き込みに失敗: {e}")
+            return dict(record, timestamp=row[0])
+        return dict(record, id=record_id, timestamp=row[0])
+
+    def last_id(self) -> int:
+        """最新の記録のID（別ワーカーでの追加を検知するため）"""
+        return self._connect().execute('SELECT COALESCE(MAX(id), 0) FROM duplicates').fetchone()[0]
+
+    def _visible_from(self, conn: sqlite3.Connection) -> int:
+        """一覧の対象になる最小ID - 1（クリア位置と直近 capacity 件の境界の大きい方）"""
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM duplicates').fetchone()[0]
+        cleared = conn.execute("SELECT value FROM duplicate_log_meta WHERE key = 'cleared_through'").fetchone()
+        return max(cleared[0] if cleared else 0, last_id - self.capacity)
+
+    def query(self, run_id: str = None, reason: str = None, min_similarity: float = None,
+              max_similarity: float = None, offset: int = 0, limit: int = 50) -> Tuple[List[Dict], int]:
+        """条件に合う記録を新しい順に offset から limit 件（と、条件に合う件数）"""
+        conn = self._connect()
+        conditions, params = ['id > ?'], [self._visible_from(conn)]
+        if run_id:
+            conditions.append('run_id = ?')
+            params.append(run_id)
+        if reason:
+            conditions.append("instr(reason, ?) > 0")
+            params.append(reason)
+        if min_similarity is not None:
+            conditions.append('similarity >= ?')
+            params.append(min_similarity)
+        if max_similarity is not None:
+            conditions.append('similarity <= ?')
+            params.append(max_similarity)
+        where = ' AND '.join(conditions)
+        total = conn.execute(f'SELECT COUNT(*) FROM duplicates WHERE {where}', params).fetchone()[0]
+        rows = conn.execute(f'SELECT id, timestamp, data FROM duplicates WHERE {where} ORDER BY id DESC LIMIT ? OFFSET ?',
+                            params + [limit, offset]).fetchall()
+        return [dict(json.loads(data), id=record_id, timestamp=timestamp) for record_id, timestamp, data in rows], total
+
+    def clear(self) -> int:
+        """一覧を空にする（記録は保存上限まで残す）"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            visible_from = self._visible_from(conn)
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM duplicates').fetchone()[0]
+            count = conn.execute('SELECT COUNT(*) FROM duplicates WHERE id > ?', (visible_from,)).fetchone()[0]
+            conn.execute("INSERT INTO duplicate_log_meta (key, value) VALUES ('cleared_through', ?) "
+                         "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)", (last_id,))
+        return count
+
+    def __len__(self) -> int:
+        conn = self._connect()
+        return conn.execute('SELECT COUNT(*) FROM duplicates WHERE id > ?', (self._visible_from(conn),)).fetchone()[0]
+
+
+def create_duplicate_log() -> DuplicateLog:
+    """環境変数の設定で重複判定ログを作成"""
+    path = os.getenv('DUPLICATE_LOG_PATH') or DEFAULT_LOG_PATH
+    return DuplicateLog(
+        path,
+        capacity=int(os.getenv('DUPLICATE_LOG_CAPACITY', str(DEFAULT_CAPACITY))),
+        max_rows=int(os.getenv('DUPLICATE_LOG_MAX_ROWS', str(DEFAULT_MAX_ROWS))),
+        legacy_path=LEGACY_JSONL_PATH if path == DEFAULT_LOG_PATH else None
+    )
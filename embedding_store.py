@@ -0,0 +1,184 @@
+"""
+質問文の埋め込みベクトルを保持する永続ストア
+
+FAQ・承認待ちQ&Aの質問文ごとに正規化済みのfloat32ベクトルを1行ずつ持つ行列を管理し、
+CSVの隣に `.npy`（行列）と `.json`（行ごとの質問文とモデル名）として保存します。
+ベクトルは正規化済みなので、コーパス全体とのコサイン類似度は行列とベクトルの積1回で
+計算できます。上位K件だけが必要な検索には近傍検索インデックス（vector_index）を使います。
+"""
+
+import json
+import os
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+from vector_index import create_vector_index
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """各行をL2正規化したfloat32行列を返す"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingStore:
+    """質問文 → 正規化済み埋め込みベクトルの行列"""
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path  # 行列（.npy）
+        self.keys_path = os.path.splitext(path)[0] + '.json'  # 行ごとの質問文
+        self.model_name = model_name
+        self.keys: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self.matrix = None
+        self.index = None  # 近傍検索インデックス（初回の search で構築し、以降は差分更新）
+        self.load()
+
+    @staticmethod
+    def path_for(csv_file: str) -> str:
+        """CSVファイルに対応する .npy のパス（例: faq_data-1.csv → faq_data-1.embeddings.npy）"""
+        return os.path.splitext(csv_file)[0] + '.embeddings.npy'
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, text: str) -> bool:
+        return text in self.row_of
+
+    def load(self) -> None:
+        """保存済みの行列を読み込む（モデル違い・行数不一致の場合は破棄）"""
+        try:
+            with open(self.keys_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            matrix = np.load(self.path)
+            if meta.get('model') != self.model_name or len(meta.get('keys', [])) != matrix.shape[0]:
+                print(f"[WARNING] 埋め込みキャッシュが現在のモデル/データと一致しないため破棄します: {self.path}")
+                return
+            self.keys = list(meta['keys'])
+            self.row_of = {key: i for i, key in enumerate(self.keys)}
+            self.matrix = matrix.astype(np.float32, copy=False)
+            print(f"[INFO] 埋め込みキャッシュを読み込みました: {self.path}（{len(self.keys)}件）")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[WARNING] 埋め込みキャッシュ読み込みエラー: {e}")
+
+    def save(self) -> None:
+        """行列と質問文リストを保存（一時ファイル経由で置き換え）"""
+        if self.matrix is None:
+            return
+        try:
+            # 一時ファイル名はプロセスごとに分ける（複数のワーカーが同時に保存しても混ざらない）
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, self.matrix)
+            os.replace(tmp_path, self.path)
+
+            tmp_keys_path = f"{self.keys_path}.{os.getpid()}.tmp"
+            with open(tmp_keys_path, 'w', encoding='utf-8') as f:
+                json.dump({'model': self.model_name, 'keys': self.keys}, f, ensure_ascii=False)
+            os.replace(tmp_keys_path, self.keys_path)
+        except Exception as e:
+            print(f"[WARNING] 埋め込みキャッシュ保存エラー: {e}")
+
+    def add(self, texts: List[str], vectors) -> None:
+        """質問文とベクトルを追加（既存の質問文は上書き）"""
+        vectors = normalize_rows(vectors)
+        new_texts = []
+        new_rows = []
+        for text, vector in zip(texts, vectors):
+            row = self.row_of.get(text)
+            if row is not None:
+                self.matrix[row] = vector
+            else:
+                self.row_of[text] = len(self.keys) + len(new_texts)
+                new_texts.append(text)
+                new_rows.append(vector)
+        if new_rows:
+            block = np.vstack(new_rows)
+            self.matrix = block if self.matrix is None else np.vstack([self.matrix, block])
+            self.keys.extend(new_texts)
+        if self.index is not None:
+            self.index.add(list(texts), vectors)
+
+    def remove(self, texts: Iterable[str]) -> None:
+        """質問文を削除（最終行と入れ替えて削除するので1件あたりO(次元数)）"""
+        texts = list(texts)
+        if self.index is not None:
+            self.index.remove(texts)
+        last = len(self.keys)
+        for text in texts:
+            row = self.row_of.pop(text, None)
+            if row is None:
+                continue
+            last -= 1
+            if row != last:
+                moved = self.keys[last]
+                self.keys[row] = moved
+                self.row_of[moved] = row
+                self.matrix[row] = self.matrix[last]
+            self.keys.pop()
+        if self.matrix is not None:
+            self.matrix = self.matrix[:last]
+
+    def sync(self, texts: Iterable[str], encode: Callable, sources: tuple = ()) -> bool:
+        """ストアの内容を texts と一致させる（差分のみ追加・削除）
+
+        足りないベクトルは sources（他のEmbeddingStore）にあればコピーし、
+        それでも無いものだけをまとめて encode します。変更があった場合はTrueを返します。
+        """
+        wanted = dict.fromkeys(text for text in texts if text)
+        stale = [key for key in self.keys if key not in wanted]
+        return self.update(stale, wanted, encode, sources)
+
+    def update(self, removed: Iterable[str], added: Iterable[str], encode: Callable, sources: tuple = ()) -> bool:
+        """removed の質問文を削除し、added のうちストアに無いものを追加（変更があった場合はTrue）
+
+        FAQの追加・編集・削除の差分だけを反映するときに使います（sync は全件を比較）。
+        """
+        stale = [text for text in removed if text in self.row_of]
+        missing = [text for text in dict.fromkeys(added) if text and text not in self.row_of]
+        if not stale and not missing:
+            return False
+
+        if stale:
+            self.remove(stale)
+
+        to_encode = []
+        for text in missing:
+            for source in sources:
+                if source is not None and text in source:
+                    self.add([text], source.vectors([text]))
+                    break
+            else:
+                to_encode.append(text)
+
+        if to_encode:
+            self.add(to_encode, encode(to_encode))
+            print(f"[DEBUG] 埋め込みを{len(to_encode)}件計算しました（{os.path.basename(self.path)}）")
+
+        return True
+
+    def vectors(self, texts: List[str]) -> np.ndarray:
+        """質問文に対応する行を取り出す（すべてストアに存在すること）"""
+        return self.matrix[[self.row_of[text] for text in texts]]
+
+    def similarities(self, vector) -> np.ndarray:
+        """全行とのコサイン類似度（行列・ベクトル積1回）"""
+        if self.matrix is None:
+            return np.zeros(0, dtype=np.float32)
+        return self.matrix @ normalize_rows(vector)[0]
+
+    def search(self, vector, k: int) -> List[tuple]:
+        """類似度の高い順に最大k件の (質問文, 類似度) を返す（近傍検索インデックスを使用）"""
+        if self.matrix is None or not self.keys:
+            return []
+        if self.index is None:
+            self.index = create_vector_index()
+            self.index.add(self.keys, self.matrix)
+        return self.index.search(normalize_rows(vector)[0], k)
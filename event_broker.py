@@ -0,0 +1,163 @@
+"""
+プロセス内のイベント配信（Server-Sent Events 用）
+
+FAQ生成の進捗・ログ・採用/重複の候補を、発生した時点で購読者（SSE の接続）へ配信します。
+ポーリングと違い、1つの生成につき1本の接続で、変化があったときだけ送ります。
+
+- トピック（例: "job:<ジョブID>", "generation"）ごとに複数の購読者を持てます
+- 直近のイベントをトピックごとに保持し、再接続時は Last-Event-ID 以降を再送します
+- 遅い購読者のキューが溢れた場合、そのイベントは捨てます（進捗は次のスナップショットで追いつく）
+"""
+
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+Event = Tuple[int, str, Dict]  # (イベントID, 種類, データ)
+
+
+class Subscription:
+    """1つの購読（SSE の1接続）"""
+
+    def __init__(self, broker: 'EventBroker', topics: Tuple[str, ...], max_queue: int):
+        self.broker = broker
+        self.topics = topics
+        self.queue: 'queue.Queue[Event]' = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def get(self, timeout: float) -> Optional[Event]:
+        """次のイベント（timeout 秒以内に来なければNone）"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """トピック単位の publish / subscribe"""
+
+    def __init__(self, history_size: int = 200, max_topics: int = 100, max_queue: int = 1000):
+        self.history_size = history_size
+        self.max_topics = max_topics
+        self.max_queue = max_queue
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Subscription]] = {}
+        self._history: 'OrderedDict[str, deque]' = OrderedDict()
+
+    def publish(self, topic: str, event_type: str, data: Dict) -> int:
+        with self._lock:
+            event = (next(self._ids), event_type, data)
+            history = self._history.get(topic)
+            if history is None:
+                history = self._history[topic] = deque(maxlen=self.history_size)
+                while len(self._history) > self.max_topics:
+                    self._history.popitem(last=False)
+            else:
+                self._history.move_to_end(topic)
+            history.append(event)
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                subscription.dropped += 1
+        return event[0]
+
+    def subscribe(self, *topics: str, last_event_id: int = None) -> Subscription:
+        """購読を開始（last_event_id を渡すと、それより後の保持済みイベントを先に受け取る）"""
+        subscription = Subscription(self, topics, self.max_queue)
+        with self._lock:
+            if last_event_id is not None:
+                missed = sorted(event for topic in topics for event in self._history.get(topic, ())
+                                if event[0] > last_event_id)
+                for event in missed[-self.max_queue:]:
+                    subscription.queue.put_nowait(event)
+            for topic in topics:
+                self._subscribers.setdefault(topic, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic, [])
+                if subscription in subscribers:
+                    subscribers.remove(subscription)
+                if not subscribers:
+                    self._subscribers.pop(topic, None)
+
+    def subscriber_count(self, topic: str = None) -> int:
+        with self._lock:
+            if topic is not None:
+                return len(self._subscribers.get(topic, ()))
+            return len({id(s) for subscribers in self._subscribers.values() for s in subscribers})
+
+
+def format_sse(event_type: str, data: Dict, event_id: int = None) -> str:
+    """SSE の1イベント分の文字列"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    for line in json.dumps(data, ensure_ascii=False).split('\n'):
+        lines.append(f"data: {line}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream_events(subscription: Subscription, snapshot=None, is_finished=None,
+                  keepalive: float = 15.0, snapshot_interval: float = 2.0,
+                  max_duration: Optional[float] = None) -> Iterator[str]:
+    """購読したイベントを SSE 形式で送り続けるジェネレーター
+
+    snapshot(): 現在の状態（progress イベントとして送る辞書）。接続時と、イベントが届かない間は
+                snapshot_interval 秒ごとに確認し、変化があれば送る（別プロセスで動くジョブにも追従するため）
+    is_finished(state): Trueを返したら最後の状態を送って終了する
+    max_duration: この秒数で接続を閉じる（ブラウザは retry の間隔で再接続し、Last-Event-ID から再開する）。
+                  1接続が1スレッドを使うので、開いたままの画面がワーカーのスレッドを占有し続けないようにする
+    """
+    deadline = time.monotonic() + max_duration if max_duration else None
+    try:
+        yield 'retry: 3000\n\n'
+        last_state = None
+        idle = 0.0
+        silent = 0.0  # 最後に何か送ってからの秒数（keepalive 用）
+        while deadline is None or time.monotonic() < deadline:
+            if snapshot is not None and (last_state is None or idle >= snapshot_interval):
+                state = snapshot()
+                if state != last_state:
+                    last_state = state
+                    silent = 0.0
+                    yield format_sse('progress', state)
+                if is_finished is not None and is_finished(state):
+                    return
+                if idle >= snapshot_interval:
+                    idle = 0.0
+
+            wait = min(keepalive, snapshot_interval) if snapshot is not None else keepalive
+            if deadline is not None:
+                wait = max(0.0, min(wait, deadline - time.monotonic()))
+            event = subscription.get(wait)
+            if event is None:
+                idle += wait
+                silent += wait
+                if silent >= keepalive:
+                    silent = 0.0
+                    yield ': keepalive\n\n'
+                continue
+
+            silent = 0.0
+            event_id, event_type, data = event
+            yield format_sse(event_type, data, event_id)
+            if event_type == 'progress':
+                last_state = data
+                if is_finished is not None and is_finished(data):
+                    return
+    finally:
+        subscription.close()
@@ -1,243 +1,506 @@
-import csv
 import difflib
+import heapq
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import List, Dict, Tuple
 import os
 from dotenv import load_dotenv
+from search_index import NgramIndex, KEYWORD_MATCHER, keyword_features, keyword_score
+from llm_client import get_llm_client
+from pdf_text import get_pdf_text_store
+from rate_limit import RateLimiter
+from reference_index import ReferenceIndex, format_reference_context
+from window_catalogue import open_window_sampler
+from duplicate_log import create_duplicate_log
+from change_signal import create_change_signal
+from storage import create_storage
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
 
+# セマンティック類似度計算用のモデル名
+SEMANTIC_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+
+# プロセス内で共有するSentenceTransformerモデル（初回使用時にロード）
+_semantic_model = None
+_semantic_model_loaded = False
+_semantic_model_lock = threading.Lock()
+
+
+def get_semantic_model():
+    """セマンティック類似度計算用のモデルを取得
+
+    初回呼び出し時に1回だけロードし、以降はプロセス内の全FAQSystemで同じモデルを共有します。
+    ロードに失敗した場合はNoneを返します（文字列ベースの判定にフォールバック）。
+    """
+    global _semantic_model, _semantic_model_loaded
+    if _semantic_model_loaded:
+        return _semantic_model
+
+    with _semantic_model_lock:
+        if not _semantic_model_loaded:
+            start_time = time.time()
+            try:
+                from sentence_transformers import SentenceTransformer
+                print("[INFO] セマンティック重複除去モデルをロード中...")
+                _semantic_model = SentenceTransformer(SEMANTIC_MODEL_NAME)
+                print(f"[INFO] セマンティックモデルのロード完了（{time.time() - start_time:.1f}秒）")
+            except Exception as e:
+                print(f"[WARNING] セマンティックモデルのロード失敗: {e}")
+                print("[WARNING] 文字列ベースの重複判定にフォールバックします")
+                _semantic_model = None
+            _semantic_model_loaded = True
+    return _semantic_model
+
+
+def warm_up_semantic_model() -> threading.Thread:
+    """バックグラウンドスレッドでモデルを先にロードしておく（起動をブロックしない）"""
+    thread = threading.Thread(target=get_semantic_model, name='semantic-model-warmup')
+    thread.daemon = True
+    thread.start()
+    return thread
+
 
 class FAQSystem:
     def __init__(self, csv_file: str):
         self.faq_data = []
+        self._faq_by_id = {}  # FAQ ID → レコード（faq_data と同じ辞書を参照）
+        # faq_data / pending_qa は変更のたびに新しいリストに差し替える（読み取り側はロックなしでスナップショットを参照）。
+        # 変更・再読み込みは _write_lock で直列化する（_embeddings_lock と両方取る場合は _embeddings_lock が先）
         self.pending_qa = []
+        self._pending_by_id = {}  # 承認待ちQ&AのID → レコード（pending_qa と同じ辞書を参照）
+        self._write_lock = threading.RLock()
+        self._embeddings_lock = threading.RLock()  # 埋め込み行列の差分更新を直列化
         self.csv_file = csv_file
         self.pending_file = 'pending_qa.csv'
         self.claude_api_key = None  # web_app.pyから設定される
         self.generation_interrupted = False  # 生成中断フラグ
         self.progress_callback = None  # 進捗報告用コールバック
-        self.duplicate_faqs = []  # 重複判定されたFAQのリスト（デバッグ用）
+        self.extraction_progress_callback = None  # PDF抽出の進捗報告用コールバック（抽出済みページ数, 総ページ数）
+        self.duplicate_log = create_duplicate_log()  # 重複判定されたFAQの記録（直近分はメモリ、全件はファイル）
         self.last_error_message = None  # 最後のエラーメッセージ（タイムアウト用）
-
-        # セマンティック類似度計算用のSentenceTransformerモデル
-        try:
-            from sentence_transformers import SentenceTransformer
-            print("[INFO] セマンティック重複除去モデルをロード中...")
-            self.semantic_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-            print("[INFO] セマンティックモデルのロード完了")
-        except Exception as e:
-            print(f"[WARNING] セマンティックモデルのロード失敗: {e}")
-            print("[WARNING] 文字列ベースの重複判定にフォールバックします")
-            self.semantic_model = None
+        self.storage = create_storage(csv_file, self.pending_file)  # FAQ・承認待ちなどの永続化先
+        self.change_signal = create_change_signal()  # 他のプロセスへの変更通知（マルチプロセス運用時）
+        self.external_change_interval = float(os.getenv('EXTERNAL_CHANGE_CHECK_INTERVAL', '5'))  # 変更通知があっても、この秒数ごとにはストレージ自体も確認
+        self._signal_seen = {}  # 'faq' / 'pending' → 最後に確認した変更トークン
+        self._storage_checked_at = {}  # 'faq' / 'pending' → 最後にストレージを確認した時刻
+        self.faq_version = 0  # FAQコーパスのバージョン（再読み込み・変更のたびに増加）
+        self.search_candidate_limit = 200  # n-gramインデックスから再スコアリングする候補の上限
+        self.search_verify_exhaustive = False  # Trueの場合、全件走査の結果と比較してログ出力
+        self._search_index = None  # n-gramインデックス（初回検索時に構築し、以降はFAQの変更分だけ更新）
+        self._keyword_features = {}  # FAQ ID → (レコード, キーワード特徴量)
+        self.pending_version = 0  # 承認待ちQ&Aのバージョン（質問文が変わるたびに増加）
+        self._faq_embeddings = None  # FAQ質問文の埋め込み行列（EmbeddingStore）
+        self._faq_embeddings_stale = True  # Trueなら次回に全件と同期（起動・再読み込み時）
+        self._faq_embedding_changes = deque()  # 埋め込みに未反映のFAQ質問文の変更 (変更前, 変更後)
+        self._faq_question_refs = Counter()  # 埋め込み済みの質問文 → その質問文を持つFAQの件数
+        self._pending_embeddings = None  # 承認待ち質問文の埋め込み行列（EmbeddingStore）
+        self._pending_embeddings_version = None  # 埋め込みを同期済みの pending_version
+        self._query_embeddings = OrderedDict()  # 上記以外の文（ユーザー質問・生成候補）の埋め込み（LRU、_embeddings_lock で保護）
+        self.query_embedding_cache_size = 2048
+        self.semantic_search_top_k = 50  # セマンティック検索で返す最大件数
+        self.vector_search_threshold = 10000  # 既存質問がこの件数以上なら重複判定に近傍検索を使う
+        self.vector_search_neighbors = 32  # 重複判定で近傍検索から取り出す件数
+        self._semantic_model = None  # 個別に設定されたモデル（未設定なら共有モデルを使用）
+        self.generation_concurrency = int(os.getenv('GENERATION_CONCURRENCY', '4'))  # FAQ生成で並行させるAPI呼び出し数
+        self.generation_rate_limit = float(os.getenv('GENERATION_RATE_LIMIT', '2'))  # FAQ生成のAPI呼び出し上限（回/秒、0で無制限）
+        self.reference_index = ReferenceIndex(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reference_docs'))  # 参考資料のチャンク検索（初回検索時に構築）
+        self.reference_top_k = int(os.getenv('REFERENCE_TOP_K', '5'))  # 改善プロンプトに入れる参考資料チャンクの最大数
+        self.reference_budget_chars = int(os.getenv('REFERENCE_CONTEXT_CHARS', '3000'))  # 改善プロンプトに入れる参考資料の最大文字数
 
         self.load_faq_data(csv_file)
         self.load_pending_qa()
 
-    def load_faq_data(self, csv_file: str) -> None:
-        """CSVファイルからFAQデータを読み込む"""
-        # 既存データをクリア
-        self.faq_data.clear()
-        try:
-            with open(csv_file, 'r', encoding='utf-8-sig') as file:
-                csv_reader = csv.DictReader(file)
-                for row in csv_reader:
-                    self.faq_data.append({
-                        'question': row.get('question', '').strip(),
-                        'answer': row.get('answer', '').strip(),
-                        'keywords': row.get('keywords', '').strip(),
-                        'category': row.get('category', '一般').strip()
-                    })
-            print(f"FAQデータを{len(self.faq_data)}件読み込みました")
-        except FileNotFoundError:
-            print(f"エラー: {csv_file} が見つかりません")
-        except Exception as e:
-            print(f"エラー: {e}")
+    @property
+    def semantic_model(self):
+        """セマンティック類似度計算用のモデル（初回アクセス時に共有モデルをロード）"""
+        if self._semantic_model is not None:
+            return self._semantic_model
+        return get_semantic_model()
+
+    @semantic_model.setter
+    def semantic_model(self, model) -> None:
+        self._semantic_model = model
+
+    def load_faq_data(self, csv_file: str = None) -> None:
+        """ストレージからFAQデータを読み込む
+
+        読み込み中の検索が途中状態のリストを見ないように、新しいリストを作ってから
+        self.faq_data を差し替えます（検索側は常に不変のスナップショットを参照）。
+        """
+        with self._write_lock:
+            if csv_file is not None and csv_file != self.csv_file:
+                self.csv_file = csv_file
+                self.storage = create_storage(csv_file, self.pending_file)
+            faq_data = []
+            try:
+                faq_data = self.storage.load_faqs()
+                print(f"FAQデータを{len(faq_data)}件読み込みました")
+            except FileNotFoundError:
+                print(f"エラー: {self.csv_file} が見つかりません")
+            except Exception as e:
+                print(f"エラー: {e}")
+
+            self._set_faqs(faq_data)
+
+    def refresh_faq_data(self, force: bool = False) -> bool:
+        """FAQデータが外部で変更されている場合のみ再読み込み
+
+        CSVの場合はmtime/size（と内容ハッシュ）、SQLiteの場合は変更リビジョンで判定します。
+        変更通知がある場合、通知がなければ external_change_interval 秒ごとにしか確認しません
+        （force=True なら必ず確認。書き込みの前に他のプロセスの変更を取り込むときに使う）。
+        再読み込みした場合はTrueを返します。
+        """
+        if not force and not self._should_check_storage('faq'):
+            return False
+        with self._write_lock:
+            if not self.storage.faq_changed():
+                return False
+            print(f"[DEBUG] {self.storage.description} の変更を検出、FAQデータを再読み込みします")
+            self.load_faq_data()
+        return True
 
     def load_pending_qa(self) -> None:
         """承認待ちQ&Aデータを読み込む"""
-        self.pending_qa.clear()
+        with self._write_lock:
+            try:
+                pending_qa = self.storage.load_pending()
+                print(f"承認待ちQ&Aを{len(pending_qa)}件読み込みました")
+            except FileNotFoundError:
+                print("承認待ちQ&Aファイルが存在しません。新規作成します。")
+                self._set_pending([])
+                self.save_pending_qa()
+                return
+            except Exception as e:
+                print(f"承認待ちQ&A読み込みエラー: {e}")
+                return
+            self._set_pending(pending_qa)
+
+    def refresh_pending_qa(self, force: bool = False) -> bool:
+        """承認待ちQ&Aが外部で変更されている場合のみ再読み込み（再読み込みした場合はTrue、force は refresh_faq_data と同じ）"""
+        if not force and not self._should_check_storage('pending'):
+            return False
+        with self._write_lock:
+            if not self.storage.pending_changed():
+                return False
+            self.load_pending_qa()
+        return True
+
+    def _set_faqs(self, faq_data: List[Dict], changes: List[tuple] = None) -> None:
+        """FAQの一覧を新しいリストに差し替える（_write_lock を持って呼ぶ）
+
+        changes は (変更前, 変更後) の組のリスト（追加は変更前が None、削除は変更後が None）。
+        渡された場合は検索インデックス・キーワード特徴量・埋め込みを該当FAQの分だけ更新し、
+        None（読み込み・再読み込み）の場合は次に使うときに作り直します。
+        """
+        if changes is None:
+            self._search_index = None
+            self._keyword_features = {}
+            self._faq_embedding_changes.clear()
+            self._faq_embeddings_stale = True
+            faq_by_id = {faq['id']: faq for faq in faq_data}
+        else:
+            index = self._search_index
+            faq_by_id = dict(self._faq_by_id)
+            for old, new in changes:
+                if index is not None:
+                    if old is None:
+                        index.add(new)
+                    elif new is None:
+                        index.remove(old)
+                    else:
+                        index.update(old, new)
+                if new is None:
+                    self._keyword_features.pop(old['id'], None)
+                    del faq_by_id[old['id']]
+                else:
+                    self._keyword_features[new['id']] = (new, keyword_features(new['question'], new.get('keywords', '')))
+                    faq_by_id[new['id']] = new
+                old_question = old['question'] if old is not None else None
+                new_question = new['question'] if new is not None else None
+                if old_question != new_question:
+                    self._faq_embedding_changes.append((old_question, new_question))
+        # 派生データを先に更新してから一覧を差し替える（検索側は古い一覧に無いIDを無視する）
+        self._faq_by_id = faq_by_id
+        self.faq_data = faq_data
+        self.faq_version += 1
+
+    def _ensure_faq_ids(self, faqs: List[Dict]) -> None:
+        """保存に失敗してIDが振られなかったFAQに、メモリ上だけで使うIDを振る（次の再読み込みまで）"""
+        missing = [faq for faq in faqs if not faq.get('id')]
+        if missing:
+            next_id = max(self._faq_by_id, default=0) + 1
+            for faq in missing:
+                faq['id'] = next_id
+                next_id += 1
+
+    def get_faq(self, faq_id: int):
+        """IDからFAQを取得（存在しない場合はNone）"""
+        return self._faq_by_id.get(faq_id)
+
+    def _set_pending(self, pending_qa: List[Dict]) -> None:
+        """承認待ちQ&Aの一覧を新しいリストに差し替える（_write_lock を持って呼ぶ）"""
+        self._pending_by_id = {pending['id']: pending for pending in pending_qa}
+        self.pending_qa = pending_qa
+        self.pending_version += 1
+
+    def _replace_pending_item(self, item: Dict) -> None:
+        """承認待ちQ&Aの1件を、変更したコピーに差し替える（_write_lock を持って呼ぶ）"""
+        pending_qa = [item if pending['id'] == item['id'] else pending for pending in self.pending_qa]
+        pending_by_id = dict(self._pending_by_id)
+        pending_by_id[item['id']] = item
+        self._pending_by_id = pending_by_id
+        self.pending_qa = pending_qa
+
+    def _should_check_storage(self, kind: str) -> bool:
+        """ストレージの変更を確認すべきか（他のプロセスから変更通知があった・前回の確認から一定時間経った）"""
+        if self.change_signal is None:
+            return True
+        token = self.change_signal.token()
+        now = time.monotonic()
+        if token == self._signal_seen.get(kind) and now - self._storage_checked_at.get(kind, 0) < self.external_change_interval:
+            return False
+        self._signal_seen[kind] = token
+        self._storage_checked_at[kind] = now
+        return True
+
+    def _notify_change(self) -> None:
+        """ストレージに書き込んだことを他のプロセスに通知"""
+        if self.change_signal is None:
+            return
+        previous = self.change_signal.token()
+        token = self.change_signal.bump()
+        # 自分の書き込みは反映済み（他のプロセスの未確認の変更がある場合はそのまま確認させる）
+        for kind, seen in list(self._signal_seen.items()):
+            if seen == previous:
+                self._signal_seen[kind] = token
+
+    def preload(self) -> None:
+        """検索インデックス・埋め込み・参考資料インデックスを先に作る
+
+        本番サーバーでワーカーを fork する前に呼ぶと、これらのメモリはコピーオンライトで全ワーカーに共有されます。
+        """
+        start_time = time.time()
+        faq_data = self.faq_data
+        self._get_search_index()
+        for faq in faq_data:
+            self._get_keyword_features(faq)
         try:
-            with open(self.pending_file, 'r', encoding='utf-8-sig') as file:
-                csv_reader = csv.DictReader(file)
-                for row in csv_reader:
-                    self.pending_qa.append({
-                        'id': row.get('id', ''),
-                        'question': row.get('question', '').strip(),
-                        'answer': row.get('answer', '').strip(),
-                        'keywords': row.get('keywords', '').strip(),
-                        'category': row.get('category', '一般').strip(),
-                        'created_at': row.get('created_at', ''),
-                        'user_question': row.get('user_question', '').strip(),
-                        'confirmation_request': row.get('confirmation_request', '0').strip(),
-                        'comment': row.get('comment', '').strip()
-                    })
-            print(f"承認待ちQ&Aを{len(self.pending_qa)}件読み込みました")
-        except FileNotFoundError:
-            print("承認待ちQ&Aファイルが存在しません。新規作成します。")
-            self.save_pending_qa()
+            if self.semantic_model is not None:
+                self._get_faq_embeddings()
+                self._get_pending_embeddings()
         except Exception as e:
-            print(f"承認待ちQ&A読み込みエラー: {e}")
-
-    def save_pending_qa(self) -> None:
-        """承認待ちQ&Aをファイルに保存"""
+            print(f"[WARNING] 埋め込みの事前計算に失敗: {e}")
         try:
-            with open(self.pending_file, 'w', encoding='utf-8-sig', newline='') as file:
-                if self.pending_qa:
-                    fieldnames = ['id', 'question', 'answer', 'keywords', 'category', 'created_at', 'user_question', 'confirmation_request', 'comment']
-                    writer = csv.DictWriter(file, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(self.pending_qa)
-                else:
-                    # 空ファイルでもヘッダーは書く
-                    writer = csv.writer(file)
-                    writer.writerow(['id', 'question', 'answer', 'keywords', 'category', 'created_at', 'user_question', 'confirmation_request'])
+            self.reference_index.refresh()
         except Exception as e:
-            print(f"承認待ちQ&A保存エラー: {e}")
+            print(f"[WARNING] 参考資料インデックスの事前構築に失敗: {e}")
+        print(f"[INFO] 事前読み込み完了（FAQ {len(faq_data)}件, {time.time() - start_time:.1f}秒）")
 
-    def add_pending_qa(self, question: str, answer: str, keywords: str = '', category: str = '一般', user_question: str = '') -> str:
-        """承認待ちQ&Aを追加"""
-        import datetime
-        import uuid
+    def get_pending_qa(self, qa_id: str):
+        """IDから承認待ちQ&Aを取得（存在しない場合はNone）"""
+        return self._pending_by_id.get(qa_id)
 
-        qa_id = str(uuid.uuid4())[:8]
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def save_pending_qa(self) -> None:
+        """承認待ちQ&A全体をストレージに保存"""
+        with self._write_lock:
+            try:
+                self.storage.replace_pending(self.pending_qa)
+            except Exception as e:
+                print(f"承認待ちQ&A保存エラー: {e}")
+            self._notify_change()
 
-        self.pending_qa.append({
-            'id': qa_id,
+    def add_pending_qa(self, question: str, answer: str, keywords: str = '', category: str = '一般', user_question: str = '') -> str:
+        """承認待ちQ&Aを追加（質問・回答が空の場合はNone）"""
+        qa_ids = self.add_pending_qa_batch([{
             'question': question,
             'answer': answer,
             'keywords': keywords,
-            'category': category,
-            'created_at': timestamp,
-            'user_question': user_question,
-            'confirmation_request': '0'
-        })
+            'category': category
+        }], user_question=user_question)
+        return qa_ids[0] if qa_ids else None
+
+    def add_pending_qa_batch(self, items: List[Dict], category: str = '一般', user_question: str = '') -> List[str]:
+        """複数の承認待ちQ&Aをまとめて追加し、付与したIDのリストを返す
+
+        質問・回答が空の項目はスキップします。IDとタイムスタンプを付けたうえで、
+        ストレージへの書き込みは全件まとめて1回（CSVは1回の追記、SQLiteは1トランザクション）です。
+        category / user_question は各項目に指定がない場合の既定値です。
+        """
+        import datetime
+
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._write_lock:
+            used_ids = set(self._pending_by_id)
+            new_items = []
+            for item in items:
+                question = (item.get('question') or '').strip()
+                answer = (item.get('answer') or '').strip()
+                if not question or not answer:
+                    print(f"[WARNING] 質問または回答が空のためスキップしました: {question[:30]}")
+                    continue
+
+                qa_id = str(uuid.uuid4())[:8]
+                while qa_id in used_ids:
+                    qa_id = str(uuid.uuid4())[:8]
+                used_ids.add(qa_id)
+
+                new_items.append({
+                    'id': qa_id,
+                    'question': question,
+                    'answer': answer,
+                    'keywords': (item.get('keywords') or '').strip(),
+                    'category': (item.get('category') or category).strip(),
+                    'created_at': timestamp,
+                    'user_question': item.get('user_question') or user_question,
+                    'confirmation_request': '0',
+                    'comment': ''
+                })
+
+            if not new_items:
+                return []
 
-        self.save_pending_qa()
-        return qa_id
+            self._set_pending(self.pending_qa + new_items)
+            try:
+                self.storage.insert_pending(new_items)
+            except Exception as e:
+                print(f"承認待ちQ&A保存エラー: {e}")
+            self._notify_change()
+            return [item['id'] for item in new_items]
 
     def approve_pending_qa(self, qa_id: str) -> bool:
         """承認待ちQ&Aを承認してFAQに追加"""
-        for i, pending in enumerate(self.pending_qa):
-            if pending['id'] == qa_id:
-                # FAQに追加
-                self.add_faq(
-                    question=pending['question'],
-                    answer=pending['answer'],
-                    keywords=pending['keywords'],
-                    category=pending['category']
-                )
+        return bool(self.approve_pending_qa_batch([qa_id]))
 
-                # 承認待ちから削除
-                del self.pending_qa[i]
-                self.save_pending_qa()
-                self.save_faq_data()
+    def approve_pending_qa_batch(self, qa_ids: List[str]) -> List[str]:
+        """複数の承認待ちQ&Aをまとめて承認し、承認できたIDのリストを返す
 
+        FAQへの追加と承認待ちからの削除は、それぞれ1回の走査と1回の書き込み
+        （SQLiteでは全体で1トランザクション）で行います。
+        """
+        with self._write_lock:
+            approved = self._take_pending(qa_ids)
+            if not approved:
+                return []
+            # CSVでは下の save_faq_data で全件を書き出すので、他のワーカーのFAQの変更を先に取り込む
+            self.refresh_faq_data(force=True)
+
+            faqs = [{
+                'question': pending['question'].strip(),
+                'answer': pending['answer'].strip(),
+                'keywords': pending['keywords'].strip(),
+                'category': pending['category'].strip()
+            } for pending in approved]
+
+            # FAQのIDは書き込み時にストレージが振る
+            try:
+                self.storage.approve_pending([pending['id'] for pending in approved], faqs, self.pending_qa)
+            except Exception as e:
+                print(f"承認待ちQ&A保存エラー: {e}")
+            self._ensure_faq_ids(faqs)
+            # 検索中のスナップショットを壊さないよう、新しいリストに差し替える
+            self._set_faqs(self.faq_data + faqs, [(None, faq) for faq in faqs])
+            self.save_faq_data()
+
+            for pending in approved:
                 print(f"[承認] Q&A「{pending['question']}」を承認しました")
-                return True
-        return False
+            return [pending['id'] for pending in approved]
 
     def reject_pending_qa(self, qa_id: str) -> bool:
         """承認待ちQ&Aを却下"""
-        for i, pending in enumerate(self.pending_qa):
-            if pending['id'] == qa_id:
-                rejected_question = pending['question']
-                del self.pending_qa[i]
-                self.save_pending_qa()
-                print(f"[却下] Q&A「{rejected_question}」を却下しました")
-                return True
-        return False
+        return bool(self.reject_pending_qa_batch([qa_id]))
+
+    def reject_pending_qa_batch(self, qa_ids: List[str]) -> List[str]:
+        """複数の承認待ちQ&Aをまとめて却下し、却下できたIDのリストを返す"""
+        with self._write_lock:
+            rejected = self._take_pending(qa_ids)
+            if not rejected:
+                return []
+            self._write_pending(self.storage.delete_pending, [pending['id'] for pending in rejected], self.pending_qa)
+        for pending in rejected:
+            print(f"[却下] Q&A「{pending['question']}」を却下しました")
+        return [pending['id'] for pending in rejected]
+
+    def _take_pending(self, qa_ids: List[str]) -> List[Dict]:
+        """IDに対応する承認待ちQ&Aを一覧から取り除いて返す（存在しないIDは無視、_write_lock を持って呼ぶ）
+
+        別のワーカーが追加・変更したQ&Aも対象にできるよう、先にストレージの変更を取り込みます。
+        """
+        self.refresh_pending_qa(force=True)
+        taken = []
+        for qa_id in dict.fromkeys(qa_ids):
+            pending = self._pending_by_id.get(qa_id)
+            if pending is not None:
+                taken.append(pending)
+        if taken:
+            taken_ids = {pending['id'] for pending in taken}
+            self._set_pending([pending for pending in self.pending_qa if pending['id'] not in taken_ids])
+        return taken
 
     def edit_pending_qa(self, qa_id: str, question: str = None, answer: str = None, keywords: str = None, category: str = None) -> bool:
-        """承認待ちQ&Aを編集"""
-        for pending in self.pending_qa:
-            if pending['id'] == qa_id:
-                if question:
-                    pending['question'] = question
-                if answer:
-                    pending['answer'] = answer
-                if keywords is not None:
-                    pending['keywords'] = keywords
-                if category:
-                    pending['category'] = category
+        """承認待ちQ&Aを編集（他のワーカーの変更を取り込んでから、その最新の内容に対して編集）"""
+        with self._write_lock:
+            self.refresh_pending_qa(force=True)
+            current = self._pending_by_id.get(qa_id)
+            if current is None:
+                return False
+            pending = dict(current)
+            if question:
+                pending['question'] = question
+            if answer:
+                pending['answer'] = answer
+            if keywords is not None:
+                pending['keywords'] = keywords
+            if category:
+                pending['category'] = category
+            self._replace_pending_item(pending)
+            if question:
+                self.pending_version += 1
 
-                self.save_pending_qa()
-                print(f"[編集] 承認待ちQ&A「{qa_id}」を編集しました")
-                return True
-        return False
+            self._write_pending(self.storage.update_pending, pending, self.pending_qa)
+        print(f"[編集] 承認待ちQ&A「{qa_id}」を編集しました")
+        return True
 
-    def toggle_confirmation_request(self, qa_id: str) -> bool:
-        """承認待ちQ&Aの確認依頼フラグを切り替え"""
-        for pending in self.pending_qa:
-            if pending['id'] == qa_id:
-                # 確認依頼フラグを切り替え（0/1のトグル）
-                current_value = pending.get('confirmation_request', '0')
-                pending['confirmation_request'] = '0' if current_value == '1' else '1'
+    def _write_pending(self, write, *args) -> None:
+        """承認待ちQ&Aの変更をストレージに反映"""
+        try:
+            write(*args)
+        except Exception as e:
+            print(f"承認待ちQ&A保存エラー: {e}")
+        self._notify_change()
 
-                self.save_pending_qa()
-                status = '依頼中' if pending['confirmation_request'] == '1' else '解除'
-                print(f"[確認依頼] 承認待ちFAQ「{qa_id}」の確認依頼を{status}にしました")
-                return True
-        return False
+    def toggle_confirmation_request(self, qa_id: str) -> bool:
+        """承認待ちQ&Aの確認依頼フラグを切り替え（他のワーカーの変更を取り込んでから切り替える）"""
+        with self._write_lock:
+            self.refresh_pending_qa(force=True)
+            current = self._pending_by_id.get(qa_id)
+            if current is None:
+                return False
+            # 確認依頼フラグを切り替え（0/1のトグル）
+            current_value = current.get('confirmation_request', '0')
+            pending = dict(current, confirmation_request='0' if current_value == '1' else '1')
+            self._replace_pending_item(pending)
+
+            self._write_pending(self.storage.update_pending, pending, self.pending_qa)
+        status = '依頼中' if pending['confirmation_request'] == '1' else '解除'
+        print(f"[確認依頼] 承認待ちFAQ「{qa_id}」の確認依頼を{status}にしました")
+        return True
 
     def get_keyword_score(self, user_question: str, faq_question: str, faq_keywords: str = '') -> float:
         """キーワードベースのスコアを計算"""
-        # 料金関連キーワード
-        money_keywords = ['料金', '費用', 'お金', '金額', '価格', '値段', 'コスト', '費用']
-        # 時間関連キーワード
-        time_keywords = ['時間', '期間', '日数', 'いつ', '何日', '何週間', '何か月']
-        # 面接関連キーワード
-        interview_keywords = ['面接', '面談', 'インタビュー']
-        # 書類関連キーワード
-        document_keywords = ['書類', '必要', '資料', 'ドキュメント', '準備']
-        # サービス関連キーワード
-        service_keywords = ['サービス', '範囲', 'サポート', 'どこまで']
-
         user_lower = user_question.lower()
-        faq_lower = faq_question.lower()
-        faq_keywords_lower = faq_keywords.lower()
-
-        # キーワードマッチのボーナススコア
-        score = 0.0
-
-        # CSVのキーワードフィールドを活用
-        if faq_keywords:
-            # セミコロン区切りのキーワードを分割
-            csv_keywords = [kw.strip().lower() for kw in faq_keywords.split(';')]
-            for keyword in csv_keywords:
-                if keyword and keyword in user_lower:
-                    score += 0.8  # CSVのキーワード完全マッチに高いスコア
-
-        # 既存のキーワードマッチング（従来のロジック）
-        # 料金関連
-        if any(keyword in user_lower for keyword in money_keywords):
-            if any(keyword in faq_lower for keyword in money_keywords) or any(keyword in faq_keywords_lower for keyword in money_keywords):
-                score += 0.3
-            elif any(keyword in faq_lower for keyword in time_keywords):
-                score -= 0.2
-
-        # 時間関連
-        if any(keyword in user_lower for keyword in time_keywords):
-            if any(keyword in faq_lower for keyword in time_keywords) or any(keyword in faq_keywords_lower for keyword in time_keywords):
-                score += 0.3
-            elif any(keyword in faq_lower for keyword in money_keywords):
-                score -= 0.2
-
-        # その他のキーワードマッチ
-        if any(keyword in user_lower for keyword in interview_keywords):
-            if any(keyword in faq_lower for keyword in interview_keywords) or any(keyword in faq_keywords_lower for keyword in interview_keywords):
-                score += 0.3
-
-        if any(keyword in user_lower for keyword in document_keywords):
-            if any(keyword in faq_lower for keyword in document_keywords) or any(keyword in faq_keywords_lower for keyword in document_keywords):
-                score += 0.2
-
-        if any(keyword in user_lower for keyword in service_keywords):
-            if any(keyword in faq_lower for keyword in service_keywords) or any(keyword in faq_keywords_lower for keyword in service_keywords):
-                score += 0.2
-
-        return score
+        return keyword_score(user_lower, KEYWORD_MATCHER.match(user_lower), keyword_features(faq_question, faq_keywords))
+
+    def _get_keyword_features(self, faq: Dict) -> tuple:
+        """FAQのキーワード特徴量を取得（追加・編集されたFAQの分だけ計算）"""
+        entry = self._keyword_features.get(faq['id'])
+        if entry is None or entry[0] is not faq:
+            entry = (faq, keyword_features(faq['question'], faq.get('keywords', '')))
+            self._keyword_features[faq['id']] = entry
+        return entry[1]
 
     def calculate_similarity(self, question1: str, question2: str) -> float:
         """2つの質問の類似度を計算（0.0〜1.0）"""
@@ -247,11 +510,114 @@ class FAQSystem:
             question2.lower()
         ).ratio()
 
+    def _encode(self, texts: List[str]):
+        """文のリストを正規化済みfloat32行列に変換"""
+        from embedding_store import normalize_rows
+        return normalize_rows(self.semantic_model.encode(list(texts)))
+
+    def _get_faq_embeddings(self):
+        """FAQ質問文の埋め込み行列を取得
+
+        読み込み直後は全件と突き合わせ、以降はFAQの追加・編集・削除で変わった質問文だけを
+        反映して保存します。承認されたQ&Aは承認待ち側のベクトルを再利用します。
+        """
+        from embedding_store import EmbeddingStore
+
+        with self._embeddings_lock:
+            store = self._faq_embeddings
+            if store is None:
+                store = self._faq_embeddings = EmbeddingStore(EmbeddingStore.path_for(self.csv_file), SEMANTIC_MODEL_NAME)
+            refs = self._faq_question_refs
+            if self._faq_embeddings_stale:
+                # 一覧と未反映の変更を同時に取る（この一覧には変更がすべて含まれている）
+                with self._write_lock:
+                    questions = [faq['question'] for faq in self.faq_data]
+                    self._faq_embedding_changes.clear()
+                    self._faq_embeddings_stale = False
+                refs = self._faq_question_refs = Counter(questions)
+                changed = store.sync(questions, self._encode, sources=(self._pending_embeddings,))
+            else:
+                removed, added = [], []
+                while self._faq_embedding_changes:
+                    old_question, new_question = self._faq_embedding_changes.popleft()
+                    if old_question is not None:
+                        refs[old_question] -= 1
+                        if refs[old_question] <= 0:
+                            del refs[old_question]
+                            removed.append(old_question)
+                    if new_question is not None:
+                        refs[new_question] += 1
+                        if refs[new_question] == 1:
+                            added.append(new_question)
+                added = [question for question in added if question in refs]
+                removed = [question for question in removed if question not in refs]
+                changed = store.update(removed, added, self._encode, sources=(self._pending_embeddings,))
+            if changed:
+                store.save()
+            return store
+
+    def _get_pending_embeddings(self):
+        """承認待ち質問文の埋め込み行列を取得（変更時は差分のみ更新して保存）"""
+        from embedding_store import EmbeddingStore
+
+        with self._embeddings_lock:
+            pending_version, pending_qa = self.pending_version, self.pending_qa
+            if self._pending_embeddings is None:
+                self._pending_embeddings = EmbeddingStore(EmbeddingStore.path_for(self.pending_file), SEMANTIC_MODEL_NAME)
+            if self._pending_embeddings_version != pending_version:
+                if self._pending_embeddings.sync((item['question'] for item in pending_qa), self._encode,
+                                                 sources=(self._faq_embeddings,)):
+                    self._pending_embeddings.save()
+                self._pending_embeddings_version = pending_version
+            return self._pending_embeddings
+
+    def get_embeddings(self, texts: List[str]):
+        """文のリストの埋め込み（正規化済み）を取得
+
+        FAQ・承認待ちの質問文は保存済みの行列から取り出し、それ以外だけをまとめて計算します。
+        ストアは差分更新で行が入れ替わるため、行の取り出しは _embeddings_lock の中で行います
+        （計算はロックの外）。
+        """
+        import numpy as np
+
+        with self._embeddings_lock:
+            stores = (self._get_faq_embeddings(), self._get_pending_embeddings())
+            missing = [text for text in dict.fromkeys(texts)
+                       if text not in self._query_embeddings and not any(text in store for store in stores)]
+        computed = dict(zip(missing, self._encode(missing))) if missing else {}
+
+        rows = []
+        with self._embeddings_lock:
+            cache = self._query_embeddings
+            for text, vector in computed.items():
+                cache[text] = vector
+                cache.move_to_end(text)
+            stores = (self._get_faq_embeddings(), self._get_pending_embeddings())
+            for text in texts:
+                vector = computed.get(text)
+                if vector is None:
+                    vector = cache.get(text)
+                    if vector is not None:
+                        cache.move_to_end(text)
+                if vector is None:
+                    store = next((store for store in stores if text in store), None)
+                    if store is None:
+                        # 取り出す前にFAQから消えた質問文
+                        vector = self._encode([text])[0]
+                        cache[text] = vector
+                    else:
+                        vector = store.vectors([text])[0]
+                rows.append(vector)
+            while len(cache) > self.query_embedding_cache_size:
+                cache.popitem(last=False)
+        return np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
     def calculate_semantic_similarity(self, question1: str, question2: str) -> float:
         """セマンティック類似度を計算（0.0〜1.0）
 
         埋め込みベクトル（embeddings）を使用して意味的な類似度を計算します。
         文字列が異なっていても、意味が同じであれば高い類似度を返します。
+        既存の質問文の埋め込みは保存済みの行列から取り出すため、再計算しません。
 
         例：
         - "ビザの有効期限と滞在期限の違いは何ですか？" vs "ビザの有効期限と滞在期限の違いは何？"
@@ -263,21 +629,100 @@ class FAQSystem:
             return self.calculate_similarity(question1, question2)
 
         try:
-            # 埋め込みベクトルを計算
-            embeddings = self.semantic_model.encode([question1, question2])
-
-            # コサイン類似度を計算
-            from sklearn.metrics.pairwise import cosine_similarity
-            import numpy as np
-
-            similarity = cosine_similarity([embeddings[0]], [embeddings[1]])[0][0]
-
-            return float(similarity)
+            # 正規化済みベクトルの内積 = コサイン類似度
+            embeddings = self.get_embeddings([question1, question2])
+            return float(embeddings[0] @ embeddings[1])
         except Exception as e:
             print(f"[WARNING] セマンティック類似度計算エラー: {e}")
             print("[WARNING] 文字列ベース類似度にフォールバック")
             return self.calculate_similarity(question1, question2)
 
+    def _duplicate_similarities(self, candidate_questions: List[str], existing_questions: List[str]) -> tuple:
+        """生成候補 × 既存質問、生成候補 × 生成候補 の類似度行列を一括計算
+
+        セマンティックモデルがある場合は、候補をまとめて1回encodeし、行列積で計算します。
+        """
+        import numpy as np
+
+        if self.semantic_model is not None:
+            try:
+                if len(existing_questions) >= self.vector_search_threshold:
+                    return self._duplicate_similarities_ann(candidate_questions, existing_questions)
+                candidate_vectors = self.get_embeddings(candidate_questions)
+                if existing_questions:
+                    existing_similarities = candidate_vectors @ self.get_embeddings(existing_questions).T
+                else:
+                    existing_similarities = np.zeros((len(candidate_questions), 0), dtype=np.float32)
+                return existing_similarities, candidate_vectors @ candidate_vectors.T
+            except Exception as e:
+                print(f"[WARNING] セマンティック類似度計算エラー: {e}")
+                print("[WARNING] 文字列ベース類似度にフォールバック")
+
+        existing_similarities = np.array(
+            [[self.calculate_similarity(c, e) for e in existing_questions] for c in candidate_questions],
+            dtype=np.float32
+        ).reshape(len(candidate_questions), len(existing_questions))
+        candidate_similarities = np.array(
+            [[self.calculate_similarity(a, b) for b in candidate_questions] for a in candidate_questions],
+            dtype=np.float32
+        ).reshape(len(candidate_questions), len(candidate_questions))
+        return existing_similarities, candidate_similarities
+
+    def _duplicate_similarities_ann(self, candidate_questions: List[str], existing_questions: List[str]) -> tuple:
+        """_duplicate_similarities の近傍検索版（既存質問が大量にある場合）
+
+        FAQ・承認待ちの質問は近傍検索インデックスから上位 vector_search_neighbors 件だけ類似度を取り、
+        それ以外（近傍に入らなかった質問）は類似度 -1 として扱います。
+        今回の生成中に追加された質問（インデックス外）は埋め込みキャッシュから直接計算します。
+        """
+        import numpy as np
+
+        candidate_vectors = self.get_embeddings(candidate_questions)
+
+        position = {}
+        for index, question in enumerate(existing_questions):
+            position.setdefault(question, index)
+
+        existing_similarities = np.full((len(candidate_questions), len(existing_questions)), -1.0, dtype=np.float32)
+        # 近傍検索インデックスは差分更新で書き換わるので、検索中は更新させない
+        with self._embeddings_lock:
+            stores = (self._get_faq_embeddings(), self._get_pending_embeddings())
+            for store in stores:
+                for row, vector in enumerate(candidate_vectors):
+                    for question, similarity in store.search(vector, self.vector_search_neighbors):
+                        index = position.get(question)
+                        if index is not None:
+                            existing_similarities[row, index] = similarity
+
+            others = [index for index, question in enumerate(existing_questions)
+                      if not any(question in store for store in stores)]
+        if others:
+            other_vectors = self.get_embeddings([existing_questions[index] for index in others])
+            existing_similarities[:, others] = candidate_vectors @ other_vectors.T
+
+        return existing_similarities, candidate_vectors @ candidate_vectors.T
+
+    def _find_first_duplicate(self, question: str, similarities, questions: List[str]):
+        """類似度の配列から、先頭から順に見て最初に重複とみなされる質問を探す
+
+        判定基準：類似度 >= 0.95 なら重複、0.80以上なら重要キーワードが一致した場合のみ重複。
+        戻り値は (questions内の位置, 類似度, キーワード一致で判定したか) または None。
+        """
+        import numpy as np
+
+        keywords_new = None
+        for index in np.nonzero(similarities >= 0.80)[0]:
+            similarity = float(similarities[index])
+            if similarity >= 0.95:
+                return int(index), similarity, False
+            # 文字列は似ているが、重要キーワードをチェック
+            if keywords_new is None:
+                keywords_new = self._extract_important_keywords(question)
+            if keywords_new == self._extract_important_keywords(questions[index]):
+                return int(index), similarity, True
+            print(f"[DEBUG] 類似度{similarity:.2f}だがキーワード異なる: {question[:40]}...")
+        return None
+
     def _extract_important_keywords(self, question: str) -> set:
         """質問から重要なキーワードを抽出"""
         # ビザ種類
@@ -300,46 +745,167 @@ class FAQSystem:
 
         return found_keywords
 
-    def search_faq(self, user_question: str, threshold: float = 0.3) -> List[Dict]:
-        """ユーザーの質問に対して最適なFAQを検索"""
+    def _get_search_index(self) -> NgramIndex:
+        """n-gramインデックスを取得（読み込み後の初回だけ構築し、以降は _set_faqs で変更分を反映）"""
+        index = self._search_index
+        if index is None:
+            # 構築中の変更を取りこぼさないよう、書き込みと直列化して構築する
+            with self._write_lock:
+                index = self._search_index
+                if index is None:
+                    index = self._search_index = NgramIndex(self.faq_data)
+                    print(f"[DEBUG] n-gramインデックスを構築しました（{len(index)}件, バージョン {self.faq_version}）")
+        return index
+
+    def search_faq(self, user_question: str, threshold: float = 0.3, exhaustive: bool = False, mode: str = 'string',
+                   top_k: int = None) -> List[Dict]:
+        """ユーザーの質問に対して最適なFAQを検索
+
+        FAQ件数が search_candidate_limit を超える場合は、n-gramインデックスで絞り込んだ
+        候補だけをスコアリングします。exhaustive=True で従来どおり全件を走査します。
+        候補の絞り込みは推定スコアによるため、上位がほぼ同点のFAQが候補数より多い場合は
+        全件走査と1位が入れ替わることがあります（search_verify_exhaustive で比較をログ出力できます）。
+        mode='semantic' の場合は埋め込み行列とのコサイン類似度で検索します。
+        top_k を指定すると上位 top_k 件だけを返します（全件をソートした結果の先頭 top_k 件と同じ）。
+        """
         if not user_question.strip():
             return []
 
-        results = []
+        if top_k is not None and top_k <= 0:
+            return []
 
-        for faq in self.faq_data:
-            # 文字列の類似度を計算
-            string_similarity = difflib.SequenceMatcher(
-                None,
-                user_question.lower(),
-                faq['question'].lower()
-            ).ratio()
+        if mode == 'semantic':
+            if self.semantic_model is not None:
+                return self._semantic_search(user_question, threshold, top_k)
+            print("[DEBUG] セマンティックモデル未使用、文字列ベース検索にフォールバック")
+
+        # 検索中に差し替えられても影響を受けないようにスナップショットを参照
+        faq_data = self.faq_data
+
+        candidates = faq_data
+        if not exhaustive and len(faq_data) > self.search_candidate_limit:
+            index = self._get_search_index()
+            # n-gramより短い質問（1文字など）や、候補が1件も無い質問は全件を走査する
+            if len(user_question.strip()) >= min(index.sizes):
+                faq_by_id = self._faq_by_id
+                candidate_ids = index.candidates(user_question, self.search_candidate_limit)
+                indexed = [faq_by_id[faq_id] for faq_id in candidate_ids if faq_id in faq_by_id]
+                if indexed:
+                    candidates = indexed
+
+        # ユーザー質問側のキーワードカテゴリは1回だけ判定
+        user_lower = user_question.lower()
+        user_hits = KEYWORD_MATCHER.match(user_lower)
+
+        # (総合スコア, -候補内の位置, FAQ, 文字列類似度, キーワードスコア)。
+        # 同点は候補の先頭に近いものを上位にする（全件を安定ソートした場合と同じ順位）
+        scored = []
+        user_length = len(user_lower)
+        for position, faq in enumerate(candidates):
+            # キーワードスコアを計算（FAQ側の特徴量は計算済みなので文字列類似度より安い）
+            faq_keyword_score = keyword_score(user_lower, user_hits, self._get_keyword_features(faq))
+
+            # 結果に入るための下限: 閾値、top_k 件そろっていればその最下位のスコア（同点は先の候補が上位なので不可）
+            full = top_k is not None and len(scored) >= top_k
+            floor = scored[0][0] if full else threshold
+
+            # 文字列類似度の上限（長さだけで求まる real_quick_ratio → 文字の出現数による quick_ratio）で
+            # 下限に届かない候補は、高価な ratio() を計算せずに除外する
+            faq_lower = faq['question'].lower()
+            length = user_length + len(faq_lower)
+            upper = 2.0 * min(user_length, len(faq_lower)) / length if length else 1.0
+            if self._below_floor(upper + faq_keyword_score, floor, full):
+                continue
+            matcher = difflib.SequenceMatcher(None, user_lower, faq_lower)
+            if self._below_floor(matcher.quick_ratio() + faq_keyword_score, floor, full):
+                continue
 
-            # キーワードスコアを計算
-            keyword_score = self.get_keyword_score(user_question, faq['question'], faq['keywords'])
+            # 文字列の類似度を計算
+            string_similarity = matcher.ratio()
 
             # 総合スコアを計算（文字列類似度 + キーワードスコア）
-            total_score = string_similarity + keyword_score
+            total_score = string_similarity + faq_keyword_score
 
             # 閾値以上のスコアがあれば結果に追加
-            if total_score >= threshold:
+            if total_score < threshold:
+                continue
+            entry = (total_score, -position, faq, string_similarity, faq_keyword_score)
+            if top_k is None:
+                scored.append(entry)
+            elif not full:
+                heapq.heappush(scored, entry)  # 最下位（スコアが低く、候補の後ろにあるもの）が先頭のヒープ
+            elif total_score > scored[0][0]:
+                heapq.heapreplace(scored, entry)
+
+        # 総合スコアの高い順にソート（-位置は候補ごとに異なるので、FAQ同士は比較されない）
+        scored.sort(key=lambda entry: entry[:2], reverse=True)
+        results = [{
+            'id': faq['id'],
+            'question': faq['question'],
+            'answer': faq['answer'],
+            'category': faq['category'],
+            'similarity': total_score,
+            'string_similarity': string_similarity,
+            'keyword_score': faq_keyword_score
+        } for total_score, _, faq, string_similarity, faq_keyword_score in scored]
+
+        if self.search_verify_exhaustive and not exhaustive and len(faq_data) > self.search_candidate_limit:
+            self._compare_with_exhaustive(user_question, threshold, results, top_k)
+
+        return results
+
+    @staticmethod
+    def _below_floor(upper: float, floor: float, full: bool) -> bool:
+        """スコアの上限 upper では結果に入れないか（top_k 件そろっている場合は最下位と同点でも入れない）"""
+        return upper <= floor if full else upper < floor
+
+    def _compare_with_exhaustive(self, user_question: str, threshold: float, results: List[Dict], top_k: int = None) -> None:
+        """インデックス検索の結果を全件走査の結果と比較してログ出力（検証用）"""
+        expected = self.search_faq(user_question, threshold, exhaustive=True, top_k=top_k)
+        top_actual = results[0]['question'] if results else None
+        top_expected = expected[0]['question'] if expected else None
+        expected_top10 = {r['question'] for r in expected[:10]}
+        overlap = len(expected_top10 & {r['question'] for r in results[:10]})
+        if top_actual != top_expected:
+            print(f"[DEBUG] 検索結果不一致: 索引={top_actual}, 全件={top_expected}")
+        print(f"[DEBUG] 検索結果比較: 上位10件一致 {overlap}/{len(expected_top10)}")
+
+    def _semantic_search(self, user_question: str, threshold: float, top_k: int = None) -> List[Dict]:
+        """埋め込みの近傍検索インデックスで類似度の高いFAQを検索（最大 semantic_search_top_k 件）"""
+        limit = min(top_k, self.semantic_search_top_k) if top_k is not None else self.semantic_search_top_k
+        faq_data = self.faq_data
+        if not faq_data:
+            return []
+        vector = self.get_embeddings([user_question])[0]
+
+        # 質問文 → スナップショット内のFAQ（同じ質問文のFAQは同じベクトルを共有）
+        rows_by_question = {}
+        for row, faq in enumerate(faq_data):
+            rows_by_question.setdefault(faq['question'], []).append(row)
+
+        # 近傍検索インデックスは差分更新で書き換わるので、検索中は更新させない
+        with self._embeddings_lock:
+            hits = self._get_faq_embeddings().search(vector, limit)
+
+        results = []
+        for question, similarity in hits:
+            if similarity < threshold:
+                break
+            for row in rows_by_question.get(question, []):
+                faq = faq_data[row]
                 results.append({
+                    'id': faq['id'],
                     'question': faq['question'],
                     'answer': faq['answer'],
                     'category': faq['category'],
-                    'similarity': total_score,
-                    'string_similarity': string_similarity,
-                    'keyword_score': keyword_score
+                    'similarity': similarity,
+                    'semantic_similarity': similarity
                 })
+        return results[:limit]
 
-        # 総合スコアの高い順にソート
-        results.sort(key=lambda x: x['similarity'], reverse=True)
-
-        return results
-
-    def get_best_answer(self, user_question: str) -> tuple:
+    def get_best_answer(self, user_question: str, mode: str = 'string') -> tuple:
         """最も適切な回答を取得"""
-        results = self.search_faq(user_question)
+        results = self.search_faq(user_question, mode=mode, top_k=1)
 
         if not results:
             return ("申し訳ございませんが、該当する質問が見つかりませんでした。より具体的に質問していただくか、お電話でお問い合わせください。", False)
@@ -357,49 +923,73 @@ class FAQSystem:
         return match['answer']
 
     def save_faq_data(self) -> None:
-        """FAQデータをCSVファイルに保存"""
+        """FAQデータの未保存の変更を書き出す（SQLiteは変更時点で書き込み済み）"""
+        with self._write_lock:
+            try:
+                self.storage.flush_faqs(self.faq_data)
+                print("FAQデータを保存しました。")
+            except Exception as e:
+                print(f"保存エラー: {e}")
+            self._notify_change()
+
+    def _write_faq(self, write, faq) -> None:
+        """FAQの変更（1件またはリスト）をストレージに反映"""
         try:
-            with open('faq_data-1.csv', 'w', encoding='utf-8-sig', newline='') as file:
-                writer = csv.DictWriter(file, fieldnames=['question', 'answer', 'keywords', 'category'])
-                writer.writeheader()
-                for faq in self.faq_data:
-                    writer.writerow({
-                        'question': faq['question'],
-                        'answer': faq['answer'],
-                        'keywords': faq.get('keywords', ''),
-                        'category': faq.get('category', '一般')
-                    })
-            print("FAQデータを保存しました。")
+            write(faq)
         except Exception as e:
             print(f"保存エラー: {e}")
+        self._notify_change()
 
-    def add_faq(self, question: str, answer: str, keywords: str = '', category: str = '一般') -> None:
-        """新しいFAQを追加"""
-        self.faq_data.append({
+    def add_faq(self, question: str, answer: str, keywords: str = '', category: str = '一般') -> int:
+        """新しいFAQを追加し、振られたIDを返す"""
+        faq = {
             'question': question.strip(),
             'answer': answer.strip(),
             'keywords': keywords.strip(),
             'category': category.strip()
-        })
-
-    def edit_faq(self, index: int, question: str = None, answer: str = None, category: str = None) -> bool:
-        """FAQを編集"""
-        if 0 <= index < len(self.faq_data):
+        }
+        with self._write_lock:
+            self.refresh_faq_data(force=True)  # CSVは次の保存で全件を書き出すため、他のワーカーの変更を先に取り込む
+            self._write_faq(self.storage.insert_faq, faq)
+            self._ensure_faq_ids([faq])
+            # 検索中のスナップショットを壊さないよう、新しいリストに差し替える
+            self._set_faqs(self.faq_data + [faq], [(None, faq)])
+            return faq['id']
+
+    def edit_faq(self, faq_id: int, question: str = None, answer: str = None, category: str = None) -> bool:
+        """FAQを編集（他のワーカーの変更を取り込んでから、その最新の内容に対して編集）"""
+        with self._write_lock:
+            self.refresh_faq_data(force=True)
+            current = self._faq_by_id.get(faq_id)
+            if current is None:
+                return False
+            faq = dict(current)
             if question:
-                self.faq_data[index]['question'] = question.strip()
+                faq['question'] = question.strip()
             if answer:
-                self.faq_data[index]['answer'] = answer.strip()
+                faq['answer'] = answer.strip()
             if category is not None:
-                self.faq_data[index]['category'] = category.strip() if category.strip() else '一般'
+                faq['category'] = category.strip() if category.strip() else '一般'
+            self._set_faqs([faq if item is current else item for item in self.faq_data], [(current, faq)])
+            self._write_faq(self.storage.update_faq, faq)
             return True
-        return False
 
-    def delete_faq(self, index: int) -> bool:
+    def delete_faq(self, faq_id: int) -> bool:
         """FAQを削除"""
-        if 0 <= index < len(self.faq_data):
-            self.faq_data.pop(index)
-            return True
-        return False
+        return bool(self.delete_faqs([faq_id]))
+
+    def delete_faqs(self, faq_ids: List[int]) -> List[int]:
+        """複数のFAQをまとめて削除し、削除できたIDのリストを返す（存在しないIDは無視）"""
+        with self._write_lock:
+            self.refresh_faq_data(force=True)
+            deleted = [self._faq_by_id[faq_id] for faq_id in dict.fromkeys(faq_ids) if faq_id in self._faq_by_id]
+            if not deleted:
+                return []
+            deleted_ids = {faq['id'] for faq in deleted}
+            self._set_faqs([faq for faq in self.faq_data if faq['id'] not in deleted_ids],
+                           [(faq, None) for faq in deleted])
+            self._write_faq(self.storage.delete_faqs, deleted)
+            return [faq['id'] for faq in deleted]
 
     def show_all_faqs(self) -> None:
         """すべてのFAQを表示"""
@@ -410,51 +1000,28 @@ class FAQSystem:
         print(f"\n合計: {len(self.faq_data)}件")
 
     def save_unsatisfied_qa(self, user_question: str, matched_question: str, matched_answer: str, timestamp: str = None) -> None:
-        """不満足なQ&Aを別ファイルに保存"""
+        """不満足なQ&Aを記録"""
         import datetime
-        import os
 
         if not timestamp:
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        # 現在のスクリプトと同じディレクトリに保存
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        csv_path = os.path.join(current_dir, 'unsatisfied_qa.csv')
-
         try:
-            # ファイルが存在するかチェック
-            file_exists = os.path.exists(csv_path)
-
-            with open(csv_path, 'a', encoding='utf-8-sig', newline='') as file:
-                writer = csv.DictWriter(file, fieldnames=['timestamp', 'user_question', 'matched_question', 'matched_answer'])
-
-                if not file_exists:
-                    writer.writeheader()
-
-                writer.writerow({
-                    'timestamp': timestamp,
-                    'user_question': user_question,
-                    'matched_question': matched_question,
-                    'matched_answer': matched_answer
-                })
-
+            self.storage.append_unsatisfied({
+                'timestamp': timestamp,
+                'user_question': user_question,
+                'matched_question': matched_question,
+                'matched_answer': matched_answer
+            })
             print("不満足なQ&Aを記録しました。")
         except Exception as e:
             print(f"記録エラー: {e}")
 
     def _load_generation_history(self) -> list:
         """FAQ生成履歴を読み込む"""
-        history_file = 'faq_generation_history.csv'
         history = []
         try:
-            with open(history_file, 'r', encoding='utf-8-sig') as file:
-                csv_reader = csv.DictReader(file)
-                for row in csv_reader:
-                    history.append({
-                        'question': row.get('question', '').strip(),
-                        'answer': row.get('answer', '').strip(),
-                        'timestamp': row.get('timestamp', '').strip()
-                    })
+            history = self.storage.load_history()
             print(f"[DEBUG] FAQ生成履歴を{len(history)}件読み込みました")
         except FileNotFoundError:
             print("[DEBUG] FAQ生成履歴ファイルが存在しません（初回生成）")
@@ -465,43 +1032,26 @@ class FAQSystem:
     def _save_to_generation_history(self, faqs: list) -> None:
         """生成したFAQを履歴に保存"""
         import datetime
-        import os
 
-        history_file = 'faq_generation_history.csv'
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         try:
-            # ファイルが存在するかチェック
-            file_exists = os.path.exists(history_file)
-
-            with open(history_file, 'a', encoding='utf-8-sig', newline='') as file:
-                fieldnames = ['timestamp', 'question', 'answer']
-                writer = csv.DictWriter(file, fieldnames=fieldnames)
-
-                if not file_exists:
-                    writer.writeheader()
-
-                for faq in faqs:
-                    writer.writerow({
-                        'timestamp': timestamp,
-                        'question': faq.get('question', ''),
-                        'answer': faq.get('answer', '')
-                    })
-
+            self.storage.append_history([{
+                'timestamp': timestamp,
+                'question': faq.get('question', ''),
+                'answer': faq.get('answer', '')
+            } for faq in faqs])
             print(f"[DEBUG] {len(faqs)}件のFAQを生成履歴に保存しました")
         except Exception as e:
             print(f"[DEBUG] FAQ生成履歴保存エラー: {e}")
 
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """PDFからテキストを抽出"""
+    def extract_text_from_pdf(self, pdf_path: str, extractor: str = None, progress=None) -> str:
+        """PDFからテキストを抽出（ファイルに変更がなければ保存済みの抽出結果を使う）
+
+        extractor: 'pypdf2' / 'pdfminer'（未指定なら環境変数 PDF_EXTRACTOR、既定は pypdf2）
+        """
         try:
-            import PyPDF2
-            text = ""
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
+            return get_pdf_text_store().get(pdf_path, extractor=extractor, progress=progress).text
         except ImportError:
             print("PyPDF2がインストールされていません。pip install PyPDF2を実行してください")
             return ""
@@ -509,65 +1059,21 @@ class FAQSystem:
             print(f"PDF読み込みエラー {pdf_path}: {e}")
             return ""
 
-    def load_reference_documents(self) -> str:
-        """参考資料を読み込む（PDF、TXT対応）"""
+    def load_reference_context(self, query: str) -> str:
+        """質問に関係する参考資料のチャンクだけを取り出す（上位 reference_top_k 件、reference_budget_chars 文字以内）"""
         try:
-            import os
-            reference_content = ""
-
-            # 参考資料ディレクトリから文書を読み込み
-            reference_dir = os.path.join(os.path.dirname(__file__), 'reference_docs')
-            if os.path.exists(reference_dir):
-                # ファイルを名前でソート（優先順位を付けたい場合）
-                files = sorted(os.listdir(reference_dir))
-
-                for filename in files:
-                    file_path = os.path.join(reference_dir, filename)
-
-                    if filename.endswith('.txt'):
-                        # テキストファイル読み込み
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                                reference_content += f"\n\n=== {filename} ===\n"
-                                reference_content += content
-                        except UnicodeDecodeError:
-                            # UTF-8で読めない場合はcp932（Shift_JIS）で試す
-                            with open(file_path, 'r', encoding='cp932') as f:
-                                content = f.read()
-                                reference_content += f"\n\n=== {filename} ===\n"
-                                reference_content += content
-
-                    elif filename.endswith('.pdf'):
-                        # PDFファイル読み込み
-                        pdf_content = self.extract_text_from_pdf(file_path)
-                        if pdf_content:
-                            reference_content += f"\n\n=== {filename} ===\n"
-                            reference_content += pdf_content
-
-                    elif filename.endswith(('.md', '.markdown')):
-                        # Markdownファイル読み込み
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                                reference_content += f"\n\n=== {filename} ===\n"
-                                reference_content += content
-                        except Exception as e:
-                            print(f"Markdown読み込みエラー {filename}: {e}")
-
-            # 参考資料が長すぎる場合は制限（Claude APIのトークン制限対応）
-            if len(reference_content) > 10000:  # 約10,000文字で制限
-                reference_content = reference_content[:10000] + "\n\n[... 参考資料が長いため省略 ...]"
-
-            return reference_content
+            chunks = self.reference_index.search(query, top_k=self.reference_top_k, budget_chars=self.reference_budget_chars)
+            if chunks:
+                sources = ', '.join(f"{chunk['source']} p.{chunk['page']}" if chunk['page'] else chunk['source'] for chunk in chunks)
+                print(f"[DEBUG] 参考資料チャンク: {len(chunks)}件（{sources}）")
+            return format_reference_context(chunks)
         except Exception as e:
-            print(f"参考資料読み込みエラー: {e}")
+            print(f"参考資料検索エラー: {e}")
             return ""
 
     def generate_improved_qa_with_claude(self, user_question: str, current_answer: str, use_references: bool = True) -> dict:
         """ClaudeでQ&Aを改善生成"""
         try:
-            import requests
             import json
             import os
 
@@ -577,10 +1083,10 @@ class FAQSystem:
                 print("CLAUDE_API_KEY未設定。モック改善機能を使用します...")
                 return self._mock_claude_improvement(user_question, current_answer)
 
-            # 参考資料を取得
+            # 参考資料を取得（質問に関係するチャンクのみ）
             reference_docs = ""
             if use_references:
-                reference_docs = self.load_reference_documents()
+                reference_docs = self.load_reference_context(user_question)
 
             # 既存のFAQコンテキストを構築
             existing_context = "\n".join([
@@ -626,32 +1132,9 @@ class FAQSystem:
 }}
 """
 
-            headers = {
-                'Content-Type': 'application/json',
-                'x-api-key': api_key,
-                'anthropic-version': '2023-06-01'
-            }
-
-            data = {
-                'model': 'claude-3-haiku-20240307',
-                'max_tokens': 1000,
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': prompt
-                    }
-                ]
-            }
-
-            # JSONをダンプして確実にエスケープする
-            import json
-            json_data = json.dumps(data, ensure_ascii=False)
-
-            response = requests.post(
-                'https://api.anthropic.com/v1/messages',
-                headers=headers,
-                data=json_data.encode('utf-8'),
-                timeout=30
+            # JSONとして取り出せない回答はキャッシュしない（同じ質問で失敗を繰り返さない）
+            response = get_llm_client(api_key).create_message(
+                prompt, max_tokens=1000, timeout=30, cache_if=lambda text: self._parse_improved_qa(text) is not None
             )
 
             if response.status_code == 200:
@@ -660,27 +1143,12 @@ class FAQSystem:
                 content = result['content'][0]['text']
                 print(f"[DEBUG] Claude レスポンス内容（最初の200文字）: {content[:200]}...")
 
-                # JSON部分を抽出
-                import re
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    # 改行文字を適切にエスケープ
-                    json_str = json_match.group()
-                    # 文字列内の改行をエスケープ（JSONパースエラーを防ぐ）
-                    # まず正規表現で文字列値内の改行を検出して置換
-                    json_str = re.sub(r'("(?:[^"\\]|\\.)*?")', lambda m: m.group(1).replace('\n', '\\n').replace('\r', '\\r'), json_str)
-
-                    try:
-                        qa_data = json.loads(json_str)
-                        print(f"[DEBUG] JSONデータ抽出成功: {qa_data}")
-                        return qa_data
-                    except json.JSONDecodeError as e:
-                        print(f"[DEBUG] JSONパースエラー: {e}")
-                        print(f"[DEBUG] 問題のJSON: {json_str[:500]}...")
-                        return self._mock_claude_improvement(user_question, current_answer)
-                else:
-                    print(f"[DEBUG] Claude の回答からJSONを抽出できませんでした。モック機能に切り替えます")
-                    return self._mock_claude_improvement(user_question, current_answer)
+                qa_data = self._parse_improved_qa(content)
+                if qa_data is not None:
+                    print(f"[DEBUG] JSONデータ抽出成功: {qa_data}")
+                    return qa_data
+                print(f"[DEBUG] Claude の回答からJSONを抽出できませんでした。モック機能に切り替えます")
+                return self._mock_claude_improvement(user_question, current_answer)
             else:
                 print(f"[DEBUG] Claude API エラー - ステータス: {response.status_code}")
                 print(f"[DEBUG] エラーレスポンス: {response.text}")
@@ -700,13 +1168,11 @@ class FAQSystem:
 
         if improved_qa:
             # 改善されたQ&Aを承認待ちキューに追加
-            qa_id = self.add_pending_qa(
-                question=improved_qa['question'],
-                answer=improved_qa['answer'],
-                keywords=improved_qa.get('keywords', ''),
-                category=improved_qa.get('category', 'AI生成'),
-                user_question=user_question
-            )
+            qa_ids = self.add_pending_qa_batch([improved_qa], category='AI生成', user_question=user_question)
+            if not qa_ids:
+                print("[失敗] 改善されたQ&Aの質問または回答が空です")
+                return False
+            qa_id = qa_ids[0]
 
             print(f"[追加] 新しいQ&Aを承認待ちキューに追加しました (ID: {qa_id}):")
             print(f"質問: {improved_qa['question']}")
@@ -717,6 +1183,24 @@ class FAQSystem:
             print("[失敗] Q&Aの改善に失敗しました")
             return False
 
+    @staticmethod
+    def _parse_improved_qa(content: str):
+        """改善Q&Aの回答からJSONオブジェクトを取り出す（取り出せなければNone）"""
+        import json
+        import re
+
+        json_match = re.search(r'\{.*\}', content, re.DOTALL)
+        if not json_match:
+            return None
+        # 文字列内の改行をエスケープ（JSONパースエラーを防ぐ）
+        json_str = re.sub(r'("(?:[^"\\]|\\.)*?")', lambda m: m.group(1).replace('\n', '\\n').replace('\r', '\\r'), json_match.group())
+        try:
+            qa_data = json.loads(json_str)
+        except json.JSONDecodeError as e:
+            print(f"[DEBUG] JSONパースエラー: {e}")
+            return None
+        return qa_data if isinstance(qa_data, dict) else None
+
     def _mock_claude_improvement(self, user_question: str, current_answer: str) -> dict:
         """Claude APIの代わりにルールベースでQ&Aを改善するモック関数"""
 
@@ -757,9 +1241,41 @@ class FAQSystem:
                 'category': "その他"
             }
 
-    def _generate_qa_from_window(self, window_text: str, category: str, used_questions: list = None, window_rejected_questions: list = None) -> dict:
+    @staticmethod
+    def _strip_code_fence(content: str) -> str:
+        """```json ... ``` で囲まれた回答から中身を取り出す"""
+        content = content.strip()
+        if content.startswith("```json"):
+            content = content.replace("```json", "").replace("```", "").strip()
+        return content
+
+    @classmethod
+    def _parse_qa_candidates(cls, content: str) -> list:
+        """生成されたQ&A候補のリストを取り出す（JSON配列、無ければ単一オブジェクト。取り出せなければ空リスト）"""
+        import json
+        import re
+
+        content = cls._strip_code_fence(content)
+        try:
+            # 配列を探す（[...] 形式）
+            json_match = re.search(r'\[.*\]', content, re.DOTALL)
+            if json_match:
+                faq_list = json.loads(json_match.group())
+                if faq_list and isinstance(faq_list, list):
+                    return faq_list
+
+            # 配列が見つからない場合、単一オブジェクトとしてパースを試みる（後方互換性）
+            json_match = re.search(r'\{.*\}', content, re.DOTALL)
+            if json_match:
+                faq_data = json.loads(json_match.group())
+                if isinstance(faq_data, dict) and faq_data.get('question'):
+                    return [faq_data]
+        except ValueError as e:
+            print(f"[DEBUG] JSONパースエラー: {e}")
+        return []
+
+    def _generate_qa_from_window(self, window_text: str, category: str, used_questions: list = None, window_rejected_questions: list = None, resample: bool = False) -> dict:
         """1段階生成: ウィンドウテキストから直接Q&Aを1つ生成"""
-        import requests
         import json
         import os
 
@@ -862,57 +1378,19 @@ JSON配列で5つ：
                 print("[ERROR] CLAUDE_API_KEY未設定")
                 return None
 
-            headers = {
-                'Content-Type': 'application/json',
-                'x-api-key': api_key,
-                'anthropic-version': '2023-06-01'
-            }
-
-            data = {
-                'model': 'claude-3-haiku-20240307',
-                'max_tokens': 3072,  # 5つの質問を生成するため増やす
-                'temperature': 1.0,  # 多様性を確保するため最大値に設定
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': prompt
-                    }
-                ]
-            }
-
-            json_data = json.dumps(data, ensure_ascii=False)
-
-            response = requests.post(
-                'https://api.anthropic.com/v1/messages',
-                headers=headers,
-                data=json_data.encode('utf-8'),
-                timeout=60
-            )
+            # 5つの質問を生成するため max_tokens を増やし、多様性を確保するため temperature は最大値
+            # 同じウィンドウでの再生成（resample）はキャッシュを使わず、新しい候補を取り直す
+            # 候補を1件も取り出せない回答はキャッシュしない
+            response = get_llm_client(api_key).create_message(prompt, max_tokens=3072, temperature=1.0, timeout=60,
+                                                              use_cache=not resample,
+                                                              cache_if=lambda text: bool(self._parse_qa_candidates(text)))
 
             if response.status_code == 200:
                 result = response.json()
-                content = result['content'][0]['text'].strip()
-
-                # JSONをパース
-                if content.startswith("```json"):
-                    content = content.replace("```json", "").replace("```", "").strip()
-
-                import re
-                # 配列を探す（[...] 形式）
-                json_match = re.search(r'\[.*\]', content, re.DOTALL)
-                if json_match:
-                    faq_list = json.loads(json_match.group())
-                    if faq_list and isinstance(faq_list, list) and len(faq_list) > 0:
-                        print(f"[DEBUG] Q&A生成成功: {len(faq_list)}個の質問候補を生成")
-                        return faq_list  # リストを返す
-
-                # 配列が見つからない場合、単一オブジェクトとしてパースを試みる（後方互換性）
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    faq_data = json.loads(json_match.group())
-                    if faq_data and 'question' in faq_data and faq_data['question']:
-                        print(f"[DEBUG] Q&A生成成功（単一）: {faq_data['question'][:50]}...")
-                        return [faq_data]  # リストに変換して返す
+                faq_list = self._parse_qa_candidates(result['content'][0]['text'])
+                if faq_list:
+                    print(f"[DEBUG] Q&A生成成功: {len(faq_list)}個の質問候補を生成")
+                    return faq_list
 
                 print("[DEBUG] JSON形式が不正または空")
                 return []  # 空リストを返す
@@ -924,9 +1402,19 @@ JSON配列で5つ：
             print(f"[ERROR] Q&A生成エラー: {e}")
             return []  # エラー時は空リストを返す
 
+    @staticmethod
+    def _parse_json_list(content: str):
+        """JSON配列として読めればそのリスト、読めなければNone"""
+        import json
+
+        try:
+            value = json.loads(content)
+        except ValueError:
+            return None
+        return value if isinstance(value, list) else None
+
     def _extract_scenarios(self, window_text: str, used_scenarios: list = None) -> list:
         """ステップ1: ウィンドウテキストからシナリオ（実際の悩み・疑問）を抽出"""
-        import requests
         import json
         import os
 
@@ -990,40 +1478,14 @@ JSON配列のみを出力してください：
                 print("[ERROR] CLAUDE_API_KEY未設定")
                 return []
 
-            headers = {
-                'Content-Type': 'application/json',
-                'x-api-key': api_key,
-                'anthropic-version': '2023-06-01'
-            }
-
-            data = {
-                'model': 'claude-3-haiku-20240307',
-                'max_tokens': 1024,
-                'temperature': 0.7,
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': prompt
-                    }
-                ]
-            }
-
-            json_data = json.dumps(data, ensure_ascii=False)
-
-            response = requests.post(
-                'https://api.anthropic.com/v1/messages',
-                headers=headers,
-                data=json_data.encode('utf-8'),
-                timeout=60
+            response = get_llm_client(api_key).create_message(
+                prompt, max_tokens=1024, temperature=0.7, timeout=60,
+                cache_if=lambda text: self._parse_json_list(self._strip_code_fence(text)) is not None
             )
 
             if response.status_code == 200:
                 result = response.json()
-                content = result['content'][0]['text'].strip()
-
-                # JSONをパース
-                if content.startswith("```json"):
-                    content = content.replace("```json", "").replace("```", "").strip()
+                content = self._strip_code_fence(result['content'][0]['text'])
 
                 scenarios = json.loads(content)
                 print(f"[DEBUG] シナリオ抽出成功: {len(scenarios)}個")
@@ -1036,9 +1498,19 @@ JSON配列のみを出力してください：
             print(f"[ERROR] シナリオ抽出エラー: {e}")
             return []
 
+    @classmethod
+    def _parse_first_question(cls, content: str):
+        """回答のJSON配列の先頭のQ&A（取り出せなければNone）"""
+        import re
+
+        json_match = re.search(r'\[.*\]', cls._strip_code_fence(content), re.DOTALL)
+        faq_list = cls._parse_json_list(json_match.group()) if json_match else None
+        if faq_list and isinstance(faq_list[0], dict) and 'question' in faq_list[0]:
+            return faq_list[0]
+        return None
+
     def _generate_question_from_scenario(self, scenario: str, answer_window: str, category: str, used_questions: list = None) -> dict:
         """ステップ2: シナリオから実用的な質問を生成"""
-        import requests
         import json
         import os
 
@@ -1122,48 +1594,17 @@ JSON配列のみを出力してください：
                 print("[ERROR] CLAUDE_API_KEY未設定")
                 return None
 
-            headers = {
-                'Content-Type': 'application/json',
-                'x-api-key': api_key,
-                'anthropic-version': '2023-06-01'
-            }
-
-            data = {
-                'model': 'claude-3-haiku-20240307',
-                'max_tokens': 2048,
-                'temperature': 0.8,
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': prompt
-                    }
-                ]
-            }
-
-            json_data = json.dumps(data, ensure_ascii=False)
-
-            response = requests.post(
-                'https://api.anthropic.com/v1/messages',
-                headers=headers,
-                data=json_data.encode('utf-8'),
-                timeout=60
+            response = get_llm_client(api_key).create_message(
+                prompt, max_tokens=2048, temperature=0.8, timeout=60,
+                cache_if=lambda text: self._parse_first_question(text) is not None
             )
 
             if response.status_code == 200:
                 result = response.json()
-                content = result['content'][0]['text'].strip()
-
-                # JSONをパース
-                if content.startswith("```json"):
-                    content = content.replace("```json", "").replace("```", "").strip()
-
-                import re
-                json_match = re.search(r'\[.*\]', content, re.DOTALL)
-                if json_match:
-                    faq_list = json.loads(json_match.group())
-                    if faq_list:
-                        print(f"[DEBUG] 質問生成成功: {faq_list[0]['question'][:50]}...")
-                        return faq_list[0]
+                faq = self._parse_first_question(result['content'][0]['text'])
+                if faq is not None:
+                    print(f"[DEBUG] 質問生成成功: {faq['question'][:50]}...")
+                    return faq
 
                 print("[ERROR] JSON形式が不正")
                 return None
@@ -1175,10 +1616,25 @@ JSON配列のみを出力してください：
             print(f"[ERROR] 質問生成エラー: {e}")
             return None
 
-    def generate_faqs_from_document(self, pdf_path: str, num_questions: int = 3, category: str = "AI生成") -> list:
-        """PDFドキュメントからFAQを自動生成（ランダムウィンドウ方式）"""
+    def generate_faqs_from_document(self, pdf_path: str, num_questions: int = 3, category: str = "AI生成", pdf_extractor: str = None,
+                                    progress_callback=None, extraction_progress_callback=None, should_stop=None, on_faq=None,
+                                    on_rejected=None, run_id: str = None) -> list:
+        """PDFドキュメントからFAQを自動生成（ランダムウィンドウ方式）
+
+        progress_callback / extraction_progress_callback: 未指定ならインスタンスのコールバックを使用
+        should_stop: Trueを返したら中断する関数（generation_interrupted に加えて確認、ジョブごとの中断用）
+        on_faq: FAQを1件採用するたびに呼ばれる関数（途中までの結果を逐次保存する用）
+        on_rejected: 候補を重複で却下するたびに呼ばれる関数（duplicate_log に記録した内容を渡す）
+        run_id: 重複判定ログに残す生成の識別子（未指定なら生成ごとに採番）
+        """
+        progress_callback = progress_callback or self.progress_callback
+        run_id = run_id or uuid.uuid4().hex[:12]
+        extraction_progress_callback = extraction_progress_callback or self.extraction_progress_callback
+
+        def is_stopped() -> bool:
+            return self.generation_interrupted or (should_stop is not None and should_stop())
+
         try:
-            import requests
             import json
             import os
 
@@ -1191,8 +1647,11 @@ JSON配列のみを出力してください：
                 print("[ERROR] CLAUDE_API_KEY未設定。モック生成機能を使用します...")
                 return self._mock_faq_generation(num_questions, category)
 
+            import numpy as np
+
             # PDFからテキストを抽出
-            pdf_content = self.extract_text_from_pdf(pdf_path)
+            pdf_content = self.extract_text_from_pdf(pdf_path, extractor=pdf_extractor,
+                                                     progress=extraction_progress_callback)
             if not pdf_content:
                 print(f"PDFの読み込みに失敗: {pdf_path}")
                 return []
@@ -1200,17 +1659,15 @@ JSON配列のみを出力してください：
             print(f"[DEBUG] PDF全体の文字数: {len(pdf_content)}")
 
             # 2段階ウィンドウ方式でPDFから抽出位置を決定
-            import random
             question_window = 500   # 質問用: 狭い範囲（トピック選択用）
             answer_window = 1500    # 回答用: 広い範囲（詳細回答生成用）
-            pdf_length = len(pdf_content)
-            max_start = max(0, pdf_length - answer_window)
 
-            # ランダムな開始位置を生成（50文字単位、ランダム選択用）
-            possible_positions = list(range(0, max_start, 50))
-            total_windows = len(possible_positions)
+            # 開始位置は50文字単位。カタログから、未カバーの範囲を優先してランダムに選ぶ
+            # （同じ資料の前回までの採用・除外の結果を引き継ぐ）
+            window_sampler = open_window_sampler(pdf_content, answer_window, question_window, step=50)
+            total_windows = window_sampler.total
 
-            print(f"[DEBUG] 利用可能なウィンドウ位置数: {total_windows}個")
+            print(f"[DEBUG] 利用可能なウィンドウ位置数: {total_windows}個（前回までの統計: {len(window_sampler.stats)}件）")
 
             # ウィンドウ生成関数
             def create_window_pair(pos):
@@ -1230,14 +1687,13 @@ JSON配列のみを出力してください：
 
             # ウィンドウごとの連続重複カウンター（10回重複で除外）
             window_duplicate_count = {}
-            excluded_windows = set()  # 除外済みウィンドウ位置
             window_rejected_questions = {}  # ウィンドウごとに重複判定された質問リスト
 
             # 既存のFAQと承認待ちFAQの両方をチェック
             existing_questions = [faq['question'] for faq in self.faq_data]
 
             # 承認待ちFAQも重複チェック対象に追加
-            self.load_pending_qa()
+            self.refresh_pending_qa()
             pending_questions = [item['question'] for item in self.pending_qa if 'question' in item]
             all_existing_questions = existing_questions + pending_questions
 
@@ -1261,280 +1717,242 @@ JSON配列のみを出力してください：
 
             # FAQ生成開始
             all_faqs = []
-            headers = {
-                'Content-Type': 'application/json',
-                'x-api-key': api_key,
-                'anthropic-version': '2023-06-01'
-            }
 
             # ランダムウィンドウ選択方式でFAQを生成
+            # ウィンドウごとのClaude API呼び出しは最大 generation_concurrency 件を並行して実行し、
+            # 結果が届いた順にこのスレッドで重複チェック・採用を行う（判定や除外の管理は1スレッドのみ）
             generation_attempt = 0
             max_total_attempts = num_questions * 50  # 最大試行回数（無限ループ防止）
-            selected_position = None  # 現在選択中のウィンドウ位置（None = 新規選択が必要）
-
-            while len(all_faqs) < num_questions and generation_attempt < max_total_attempts:
-                # 中断チェック
-                if self.generation_interrupted:
-                    print(f"[INFO] FAQ生成が中断されました（{len(all_faqs)}件生成済み）")
-                    break
-
-                generation_attempt += 1
-
-                # 利用可能なウィンドウから除外済みを除く
-                available_windows = [pos for pos in possible_positions if pos not in excluded_windows]
-
-                if not available_windows:
-                    print(f"[WARNING] 利用可能なウィンドウがなくなりました（{len(all_faqs)}件生成済み）")
-                    break
-
-                # 新しいウィンドウを選択（selected_position が None の場合のみ）
-                if selected_position is None or selected_position in excluded_windows:
-                    selected_position = random.choice(available_windows)
-                    print(f"[DEBUG] 新しいウィンドウを選択: 位置 {selected_position}")
-
-                window_pair = create_window_pair(selected_position)
-
-                print(f"\n[DEBUG] 生成試行 {generation_attempt} (位置: {selected_position}, 質問範囲: {window_pair['q_range']}, 進捗: {len(all_faqs)}/{num_questions})...")
-
-                # ウィンドウごとの使用済みシナリオを管理
-                if selected_position not in window_rejected_questions:
-                    window_rejected_questions[selected_position] = []
-
-                window_used_scenarios = window_rejected_questions[selected_position]
-
-                # 1段階生成: ウィンドウから直接Q&Aを生成
-                import time
+            concurrency = max(1, int(self.generation_concurrency))
+            rate_limiter = RateLimiter(self.generation_rate_limit) if self.generation_rate_limit else None
+            stop_event = threading.Event()  # 生成終了後に待機中のリクエストを取りやめる
+            in_flight = {}  # 実行中のリクエスト → (ウィンドウ位置, 試行番号)
+            retry_positions = []  # 同じウィンドウで再生成する位置（重複・失敗でまだ除外されていないもの）
+            requested_positions = set()  # この生成中に一度でもリクエストしたウィンドウ位置
+
+            def request_window(position, used_questions, rejected_questions, resample):
+                """ワーカースレッドでウィンドウからQ&A候補を生成"""
+                if rate_limiter is not None and not rate_limiter.acquire(stop_event):
+                    return None, 0.0
+                if stop_event.is_set() or is_stopped():
+                    return None, 0.0
                 api_start_time = time.time()
-                print(f"[DEBUG] Q&A生成開始...")
-                if window_used_scenarios:
-                    print(f"[DEBUG] このウィンドウで既に却下された質問: {len(window_used_scenarios)}個")
-
-                faq_candidates = self._generate_qa_from_window(
-                    window_text=window_pair['answer_text'],  # より広い範囲を使用
+                candidates = self._generate_qa_from_window(
+                    window_text=create_window_pair(position)['answer_text'],  # より広い範囲を使用
                     category=category,
-                    used_questions=unique_questions,
-                    window_rejected_questions=window_used_scenarios  # ウィンドウ固有の却下質問を渡す
+                    used_questions=used_questions,
+                    window_rejected_questions=rejected_questions,  # ウィンドウ固有の却下質問を渡す
+                    resample=resample  # 2回目以降はキャッシュを使わない
                 )
+                return candidates, time.time() - api_start_time
+
+            def report_progress(window_retry, window_pair):
+                if progress_callback:
+                    progress_callback(
+                        len(all_faqs),
+                        num_questions,
+                        window_retry,
+                        window_sampler.excluded_count,
+                        total_windows,
+                        window_pair['q_range'],
+                        window_pair['a_range']
+                    )
+
+            def count_window_failure(selected_position, window_pair) -> bool:
+                """ウィンドウの連続重複カウントを増やし、除外された場合はTrueを返す"""
+                window_duplicate_count[selected_position] = window_duplicate_count.get(selected_position, 0) + 1
+                current_window_retry = window_duplicate_count[selected_position]
+
+                # 10回連続で重複したらウィンドウを除外
+                excluded = False
+                if current_window_retry >= 10:
+                    window_sampler.exclude(selected_position)
+                    print(f"[DEBUG] ウィンドウ位置 {selected_position} を除外（連続10回重複）")
+                    excluded = True
+
+                # 進捗を更新（リトライ情報を表示）
+                report_progress(current_window_retry, window_pair)
+                return excluded
+
+            def process_candidates(selected_position, attempt, faq_candidates) -> bool:
+                """候補の重複チェック・採用を行い、同じウィンドウで再生成する場合はTrueを返す"""
+                window_pair = create_window_pair(selected_position)
+                keep_window = True
 
-                api_time = time.time() - api_start_time
-                print(f"[TIME] Q&A生成時間: {api_time:.1f}秒")
-
-                if faq_candidates and len(faq_candidates) > 0:
-                    # 複数の質問候補が生成された
-                    print(f"[DEBUG] 生成試行 {generation_attempt} {len(faq_candidates)}個の質問候補を取得")
-
-                    # 候補から重複していないものを処理
-                    for faq in faq_candidates:
-                        current_question = faq.get('question', '')
-                        current_answer = faq.get('answer', '')
-
-                        # 回答不可能な質問を除外
-                        answer_lower = current_answer.lower()
-                        if (('記載がありません' in answer_lower or '記載されていません' in answer_lower) and
-                            ('pdf' in answer_lower or 'ドキュメント' in answer_lower)) or \
-                           '公式の情報源を参照' in current_answer or '公式情報を確認' in current_answer:
-                            print(f"[DEBUG] 生成試行 {generation_attempt} FAQをスキップ（回答不可能）: {current_question[:50]}...")
-
-                            # ウィンドウ重複カウントを増やす
-                            if selected_position not in window_duplicate_count:
-                                window_duplicate_count[selected_position] = 0
-                            window_duplicate_count[selected_position] += 1
-
-                            # 進捗を更新用に現在のリトライカウントを保存
-                            current_window_retry = window_duplicate_count[selected_position]
-
-                            # 10回連続で重複したらウィンドウを除外
-                            if window_duplicate_count[selected_position] >= 10:
-                                excluded_windows.add(selected_position)
-                                print(f"[DEBUG] ウィンドウ位置 {selected_position} を除外（連続10回重複）")
-                                # ウィンドウ除外 → 次のループで新しいウィンドウを選択
-                                selected_position = None
-
-                            # 進捗を更新（リトライ情報を表示）
-                            if self.progress_callback:
-                                self.progress_callback(
-                                    len(all_faqs),
-                                    num_questions,
-                                    current_window_retry,
-                                    len(excluded_windows),
-                                    total_windows,
-                                    window_pair['q_range'],
-                                    window_pair['a_range']
-                                )
-                            continue
-
-                        # 重複チェック（キーワードベース）
-                        is_duplicate = False
-
-                        # 重複チェック開始時刻を記録
-                        dup_check_start = time.time()
-                        print(f"[TIME] 重複チェック開始 (既存質問数: {len(unique_questions)}件)...")
-
-                        # 既存FAQとの重複チェック（最適化版：早期リターン）
-                        checked_count = 0
-                        for existing_q in unique_questions:
-                            checked_count += 1
-                            # 進捗を100件ごとに表示
-                            if checked_count % 100 == 0:
-                                print(f"[TIME] 重複チェック進捗: {checked_count}/{len(unique_questions)}件チェック済み")
-
-                            # セマンティック類似度で重複判定
-                            similarity = self.calculate_semantic_similarity(current_question, existing_q)
-
-                            # キーワードベースの判定（閾値を緩和して多様性を確保）
-                            if similarity >= 0.95:
-                                # 文字列がほぼ同一 → 重複
-                                print(f"[DEBUG] 生成試行 {generation_attempt} FAQをスキップ（既存と完全重複 {similarity:.2f}）: {current_question[:40]}...")
-                                # 重複FAQを記録（デバッグ用）
-                                self.duplicate_faqs.append({
-                                    'question': current_question,
-                                    'answer': current_answer,
-                                    'similarity': similarity,
-                                    'matched_with': existing_q,
-                                    'window_position': selected_position,
-                                    'window_retry_count': window_duplicate_count.get(selected_position, 0) + 1,
-                                    'reason': '既存と完全重複（類似度 >= 0.95）'
-                                })
-                                # このウィンドウの重複質問リストに追加
-                                if selected_position not in window_rejected_questions:
-                                    window_rejected_questions[selected_position] = []
-                                window_rejected_questions[selected_position].append(current_question)
-                                is_duplicate = True
+                # 複数の質問候補が生成された
+                print(f"[DEBUG] 生成試行 {attempt} {len(faq_candidates)}個の質問候補を取得")
+
+                # 候補全体と既存質問との類似度を一括計算（埋め込みは1回のencodeでまとめて取得）
+                candidate_questions = [faq.get('question', '') for faq in faq_candidates]
+                existing_similarities, candidate_similarities = self._duplicate_similarities(
+                    candidate_questions, unique_questions
+                )
+                appended_candidates = []  # このバッチで unique_questions に追加した候補の番号
+                generated_questions = {added.get('question', '') for added in all_faqs}
+
+                # 候補から重複していないものを処理
+                for candidate_index, faq in enumerate(faq_candidates):
+                    if len(all_faqs) >= num_questions:
+                        break
+
+                    current_question = faq.get('question', '')
+                    current_answer = faq.get('answer', '')
+
+                    # 回答不可能な質問を除外
+                    answer_lower = current_answer.lower()
+                    if (('記載がありません' in answer_lower or '記載されていません' in answer_lower) and
+                        ('pdf' in answer_lower or 'ドキュメント' in answer_lower)) or \
+                       '公式の情報源を参照' in current_answer or '公式情報を確認' in current_answer:
+                        print(f"[DEBUG] 生成試行 {attempt} FAQをスキップ（回答不可能）: {current_question[:50]}...")
+                        window_sampler.record_rejected(selected_position)
+                        if count_window_failure(selected_position, window_pair):
+                            keep_window = False
+                        continue
+
+                    # 重複チェック（バッチで計算済みの類似度行列から判定）
+                    is_duplicate = False
+
+                    # 重複チェック開始時刻を記録
+                    dup_check_start = time.time()
+                    print(f"[TIME] 重複チェック開始 (既存質問数: {len(unique_questions)}件)...")
+
+                    # 既存質問（バッチ開始時点）→ このバッチで追加済みの候補、の順で判定（従来と同じ順序）
+                    similarities = np.concatenate([
+                        existing_similarities[candidate_index],
+                        candidate_similarities[candidate_index, appended_candidates]
+                    ])
+                    duplicate = self._find_first_duplicate(current_question, similarities, unique_questions)
+
+                    if duplicate is not None:
+                        matched_index, similarity, keyword_match = duplicate
+                        matched_question = unique_questions[matched_index]
+                        source = '生成済み' if matched_question in generated_questions else '既存'
+                        if keyword_match:
+                            print(f"[DEBUG] 生成試行 {attempt} FAQをスキップ（{source}と重複 {similarity:.2f}, キーワード一致）: {current_question[:40]}...")
+                            reason = f'{source}と重複（類似度: {similarity:.2f}, キーワード一致）'
+                        else:
+                            print(f"[DEBUG] 生成試行 {attempt} FAQをスキップ（{source}と完全重複 {similarity:.2f}）: {current_question[:40]}...")
+                            reason = f'{source}と完全重複（類似度 >= 0.95）'
+                        # 重複FAQを記録（デバッグ用）
+                        rejected = {
+                            'run_id': run_id,
+                            'question': current_question,
+                            'answer': current_answer,
+                            'similarity': float(similarity),
+                            'matched_with': matched_question,
+                            'window_position': selected_position,
+                            'window_retry_count': window_duplicate_count.get(selected_position, 0) + 1,
+                            'reason': reason
+                        }
+                        rejected = self.duplicate_log.append(rejected)
+                        window_sampler.record_rejected(selected_position)
+                        if on_rejected is not None:
+                            on_rejected(rejected)
+                        # このウィンドウの重複質問リストに追加
+                        window_rejected_questions.setdefault(selected_position, []).append(current_question)
+                        is_duplicate = True
+
+                    # この候補は重複かどうかに関わらず unique_questions に追加される
+                    appended_candidates.append(candidate_index)
+
+                    # 重複チェック完了時刻を記録
+                    dup_check_time = time.time() - dup_check_start
+                    print(f"[TIME] 重複チェック完了: {dup_check_time:.1f}秒, 重複判定: {is_duplicate}")
+
+                    if is_duplicate:
+                        # 重複の場合でも、次回の生成で同じ質問を避けるためにunique_questionsに追加
+                        unique_questions.append(current_question)
+                        if count_window_failure(selected_position, window_pair):
+                            keep_window = False
+                    else:
+                        # 重複なし →  FAQを追加し、ウィンドウの重複カウントをリセット
+                        all_faqs.append(faq)
+                        window_sampler.record_accepted(selected_position)
+                        if on_faq is not None:
+                            on_faq(faq)
+                        unique_questions.append(current_question)  # 次回の重複チェック用に追加
+                        generated_questions.add(current_question)
+                        window_duplicate_count[selected_position] = 0  # リセット
+                        print(f"[DEBUG] 生成試行 {attempt} FAQを追加: {current_question[:50]}...")
+                        print(f"[DEBUG] 現在のFAQ総数: {len(all_faqs)}/{num_questions}")
+
+                        # FAQ生成成功 → 次は新しいウィンドウを選択
+                        keep_window = False
+
+                        # 進捗を更新（成功したのでリトライカウントは0）
+                        report_progress(0, window_pair)
+
+                return keep_window and not window_sampler.is_excluded(selected_position)
+
+            executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='faq-generation')
+            try:
+                while len(all_faqs) < num_questions:
+                    # 中断チェック
+                    if is_stopped():
+                        print(f"[INFO] FAQ生成が中断されました（{len(all_faqs)}件生成済み）")
+                        break
+
+                    # 空いているスロットにウィンドウを割り当てる（残り件数より多くは並行させない）
+                    max_in_flight = min(concurrency, num_questions - len(all_faqs))
+                    while len(in_flight) < max_in_flight and generation_attempt < max_total_attempts:
+                        if retry_positions:
+                            selected_position = retry_positions.pop(0)
+                        else:
+                            # 除外済み・他のスロットで使用中のウィンドウは取り出されない
+                            selected_position = window_sampler.take()
+                            if selected_position is None:
                                 break
-                            elif similarity >= 0.80:
-                                # 文字列は似ているが、重要キーワードをチェック
-                                keywords_new = self._extract_important_keywords(current_question)
-                                keywords_existing = self._extract_important_keywords(existing_q)
-
-                                if keywords_new == keywords_existing:
-                                    print(f"[DEBUG] 生成試行 {generation_attempt} FAQをスキップ（既存と重複 {similarity:.2f}, キーワード一致）: {current_question[:40]}...")
-                                    # 重複FAQを記録（デバッグ用）
-                                    self.duplicate_faqs.append({
-                                        'question': current_question,
-                                        'answer': current_answer,
-                                        'similarity': similarity,
-                                        'matched_with': existing_q,
-                                        'window_position': selected_position,
-                                        'window_retry_count': window_duplicate_count.get(selected_position, 0) + 1,
-                                        'reason': f'既存と重複（類似度: {similarity:.2f}, キーワード一致）'
-                                    })
-                                    # このウィンドウの重複質問リストに追加
-                                    if selected_position not in window_rejected_questions:
-                                        window_rejected_questions[selected_position] = []
-                                    window_rejected_questions[selected_position].append(current_question)
-                                    is_duplicate = True
-                                    break
-                                else:
-                                    print(f"[DEBUG] 生成試行 {generation_attempt} 類似度{similarity:.2f}だがキーワード異なる: {current_question[:40]}...")
-
-                        # これまでに生成したFAQとの重複チェック
-                        if not is_duplicate:
-                            for already_added in all_faqs:
-                                # セマンティック類似度で重複判定
-                                similarity = self.calculate_semantic_similarity(current_question, already_added.get('question', ''))
-
-                                if similarity >= 0.95:
-                                    print(f"[DEBUG] 生成試行 {generation_attempt} FAQをスキップ（生成済みと完全重複 {similarity:.2f}）: {current_question[:40]}...")
-                                    # 重複FAQを記録（デバッグ用）
-                                    self.duplicate_faqs.append({
-                                        'question': current_question,
-                                        'answer': current_answer,
-                                        'similarity': similarity,
-                                        'matched_with': already_added.get('question', ''),
-                                        'window_position': selected_position,
-                                        'window_retry_count': window_duplicate_count.get(selected_position, 0) + 1,
-                                        'reason': '生成済みと完全重複（類似度 >= 0.95）'
-                                    })
-                                    # このウィンドウの重複質問リストに追加
-                                    if selected_position not in window_rejected_questions:
-                                        window_rejected_questions[selected_position] = []
-                                    window_rejected_questions[selected_position].append(current_question)
-                                    is_duplicate = True
-                                    break
-                                elif similarity >= 0.80:
-                                    keywords_new = self._extract_important_keywords(current_question)
-                                    keywords_added = self._extract_important_keywords(already_added.get('question', ''))
-
-                                    if keywords_new == keywords_added:
-                                        print(f"[DEBUG] 生成試行 {generation_attempt} FAQをスキップ（生成済みと重複 {similarity:.2f}, キーワード一致）: {current_question[:40]}...")
-                                        # 重複FAQを記録（デバッグ用）
-                                        self.duplicate_faqs.append({
-                                            'question': current_question,
-                                            'answer': current_answer,
-                                            'similarity': similarity,
-                                            'matched_with': already_added.get('question', ''),
-                                            'window_position': selected_position,
-                                            'window_retry_count': window_duplicate_count.get(selected_position, 0) + 1,
-                                            'reason': f'生成済みと重複（類似度: {similarity:.2f}, キーワード一致）'
-                                        })
-                                        # このウィンドウの重複質問リストに追加
-                                        if selected_position not in window_rejected_questions:
-                                            window_rejected_questions[selected_position] = []
-                                        window_rejected_questions[selected_position].append(current_question)
-                                        is_duplicate = True
-                                        break
-
-                        # 重複チェック完了時刻を記録
-                        dup_check_time = time.time() - dup_check_start
-                        print(f"[TIME] 重複チェック完了: {dup_check_time:.1f}秒, 重複判定: {is_duplicate}")
-
-                        if is_duplicate:
-                            # 重複の場合でも、次回の生成で同じ質問を避けるためにunique_questionsに追加
-                            unique_questions.append(current_question)
-
-                            # ウィンドウ重複カウントを増やす
-                            if selected_position not in window_duplicate_count:
-                                window_duplicate_count[selected_position] = 0
-                            window_duplicate_count[selected_position] += 1
-
-                            # 進捗を更新用に現在のリトライカウントを保存
-                            current_window_retry = window_duplicate_count[selected_position]
-
-                            # 10回連続で重複したらウィンドウを除外
-                            if window_duplicate_count[selected_position] >= 10:
-                                excluded_windows.add(selected_position)
-                                print(f"[DEBUG] ウィンドウ位置 {selected_position} を除外（連続10回重複）")
-                                # ウィンドウ除外 → 次のループで新しいウィンドウを選択
-                                selected_position = None
-
-                            # 進捗を更新（リトライ情報を表示）
-                            if self.progress_callback:
-                                self.progress_callback(
-                                    len(all_faqs),
-                                    num_questions,
-                                    current_window_retry,
-                                    len(excluded_windows),
-                                    total_windows,
-                                    window_pair['q_range'],
-                                    window_pair['a_range']
-                                )
+                            print(f"[DEBUG] 新しいウィンドウを選択: 位置 {selected_position}")
+
+                        generation_attempt += 1
+                        window_pair = create_window_pair(selected_position)
+                        print(f"\n[DEBUG] 生成試行 {generation_attempt} (位置: {selected_position}, 質問範囲: {window_pair['q_range']}, 進捗: {len(all_faqs)}/{num_questions}, 実行中: {len(in_flight) + 1})...")
+
+                        # ウィンドウごとの使用済みシナリオを管理
+                        window_used_scenarios = window_rejected_questions.setdefault(selected_position, [])
+                        print(f"[DEBUG] Q&A生成開始...")
+                        if window_used_scenarios:
+                            print(f"[DEBUG] このウィンドウで既に却下された質問: {len(window_used_scenarios)}個")
+
+                        # ワーカーには投入時点のスナップショットを渡す（重複判定は結果の到着時に最新の状態で行う）
+                        future = executor.submit(request_window, selected_position,
+                                                 list(unique_questions), list(window_used_scenarios),
+                                                 selected_position in requested_positions)
+                        requested_positions.add(selected_position)
+                        in_flight[future] = (selected_position, generation_attempt)
+
+                    if not in_flight:
+                        if generation_attempt >= max_total_attempts:
+                            print(f"[WARNING] 最大試行回数（{max_total_attempts}回）に達しました（{len(all_faqs)}件生成済み）")
                         else:
-                            # 重複なし →  FAQを追加し、ウィンドウの重複カウントをリセット
-                            all_faqs.append(faq)
-                            unique_questions.append(current_question)  # 次回の重複チェック用に追加
-                            window_duplicate_count[selected_position] = 0  # リセット
-                            print(f"[DEBUG] 生成試行 {generation_attempt} FAQを追加: {current_question[:50]}...")
-                            print(f"[DEBUG] 現在のFAQ総数: {len(all_faqs)}/{num_questions}")
-
-                            # FAQ生成成功 → 次のループで新しいウィンドウを選択
-                            selected_position = None
-
-                            # 進捗を更新（progress_callbackが設定されている場合）
-                            if self.progress_callback:
-                                current_window_retry = 0  # 成功したのでリトライカウントは0
-                                self.progress_callback(
-                                    len(all_faqs),
-                                    num_questions,
-                                    current_window_retry,
-                                    len(excluded_windows),
-                                    total_windows,
-                                    window_pair['q_range'],
-                                    window_pair['a_range']
-                                )
-
-            # レート制限を回避するため少し待機
-            import time
-            time.sleep(1)
+                            print(f"[WARNING] 利用可能なウィンドウがなくなりました（{len(all_faqs)}件生成済み）")
+                        break
+
+                    # 結果が届いたものから順に処理（中断を検知できるよう定期的に戻る）
+                    done, _ = wait(list(in_flight), timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        selected_position, attempt = in_flight.pop(future)
+                        try:
+                            faq_candidates, api_time = future.result()
+                        except Exception as e:
+                            print(f"[ERROR] 生成試行 {attempt} Q&A生成エラー: {e}")
+                            faq_candidates, api_time = None, 0.0
+                        print(f"[TIME] Q&A生成時間: {api_time:.1f}秒（試行 {attempt}, 位置: {selected_position}）")
+                        if faq_candidates is not None:
+                            window_sampler.record_request(selected_position)
+
+                        keep_window = True
+                        if faq_candidates and len(all_faqs) < num_questions and not is_stopped():
+                            keep_window = process_candidates(selected_position, attempt, faq_candidates)
+                        if keep_window and not window_sampler.is_excluded(selected_position):
+                            retry_positions.append(selected_position)
+                        else:
+                            window_sampler.release(selected_position)
+            finally:
+                # 目標数に達した・中断された場合は、未実行・待機中のリクエストを取りやめる
+                stop_event.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                window_sampler.flush()
 
             # 生成完了
             print(f"\n[DEBUG] FAQ生成完了: {len(all_faqs)}件生成（目標: {num_questions}件）")
@@ -1542,7 +1960,8 @@ JSON配列のみを出力してください：
             if len(all_faqs) < num_questions:
                 print(f"[WARNING] 目標FAQ数{num_questions}件に対して{len(all_faqs)}件のみ生成されました。")
                 print(f"[WARNING] 重複または回答不可能な質問が多かったため、これ以上生成できませんでした。")
-                print(f"[WARNING] 除外されたウィンドウ数: {len(excluded_windows)}個")
+                print(f"[WARNING] 除外されたウィンドウ数: {window_sampler.excluded_count}個")
+            print(f"[DEBUG] 資料のカバー率: {window_sampler.coverage():.0%}")
 
             # 生成したFAQを履歴に保存して返す
             if all_faqs:
@@ -1568,7 +1987,7 @@ JSON配列のみを出力してください：
         """Claude API未設定時のモック FAQ 生成"""
         # 既存のFAQと承認待ちQ&Aを取得して重複を避ける
         existing_questions = [faq['question'] for faq in self.faq_data]
-        self.load_pending_qa()
+        self.refresh_pending_qa()
         pending_questions = [item['question'] for item in self.pending_qa if 'question' in item]
         all_existing_questions = existing_questions + pending_questions
         print(f"[DEBUG] モック生成 - 重複チェック対象: 既存FAQ {len(existing_questions)}件, 承認待ち {len(pending_questions)}件")
@@ -1719,7 +2138,7 @@ def admin_mode(faq):
                     new_question = input("\n新しい質問 (変更しない場合は空欄): ")
                     new_answer = input("新しい回答 (変更しない場合は空欄): ")
 
-                    if faq.edit_faq(index, new_question if new_question else None, new_answer if new_answer else None):
+                    if faq.edit_faq(current_faq['id'], new_question if new_question else None, new_answer if new_answer else None):
                         print("FAQを更新しました。")
                 else:
                     print("無効な番号です。")
@@ -1729,7 +2148,7 @@ def admin_mode(faq):
             faq.show_all_faqs()
             try:
                 index = int(input("\n削除するFAQ番号: ")) - 1
-                if faq.delete_faq(index):
+                if 0 <= index < len(faq.faq_data) and faq.delete_faq(faq.faq_data[index]['id']):
                     print("FAQを削除しました。")
                 else:
                     print("無効な番号です。")
@@ -1791,16 +2210,12 @@ def main():
                     print(f"\n現在の質問: {result['question']}")
                     print(f"現在の回答: {result['answer']}")
 
-                    # 該当するFAQのインデックスを見つける
-                    for i, faq_item in enumerate(faq.faq_data):
-                        if faq_item['question'] == result['question']:
-                            new_question = input("\n新しい質問 (変更しない場合は空欄): ")
-                            new_answer = input("新しい回答 (変更しない場合は空欄): ")
+                    new_question = input("\n新しい質問 (変更しない場合は空欄): ")
+                    new_answer = input("新しい回答 (変更しない場合は空欄): ")
 
-                            if faq.edit_faq(i, new_question if new_question else None, new_answer if new_answer else None):
-                                print("FAQを更新しました。")
-                                faq.save_faq_data()
-                            break
+                    if faq.edit_faq(result['id'], new_question if new_question else None, new_answer if new_answer else None):
+                        print("FAQを更新しました。")
+                        faq.save_faq_data()
                     break
                 else:
                     print("1、2、または 3 を入力してください。")
@@ -1824,6 +2239,7 @@ def find_similar_faqs(faq_system, question: str, threshold: float = 0.6, max_res
 
         if total_score >= threshold:
             similar_faqs.append({
+                'id': faq['id'],
                 'question': faq['question'],
                 'answer': faq['answer'],
                 'keywords': faq.get('keywords', ''),
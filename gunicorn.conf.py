@@ -0,0 +1,30 @@
+"""
+gunicorn の設定（本番用、Procfile から使用）
+
+- preload_app: マスターで wsgi.py を読み込み、モデル・インデックスを共有したままワーカーを fork する
+- ジョブのワーカースレッドは fork 後に各ワーカーで起動する（post_fork）
+- 管理画面からの書き込みは DATA_CHANGE_SIGNAL のファイルで他のワーカーに通知し、各ワーカーが再読み込みする
+- 複数プロセスから同時に書き込むため、ストレージは既定で SQLite（FAQ_STORAGE=csv で従来どおり）
+"""
+
+import multiprocessing
+import os
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+os.environ.setdefault('APP_PRELOAD', '1')
+os.environ.setdefault('DATA_CHANGE_SIGNAL', os.path.join(APP_DIR, '.data_version'))
+os.environ.setdefault('FAQ_STORAGE', 'sqlite')
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+worker_class = 'gthread'  # SSE の接続が1本ずつスレッドを使うため
+threads = int(os.getenv('WEB_THREADS', '8'))
+preload_app = True
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+
+
+def post_fork(server, worker):
+    from web_app import start_background_workers
+
+    start_background_workers()
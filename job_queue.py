@@ -0,0 +1,427 @@
+"""
+バックグラウンドジョブのキュー（SQLite）
+
+FAQ自動生成のような長時間の処理を、ジョブID付きで永続的なキューに積んで実行します。
+
+- ジョブの状態・進捗・結果は SQLite（WALモード）に保存され、再起動しても失われません
+- ワーカースレッド数は上限付き（JOB_WORKERS）。同じDBを使う複数プロセスでも、
+  1つのジョブを取り出せるのは1プロセスだけです（BEGIN IMMEDIATE で排他）
+- 結果は1件ずつ保存（add_result）するので、中断・異常終了しても途中までの結果が残ります
+- 実行中のジョブは定期的にハートビートを書き、途絶えたジョブ（プロセスが落ちた等）は
+  キューに戻して続きから再実行します（max_attempts 回まで）
+- キャンセルは別プロセスからでも反映されます（cancel_requested をハートビート時に確認）
+- submit_coalesced は同じキーのジョブが待機中・実行中・一定時間内に完了済みなら、新しく積まずにそのジョブへまとめます
+
+ジョブの状態: queued → running → completed / cancelled / error / interrupted（再実行の上限超過）
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+FINISHED_STATUSES = ('completed', 'cancelled', 'error', 'interrupted')
+
+
+class JobCancelled(Exception):
+    """ジョブがキャンセルされたことをハンドラーから通知するための例外"""
+
+
+class Job:
+    """ハンドラーに渡される実行中ジョブ（進捗・結果の保存とキャンセル確認）"""
+
+    def __init__(self, queue: 'JobQueue', row: sqlite3.Row):
+        self.queue = queue
+        self.id = row['id']
+        self.kind = row['kind']
+        self.params = json.loads(row['params'] or '{}')
+        self.attempt = row['attempts']
+        self.result_count = row['result_count']  # 前回までの実行分を含む保存済みの結果数
+        self.progress = json.loads(row['progress'] or '{}')
+        self.cancel_event = threading.Event()
+
+    def is_cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def update_progress(self, **fields) -> None:
+        self.progress.update(fields)
+        self.queue._write_progress(self.id, self.progress)
+
+    def add_result(self, payload: Dict) -> None:
+        """結果を1件保存（すぐにDBへ書き込む）"""
+        self.queue._add_result(self.id, payload)
+        self.result_count += 1
+
+
+class JobQueue:
+    """SQLite に永続化されるジョブキューと、上限付きのワーカースレッド"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress TEXT NOT NULL DEFAULT '{}',
+            error TEXT NOT NULL DEFAULT '',
+            result_count INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            owner TEXT,
+            heartbeat_at REAL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            dedupe_key TEXT,
+            coalesced INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+        CREATE TABLE IF NOT EXISTS job_results (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS job_results_job ON job_results (job_id, seq);
+    """
+
+    def __init__(self, db_path: str, workers: int = 2, heartbeat_interval: float = 5.0,
+                 stale_after: float = 60.0, max_attempts: int = 3):
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after  # この秒数ハートビートがない実行中ジョブは持ち主が落ちたとみなす
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, Callable[[Job], None]] = {}
+        self._finish_hooks: Dict[str, Callable[[Dict], None]] = {}
+        self._local = threading.local()
+        self._running: Dict[str, Job] = {}  # このプロセスで実行中のジョブ
+        self._running_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            # 既存のDBに後から追加した列
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'dedupe_key' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN dedupe_key TEXT')
+            if 'coalesced' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN coalesced INTEGER NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (kind, dedupe_key, created_at)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)  # トランザクションは明示的に張る
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def register(self, kind: str, handler: Callable[[Job], None], on_finish: Callable[[Dict], None] = None) -> None:
+        """ジョブ種別ごとの処理を登録
+
+        handler(job) は結果を job.add_result で保存する。
+        on_finish(job) はジョブが最終的に終わったとき（キャンセル・再実行の上限超過を含む）に1回呼ばれる。
+        """
+        self._handlers[kind] = handler
+        if on_finish is not None:
+            self._finish_hooks[kind] = on_finish
+
+    def _notify_finished(self, job_id: str) -> None:
+        job = self.get(job_id)
+        hook = self._finish_hooks.get(job['kind']) if job else None
+        if hook is not None:
+            try:
+                hook(job)
+            except Exception as e:
+                print(f"[WARNING] ジョブ終了処理でエラー {job_id}: {e}")
+
+    # --- 投入・参照・キャンセル ---
+
+    def submit(self, kind: str, params: Dict = None, progress: Dict = None) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        self._connect().execute(
+            'INSERT INTO jobs (id, kind, params, progress, created_at) VALUES (?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(params or {}, ensure_ascii=False),
+             json.dumps(progress or {}, ensure_ascii=False), time.time())
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def submit_coalesced(self, kind: str, dedupe_key: str, params: Dict = None, progress: Dict = None,
+                         window: float = 600.0) -> Tuple[str, bool]:
+        """同じ kind・dedupe_key のジョブが待機中・実行中、または window 秒以内に作られて成功していればそれにまとめる
+
+        (ジョブID, まとめたかどうか) を返す。失敗・キャンセルされたジョブにはまとめない。
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND dedupe_key = ? "
+                "AND (status IN ('queued', 'running') OR (status = 'completed' AND created_at >= ?)) "
+                "ORDER BY created_at DESC LIMIT 1", (kind, dedupe_key, time.time() - window)
+            ).fetchone()
+            if row is not None:
+                conn.execute('UPDATE jobs SET coalesced = coalesced + 1 WHERE id = ?', (row['id'],))
+                conn.execute('COMMIT')
+                return row['id'], True
+            job_id = uuid.uuid4().hex[:12]
+            conn.execute(
+                'INSERT INTO jobs (id, kind, params, progress, created_at, dedupe_key) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(params or {}, ensure_ascii=False),
+                 json.dumps(progress or {}, ensure_ascii=False), time.time(), dedupe_key)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id, False
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job['params'] = json.loads(job['params'] or '{}')
+        job['progress'] = json.loads(job['progress'] or '{}')
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def latest(self, kind: str = None) -> Optional[Dict]:
+        jobs = self.list_jobs(kind=kind, limit=1)
+        return jobs[0] if jobs else None
+
+    def list_jobs(self, kind: str = None, status: str = None, limit: int = 20) -> List[Dict]:
+        query = 'SELECT * FROM jobs'
+        conditions, args = [], []
+        if kind:
+            conditions.append('kind = ?')
+            args.append(kind)
+        if status:
+            conditions.append('status = ?')
+            args.append(status)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY created_at DESC LIMIT ?'
+        args.append(limit)
+        return [self._to_dict(row) for row in self._connect().execute(query, args)]
+
+    def results(self, job_id: str) -> List[Dict]:
+        rows = self._connect().execute('SELECT payload FROM job_results WHERE job_id = ? ORDER BY seq', (job_id,))
+        return [json.loads(row['payload']) for row in rows]
+
+    def cancel(self, job_id: str) -> bool:
+        """待機中なら即キャンセル、実行中なら中断を要求（途中までの結果は残る）。対象がなければFalse"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None or row['status'] in FINISHED_STATUSES:
+                conn.execute('COMMIT')
+                return False
+            if row['status'] == 'queued':
+                conn.execute("UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? WHERE id = ?",
+                             (time.time(), job_id))
+            else:
+                conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if row['status'] == 'queued':
+            self._notify_finished(job_id)
+        with self._running_lock:
+            job = self._running.get(job_id)
+        if job is not None:
+            job.cancel_event.set()
+        return True
+
+    def cancel_all(self, kind: str = None) -> int:
+        jobs = self.list_jobs(kind=kind, status='running', limit=1000) + self.list_jobs(kind=kind, status='queued', limit=1000)
+        return sum(1 for job in jobs if self.cancel(job['id']))
+
+    # --- 実行中ジョブの書き込み ---
+
+    def _write_progress(self, job_id: str, progress: Dict) -> None:
+        self._connect().execute('UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ?',
+                                (json.dumps(progress, ensure_ascii=False), time.time(), job_id))
+
+    def _add_result(self, job_id: str, payload: Dict) -> None:
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT INTO job_results (job_id, payload, created_at) VALUES (?, ?, ?)',
+                         (job_id, json.dumps(payload, ensure_ascii=False), time.time()))
+            conn.execute('UPDATE jobs SET result_count = result_count + 1 WHERE id = ?', (job_id,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # --- ワーカー ---
+
+    def start(self) -> None:
+        """ワーカースレッドとハートビートを開始（何度呼んでも1回だけ）"""
+        if self._threads:
+            return
+        # fork したワーカープロセスで起動する場合に備え、持ち主の識別子はこのプロセスのものにする
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.recover_stale()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._running_lock:
+            for job in self._running.values():
+                job.cancel_event.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def recover_stale(self) -> int:
+        """ハートビートが途絶えた実行中ジョブをキューに戻す（上限回数を超えたものは interrupted）
+
+        同じDBを共有する別のキュー（種類ごとにキューを分けている場合）のジョブには触れない
+        （終了時のフックはそのジョブを登録したキューにしか無いため）。
+        """
+        if not self._handlers:
+            return 0
+        threshold = time.time() - self.stale_after
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            stale = conn.execute(
+                "SELECT id, attempts, cancel_requested FROM jobs WHERE status = 'running' AND owner != ? "
+                "AND (heartbeat_at IS NULL OR heartbeat_at < ?) AND kind IN ({})".format(
+                    ','.join('?' * len(self._handlers))), [self.owner, threshold] + list(self._handlers)
+            ).fetchall()
+            for row in stale:
+                if row['cancel_requested']:
+                    status = 'cancelled'
+                elif row['attempts'] >= self.max_attempts:
+                    status = 'interrupted'
+                else:
+                    status = 'queued'
+                finished_at = None if status == 'queued' else time.time()
+                conn.execute('UPDATE jobs SET status = ?, owner = NULL, finished_at = ? WHERE id = ?',
+                             (status, finished_at, row['id']))
+                print(f"[WARNING] ジョブ {row['id']} の実行が途絶えていました（{status} に変更）")
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        for row in stale:
+            if self.get(row['id'])['status'] in FINISHED_STATUSES:
+                self._notify_finished(row['id'])
+        if stale:
+            with self._wakeup:
+                self._wakeup.notify_all()
+        return len(stale)
+
+    def _claim(self) -> Optional[Job]:
+        """最も古い待機中ジョブを1つ取り出して実行中にする（プロセス間でも1つのワーカーだけが取得）"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND kind IN ({}) ORDER BY created_at LIMIT 1".format(
+                    ','.join('?' * len(self._handlers))), list(self._handlers)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, attempts = attempts + 1, heartbeat_at = ?, "
+                "started_at = COALESCE(started_at, ?), error = '' WHERE id = ?",
+                (self.owner, now, now, row['id'])
+            )
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return Job(self, row)
+
+    def _finish(self, job: Job, status: str, error: str = '') -> None:
+        self._connect().execute(
+            'UPDATE jobs SET status = ?, error = ?, progress = ?, finished_at = ?, heartbeat_at = ? WHERE id = ? AND owner = ?',
+            (status, error, json.dumps(job.progress, ensure_ascii=False), time.time(), time.time(), job.id, self.owner)
+        )
+
+    def _run(self, job: Job) -> None:
+        with self._running_lock:
+            self._running[job.id] = job
+        if self.get(job.id)['cancel_requested']:
+            job.cancel_event.set()
+        print(f"[INFO] ジョブ開始: {job.id}（{job.kind}, {job.attempt}回目）")
+        try:
+            self._handlers[job.kind](job)
+            status, error = ('cancelled' if job.is_cancelled() else 'completed'), ''
+        except JobCancelled:
+            status, error = 'cancelled', ''
+        except Exception as e:
+            traceback.print_exc()
+            status, error = 'error', str(e)
+        finally:
+            with self._running_lock:
+                self._running.pop(job.id, None)
+        if self._stop.is_set() and status == 'cancelled' and not self.get(job.id)['cancel_requested']:
+            # プロセス終了による中断は、次に起動したワーカーが続きから実行する
+            self._connect().execute("UPDATE jobs SET status = 'queued', owner = NULL WHERE id = ?", (job.id,))
+            return
+        self._finish(job, status, error)
+        print(f"[INFO] ジョブ終了: {job.id}（{status}、結果 {job.result_count}件）")
+        self._notify_finished(job.id)
+
+    def _worker_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self._claim() if self._handlers else None
+            except sqlite3.Error as e:
+                print(f"[WARNING] ジョブの取り出しに失敗: {e}")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.heartbeat_interval)
+                continue
+            self._run(job)
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                with self._running_lock:
+                    running = dict(self._running)
+                if running:
+                    conn = self._connect()
+                    placeholders = ','.join('?' * len(running))
+                    conn.execute(f'UPDATE jobs SET heartbeat_at = ? WHERE id IN ({placeholders})',
+                                 [time.time()] + list(running))
+                    # 別プロセスからのキャンセル要求を反映
+                    for row in conn.execute(f'SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({placeholders})',
+                                            list(running)):
+                        running[row['id']].cancel_event.set()
+                self.recover_stale()
+            except sqlite3.Error as e:
+                print(f"[WARNING] ジョブのハートビート更新に失敗: {e}")
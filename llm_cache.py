@@ -0,0 +1,162 @@
+"""
+Claude API レスポンスのディスクキャッシュ
+
+同じモデル・プロンプト・temperature・max_tokens の呼び出しは同じ結果を再利用し、
+API の待ち時間と料金を省きます（同じ資料の再生成や、同じ不満足質問の自動改善など）。
+
+- キーは上記パラメータの SHA-256（内容アドレス方式）
+- 保存先は SQLite（WALモード）の1ファイルで、複数プロセスから共有できます
+- 有効期限（LLM_CACHE_TTL 秒）と件数上限（LLM_CACHE_MAX_ENTRIES、最近使っていないものから削除）
+- 途中で打ち切られた・呼び出し側で解釈できないレスポンスは保存しない（判定は llm_client 側）
+- LLM_CACHE=0 で無効化
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_cache.sqlite3')
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 2000
+
+
+def cache_key(model: str, prompt: str, temperature: Optional[float], max_tokens: int) -> str:
+    """キャッシュキー（呼び出しパラメータのハッシュ）"""
+    payload = json.dumps([model, prompt, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """有効期限と件数上限（LRU）付きのレスポンスキャッシュ"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL DEFAULT '',
+            body BLOB NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'bypasses': 0, 'stores': 0, 'expired': 0, 'evictions': 0, 'rejected': 0}
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def get(self, key: str) -> Optional[bytes]:
+        """キャッシュ済みのレスポンス本文（なければ・期限切れならNone）"""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute('SELECT body, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+                if row is not None and self.ttl and now - row[1] > self.ttl:
+                    conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    self._count('expired')
+                    row = None
+                if row is not None:
+                    conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+        except sqlite3.Error as e:
+            print(f"[WARNING] LLMキャッシュの読み込みに失敗: {e}")
+            row = None
+        if row is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return bytes(row[0])
+
+    def put(self, key: str, model: str, body: bytes) -> None:
+        """レスポンス本文を保存し、上限を超えた分を古い順に削除"""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO responses (key, model, body, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                             (key, model, body, now, now))
+                evicted = conn.execute(
+                    'DELETE FROM responses WHERE key IN '
+                    '(SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                ).rowcount
+        except sqlite3.Error as e:
+            print(f"[WARNING] LLMキャッシュへの保存に失敗: {e}")
+            return
+        self._count('stores')
+        if evicted > 0:
+            self._count('evictions', evicted)
+
+    def delete(self, key: str) -> None:
+        """get で返したが使えなかった（解釈できない）レスポンスを削除し、ヒットではなくミスとして数える"""
+        try:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+        except sqlite3.Error as e:
+            print(f"[WARNING] LLMキャッシュの削除に失敗: {e}")
+        with self._stats_lock:
+            self.stats['hits'] -= 1
+            self.stats['misses'] += 1
+            self.stats['rejected'] += 1
+
+    def record_bypass(self) -> None:
+        self._count('bypasses')
+
+    def clear(self) -> int:
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM responses').rowcount
+
+    def get_stats(self) -> Dict:
+        """ヒット率などの統計（監視用、カウンターはこのプロセス内の値）"""
+        entries = self._connect().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats.update({'entries': entries, 'max_entries': self.max_entries, 'ttl': self.ttl, 'path': self.db_path})
+        return stats
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """プロセス共有のキャッシュ（LLM_CACHE=0 なら None）"""
+    global _cache
+    if os.getenv('LLM_CACHE', '1').lower() in ('0', 'false', 'off'):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = LLMCache(
+                        os.getenv('LLM_CACHE_PATH') or DEFAULT_CACHE_PATH,
+                        ttl=float(os.getenv('LLM_CACHE_TTL', str(DEFAULT_TTL))),
+                        max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', str(DEFAULT_MAX_ENTRIES)))
+                    )
+                except Exception as e:
+                    print(f"[WARNING] LLMキャッシュを開けませんでした（キャッシュなしで続行）: {e}")
+                    return None
+    return _cache
@@ -0,0 +1,205 @@
+"""
+Claude API（Anthropic Messages API）呼び出し用の共有クライアント
+
+- requests.Session による keep-alive 接続プール（呼び出しごとのTCP/TLSハンドシェイクを省く）
+- トークンバケットによるプロセス全体のレート制限（LLM_RATE_LIMIT 回/秒、0で無制限）
+- 429 / 529 / 5xx と接続エラー・タイムアウトは、retry-after ヘッダーを優先しつつ
+  ジッター付き指数バックオフで再試行
+- 成功したレスポンスはディスクにキャッシュし、同じパラメータの呼び出しでは再利用（llm_cache.py）。
+  最後まで生成されたもの（max_tokens で打ち切られていない）で、呼び出し側の検査（cache_if）を
+  通ったものだけを保存する
+
+API キーと接続先ごとにプロセス内で1つのクライアントを共有します（get_llm_client）。
+ANTHROPIC_BASE_URL を変えるとローカルのスタブサーバー（llm_stub_server.py）に向けられます。
+"""
+
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_cache import cache_key, get_llm_cache
+from rate_limit import RateLimiter
+
+DEFAULT_MODEL = 'claude-3-haiku-20240307'
+DEFAULT_BASE_URL = 'https://api.anthropic.com'
+ANTHROPIC_VERSION = '2023-06-01'
+
+# 再試行するステータス（429: レート制限, 529: 過負荷, 5xx: サーバーエラー）
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+
+# 最後まで生成されたレスポンスの stop_reason（max_tokens は途中で打ち切られている）
+COMPLETE_STOP_REASONS = ('end_turn', 'stop_sequence')
+
+
+def response_text(result: Dict) -> str:
+    """Messages API のレスポンス（JSON）から本文のテキストを取り出す"""
+    return result['content'][0]['text']
+
+
+class ClaudeClient:
+    """接続プール・レート制限・再試行付きの Messages API クライアント"""
+
+    def __init__(self, api_key: str, base_url: str = None, rate_limit: float = None,
+                 max_retries: int = None, pool_size: int = None,
+                 backoff_base: float = 1.0, backoff_max: float = 30.0):
+        self.api_key = api_key
+        self.base_url = (base_url or os.getenv('ANTHROPIC_BASE_URL') or DEFAULT_BASE_URL).rstrip('/')
+        if rate_limit is None:
+            rate_limit = float(os.getenv('LLM_RATE_LIMIT', '0'))
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit > 0 else None
+        self.max_retries = int(os.getenv('LLM_MAX_RETRIES', '4')) if max_retries is None else max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        pool_size = pool_size or int(os.getenv('LLM_POOL_SIZE', '16'))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'x-api-key': api_key,
+            'anthropic-version': ANTHROPIC_VERSION
+        })
+
+        self._stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """次の再試行までの待ち時間（retry-after があればそれを優先）"""
+        if response is not None:
+            retry_after = response.headers.get('retry-after')
+            if retry_after:
+                try:
+                    return min(self.backoff_max, max(0.0, float(retry_after)))
+                except ValueError:
+                    try:
+                        retry_at = email.utils.parsedate_to_datetime(retry_after).timestamp()
+                        return min(self.backoff_max, max(0.0, retry_at - time.time()))
+                    except (TypeError, ValueError):
+                        pass
+        # フルジッター: 0 ～ min(上限, 基準 × 2^試行回数) の一様乱数
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def create_message(self, prompt: str, max_tokens: int, temperature: float = None,
+                       model: str = DEFAULT_MODEL, timeout: float = 60, use_cache: bool = True,
+                       cache_if: Callable[[str], bool] = None) -> requests.Response:
+        """Messages API を呼び出してレスポンスを返す
+
+        再試行しても成功しなかった場合は最後のレスポンスを返し（呼び出し側で status_code を確認）、
+        最後まで接続できなかった場合は最後の例外をそのまま送出します。
+        use_cache=False ではキャッシュを読まずに必ず呼び出します（同じプロンプトで別の結果が欲しい場合）。
+        結果はその場合もキャッシュに保存します。
+        cache_if(text): 本文のテキストを呼び出し側で解釈できる場合にTrueを返す関数。
+        Falseのレスポンスは保存せず、保存済みのものも使わない（解釈できない結果を繰り返し返さない）
+        """
+        cache = get_llm_cache()
+        key = cache_key(model, prompt, temperature, max_tokens) if cache is not None else None
+        if cache is not None:
+            if use_cache:
+                cached = cache.get(key)
+                if cached is not None:
+                    if self._cacheable(cached, cache_if):
+                        return self._cached_response(cached)
+                    cache.delete(key)
+            else:
+                cache.record_bypass()
+
+        response = self._post_with_retry(prompt, max_tokens, temperature, model, timeout)
+        if cache is not None and response.status_code == 200 and self._cacheable(response.content, cache_if):
+            cache.put(key, model, response.content)
+        return response
+
+    @staticmethod
+    def _cacheable(body: bytes, cache_if: Callable[[str], bool] = None) -> bool:
+        """最後まで生成され、呼び出し側の検査も通るレスポンスか"""
+        try:
+            result = json.loads(body)
+            if result.get('stop_reason') not in COMPLETE_STOP_REASONS:
+                return False
+            return cache_if is None or bool(cache_if(response_text(result)))
+        except Exception:
+            return False
+
+    def _cached_response(self, body: bytes) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        response.headers['Content-Type'] = 'application/json'
+        response.headers['x-llm-cache'] = 'hit'
+        response.encoding = 'utf-8'
+        response.url = f"{self.base_url}/v1/messages"
+        return response
+
+    def _post_with_retry(self, prompt: str, max_tokens: int, temperature: Optional[float],
+                         model: str, timeout: float) -> requests.Response:
+        data: Dict = {
+            'model': model,
+            'max_tokens': max_tokens,
+            'messages': [
+                {
+                    'role': 'user',
+                    'content': prompt
+                }
+            ]
+        }
+        if temperature is not None:
+            data['temperature'] = temperature
+        # JSONをダンプして確実にエスケープする
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            self._count('requests')
+
+            response = None
+            try:
+                response = self.session.post(f"{self.base_url}/v1/messages", data=body, timeout=timeout)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                reason = f"ステータス {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    self._count('failures')
+                    raise
+                reason = f"{type(e).__name__}: {e}"
+
+            if attempt >= self.max_retries:
+                self._count('failures')
+                return response
+
+            delay = self._backoff(attempt, response)
+            attempt += 1
+            self._count('retries')
+            print(f"[WARNING] Claude API 再試行 {attempt}/{self.max_retries}（{reason}）: {delay:.1f}秒後")
+            time.sleep(delay)
+
+
+_clients: Dict[tuple, ClaudeClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(api_key: str) -> ClaudeClient:
+    """APIキー・接続先ごとに共有のクライアントを返す（接続プールをプロセス内で使い回す）"""
+    key = (api_key, os.getenv('ANTHROPIC_BASE_URL') or DEFAULT_BASE_URL)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = ClaudeClient(api_key)
+                _clients[key] = client
+    return client
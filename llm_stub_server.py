@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Claude Messages API のローカルスタブサーバー（オフラインでの動作確認・スループット計測用）
+
+POST /v1/messages に対して、指定した遅延の後に Messages API と同じ形式のレスポンスを返します。
+本文はプロンプトから決まる疑似的なQ&AのJSON配列（5件）なので、FAQ自動生成もそのまま動きます。
+--error-rate を指定すると、その割合で 429（retry-after付き）/ 529 / 500 を返します。
+GET /stats で受信件数などを返します。
+
+使い方:
+    python llm_stub_server.py --port 8765 --latency 0.5 --error-rate 0.1
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 CLAUDE_API_KEY=dummy python web_app.py
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOPICS = ['申請料金', '審査期間', '面接の準備', '必要書類', '有効期限', '滞在期間', '延長手続き', '家族の同伴', '就労の可否', '再入国']
+VISA_TYPES = ['B-1', 'B-2', 'H-1B', 'L-1', 'E-2', 'F-1', 'J-1', 'O-1', 'ESTA']
+
+
+def fake_qa_text(prompt: str, count: int = 5) -> str:
+    """プロンプトのハッシュから決まる疑似Q&AのJSON配列"""
+    rng = random.Random(hashlib.sha1(prompt.encode('utf-8')).hexdigest())
+    items = []
+    for _ in range(count):
+        visa = rng.choice(VISA_TYPES)
+        topic = rng.choice(TOPICS)
+        items.append({
+            'question': f"{visa}ビザの{topic}について（{rng.randrange(100000)}）",
+            'answer': f"{visa}ビザの{topic}は状況により異なります。詳細は担当者にお問い合わせください。",
+            'keywords': f"{visa};{topic}",
+            'category': 'AI生成'
+        })
+    return json.dumps(items, ensure_ascii=False)
+
+
+class StubState:
+    """スタブサーバーの設定とカウンター"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, retry_after: float = 0.1, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'ok': 0, 'errors': 0, 'connections': 0}
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.counts[key] += 1
+
+    def pick_error(self):
+        with self.lock:
+            if self.rng.random() >= self.error_rate:
+                return None
+            return self.rng.choice([429, 529, 500])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive を有効にする
+    state: StubState = None
+
+    def setup(self):
+        super().setup()
+        # ヘッダーと本文を別々に書くため、keep-alive 接続で Nagle による遅延が出ないようにする
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.state.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            with self.state.lock:
+                self._send_json(200, dict(self.state.counts))
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length)
+        if self.path != '/v1/messages':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        self.state.count('requests')
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        error = self.state.pick_error()
+        if error is not None:
+            self.state.count('errors')
+            headers = {'retry-after': str(self.state.retry_after)} if error == 429 else None
+            self._send_json(error, {'type': 'error', 'error': {'type': 'stub_error', 'message': f'stub {error}'}}, headers)
+            return
+
+        try:
+            request = json.loads(raw.decode('utf-8'))
+            prompt = request['messages'][0]['content']
+        except (ValueError, KeyError, IndexError):
+            self._send_json(400, {'type': 'error', 'error': {'type': 'invalid_request_error'}})
+            return
+
+        self.state.count('ok')
+        self._send_json(200, {
+            'id': 'msg_stub',
+            'type': 'message',
+            'role': 'assistant',
+            'model': request.get('model', ''),
+            'content': [{'type': 'text', 'text': fake_qa_text(prompt)}],
+            'stop_reason': 'end_turn'
+        })
+
+
+def start_stub_server(port: int = 0, latency: float = 0.0, error_rate: float = 0.0, retry_after: float = 0.1):
+    """スタブサーバーをバックグラウンドスレッドで起動し、(サーバー, 状態) を返す（port=0 で空きポート）"""
+    state = StubState(latency, error_rate, retry_after)
+    handler = type('BoundStubHandler', (StubHandler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Claude Messages API のローカルスタブ')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='1リクエストあたりの応答遅延（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='429/529/500 を返す割合（0～1）')
+    parser.add_argument('--retry-after', type=float, default=0.1, help='429 の retry-after（秒）')
+    args = parser.parse_args()
+
+    server, _ = start_stub_server(args.port, args.latency, args.error_rate, args.retry_after)
+    print(f"スタブサーバー起動: http://127.0.0.1:{server.server_address[1]} (Ctrl+Cで終了)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""
+PDFから抽出したテキストの保存（ページ単位）
+
+PDFの解析（PyPDF2）は遅いため、抽出結果を「パス + 更新時刻 + サイズ」をキーに保存し、
+変更のない文書は stat() だけで前回の結果を返します。
+
+- テキストはページごとに、文書全体での開始位置（オフセット）と一緒に保存します
+- 抽出したページから順に保存するので、途中で中断しても次回は残りのページだけを読みます
+- 保存先は SQLite（WALモード）の1ファイル（PDF_TEXT_CACHE_PATH）、同じプロセス内ではメモリにも保持
+- 文書数の上限（PDF_TEXT_CACHE_MAX_DOCUMENTS、最近使っていないものから削除）
+
+抽出はページ範囲ごとに分けてプロセスプールで並列に行い（PDF_EXTRACT_WORKERS、1で逐次）、
+結果はページ順に組み立て直します。プールの子プロセスは spawn で起動します（スレッドの動いている
+gunicorn・ジョブのワーカーから fork すると、ロックを持ったまま複製されてデッドロックすることがあるため）。
+抽出方法は文書ごとに pypdf2（既定）/ pdfminer を選べます
+（既定は PDF_EXTRACTOR、pdfminer が入っていなければ pypdf2 を使います）。
+"""
+
+import bisect
+import io
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_text_cache.sqlite3')
+DEFAULT_MAX_DOCUMENTS = 50
+DEFAULT_SHARD_PAGES = 8  # 1つのワーカーにまとめて渡すページ数
+EXTRACTORS = ('pypdf2', 'pdfminer')
+PAGE_SEPARATOR = "\n"  # 従来どおり各ページの末尾に改行を付けて連結する
+
+
+class PDFText:
+    """ページごとのテキストと、連結後の全文での各ページの開始位置"""
+
+    def __init__(self, pages: List[str]):
+        self.pages = pages
+        self.offsets = []
+        position = 0
+        for page in pages:
+            self.offsets.append(position)
+            position += len(page) + len(PAGE_SEPARATOR)
+        self.length = position
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = ''.join(page + PAGE_SEPARATOR for page in self.pages)
+        return self._text
+
+    def page_at(self, offset: int) -> int:
+        """全文中の位置 offset を含むページ番号（0始まり）"""
+        return max(0, bisect.bisect_right(self.offsets, offset) - 1)
+
+
+def file_signature(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def count_pages(path: str) -> int:
+    import PyPDF2
+
+    with open(path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def _pypdf2_pages(path: str, start: int, end: int) -> List[str]:
+    import PyPDF2
+
+    with open(path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [reader.pages[page_no].extract_text() or "" for page_no in range(start, end)]
+
+
+def _pdfminer_pages(path: str, start: int, end: int) -> List[str]:
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    texts = []
+    manager = PDFResourceManager()
+    with open(path, 'rb') as file:
+        for page in PDFPage.get_pages(file, pagenos=set(range(start, end))):
+            output = io.BytesIO()
+            device = TextConverter(manager, output, codec='utf-8', laparams=LAParams())
+            PDFPageInterpreter(manager, device).process_page(page)
+            device.close()
+            texts.append(output.getvalue().decode('utf-8'))
+    return texts
+
+
+def extract_page_range(path: str, start: int, end: int, extractor: str = 'pypdf2') -> Tuple[int, List[str]]:
+    """ページ start～end-1 のテキストを抽出（プロセスプールのワーカーから呼ばれる）"""
+    if extractor == 'pdfminer':
+        return start, _pdfminer_pages(path, start, end)
+    return start, _pypdf2_pages(path, start, end)
+
+
+def resolve_extractor(extractor: Optional[str]) -> str:
+    """抽出方法の名前を決める（未指定なら PDF_EXTRACTOR、pdfminer が使えなければ pypdf2）"""
+    extractor = (extractor or os.getenv('PDF_EXTRACTOR') or 'pypdf2').lower()
+    if extractor not in EXTRACTORS:
+        print(f"[WARNING] 不明なPDF抽出方法です（pypdf2を使用）: {extractor}")
+        return 'pypdf2'
+    if extractor == 'pdfminer':
+        try:
+            import pdfminer.pdfpage  # noqa: F401
+        except ImportError:
+            print("[WARNING] pdfminer がインストールされていません（pypdf2を使用）")
+            return 'pypdf2'
+    return extractor
+
+
+def default_workers() -> int:
+    return max(1, int(os.getenv('PDF_EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1)))))
+
+
+class PDFTextStore:
+    """PDFの抽出テキストをページ単位で保存するストア"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            extractor TEXT NOT NULL DEFAULT 'pypdf2',
+            page_count INTEGER NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS pages (
+            path TEXT NOT NULL,
+            page_no INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (path, page_no)
+        );
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH, max_documents: int = DEFAULT_MAX_DOCUMENTS):
+        self.db_path = db_path
+        self.max_documents = max_documents
+        self._local = threading.local()
+        self._memory: Dict[str, Tuple[Tuple[int, int], PDFText]] = {}
+        self._memory_lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'extracted_pages': 0}
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(documents)')]
+            if 'extractor' not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN extractor TEXT NOT NULL DEFAULT 'pypdf2'")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _load_pages(self, path: str, signature: Tuple[int, int], extractor: str) -> Tuple[Optional[int], List[str]]:
+        """保存済みのページ（署名か抽出方法が変わっていれば破棄）。(総ページ数, 先頭から連続して保存済みのページ)"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT mtime_ns, size, page_count, extractor FROM documents WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                return None, []
+            if (row[0], row[1]) != signature or row[3] != extractor:
+                conn.execute('DELETE FROM pages WHERE path = ?', (path,))
+                conn.execute('DELETE FROM documents WHERE path = ?', (path,))
+                return None, []
+            conn.execute('UPDATE documents SET accessed_at = ? WHERE path = ?', (time.time(), path))
+            rows = conn.execute('SELECT page_no, text FROM pages WHERE path = ? ORDER BY page_no', (path,)).fetchall()
+        pages = []
+        for page_no, text in rows:
+            if page_no != len(pages):
+                break
+            pages.append(text)
+        return row[2], pages
+
+    def _begin_document(self, path: str, signature: Tuple[int, int], extractor: str, page_count: int) -> None:
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO documents (path, mtime_ns, size, extractor, page_count, accessed_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (path, signature[0], signature[1], extractor, page_count, time.time()))
+            # 上限を超えた文書は最近使っていないものから削除
+            stale = [r[0] for r in conn.execute(
+                'SELECT path FROM documents ORDER BY accessed_at DESC LIMIT -1 OFFSET ?', (self.max_documents,))]
+            for stale_path in stale:
+                conn.execute('DELETE FROM pages WHERE path = ?', (stale_path,))
+                conn.execute('DELETE FROM documents WHERE path = ?', (stale_path,))
+
+    def _save_pages(self, path: str, start: int, pages: List[str], offset: int) -> None:
+        rows = []
+        for i, text in enumerate(pages):
+            rows.append((path, start + i, offset, text))
+            offset += len(text) + len(PAGE_SEPARATOR)
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO pages (path, page_no, offset, text) VALUES (?, ?, ?, ?)', rows)
+
+    def get(self, pdf_path: str, extractor: str = None, workers: int = None,
+            progress: Callable[[int, int], None] = None) -> PDFText:
+        """PDFのテキストを返す（変更がなければ保存済みの結果、あれば未保存のページだけ抽出）
+
+        progress(抽出済みページ数, 総ページ数) は抽出したページ範囲ごとに呼ばれます。
+        """
+        path = os.path.abspath(pdf_path)
+        extractor = resolve_extractor(extractor)
+        signature = file_signature(path)
+
+        with self._memory_lock:
+            cached = self._memory.get((path, extractor))
+        if cached is not None and cached[0] == signature:
+            self.stats['memory_hits'] += 1
+            return cached[1]
+
+        try:
+            page_count, pages = self._load_pages(path, signature, extractor)
+        except sqlite3.Error as e:
+            print(f"[WARNING] PDFテキストキャッシュの読み込みに失敗: {e}")
+            page_count, pages = None, []
+
+        if page_count is not None and len(pages) == page_count:
+            self.stats['disk_hits'] += 1
+        else:
+            pages = self._extract(path, signature, extractor, pages,
+                                  default_workers() if workers is None else workers, progress)
+
+        document = PDFText(pages)
+        with self._memory_lock:
+            self._memory[(path, extractor)] = (signature, document)
+            while len(self._memory) > self.max_documents:
+                self._memory.pop(next(iter(self._memory)))
+        return document
+
+    def _extract(self, path: str, signature: Tuple[int, int], extractor: str, pages: List[str],
+                 workers: int, progress: Callable[[int, int], None] = None) -> List[str]:
+        """未保存のページをページ範囲ごとに抽出し、先頭から揃った分を順に保存する"""
+        page_count = count_pages(path)
+        pages = pages[:page_count]
+        saved_pages = len(pages)
+        if pages:
+            print(f"[DEBUG] PDFテキスト: 保存済み {saved_pages}/{page_count} ページの続きから抽出します")
+        persist = True
+        try:
+            self._begin_document(path, signature, extractor, page_count)
+        except sqlite3.Error as e:
+            print(f"[WARNING] PDFテキストキャッシュに保存できません（抽出は続行）: {e}")
+            persist = False
+
+        shard_pages = max(1, int(os.getenv('PDF_EXTRACT_SHARD_PAGES', str(DEFAULT_SHARD_PAGES))))
+        ranges = [(start, min(start + shard_pages, page_count)) for start in range(saved_pages, page_count, shard_pages)]
+        finished = {}  # 先頭のページ番号 → 抽出済みで、まだ前のページが揃っていない範囲のテキスト
+        offset = sum(len(page) + len(PAGE_SEPARATOR) for page in pages)
+        done_pages = saved_pages
+
+        def collect(start: int, texts: List[str]) -> None:
+            nonlocal persist, offset, done_pages
+            finished[start] = texts
+            done_pages += len(texts)
+            # 前から順に揃った範囲だけを連結・保存する（途中で止まっても保存済みの部分は先頭から連続）
+            while len(pages) in finished:
+                batch = finished.pop(len(pages))
+                if persist:
+                    try:
+                        self._save_pages(path, len(pages), batch, offset)
+                    except sqlite3.Error as e:
+                        print(f"[WARNING] PDFテキストキャッシュへの保存に失敗: {e}")
+                        persist = False
+                offset += sum(len(page) + len(PAGE_SEPARATOR) for page in batch)
+                pages.extend(batch)
+            if progress:
+                progress(done_pages, page_count)
+
+        if workers > 1 and len(ranges) > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=min(workers, len(ranges)),
+                                         mp_context=multiprocessing.get_context('spawn')) as executor:
+                    futures = [executor.submit(extract_page_range, path, start, end, extractor) for start, end in ranges]
+                    for future in as_completed(futures):
+                        collect(*future.result())
+            except (OSError, BrokenProcessPool) as e:
+                print(f"[WARNING] PDFの並列抽出に失敗しました（逐次で続行）: {e}")
+        for start, end in ranges:
+            if start >= len(pages) and start not in finished:
+                collect(*extract_page_range(path, start, end, extractor))
+
+        self.stats['extracted_pages'] += page_count - saved_pages
+        return pages
+
+
+_store: Optional[PDFTextStore] = None
+_store_lock = threading.Lock()
+
+
+def get_pdf_text_store() -> PDFTextStore:
+    """プロセス共有のストア"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PDFTextStore(
+                    os.getenv('PDF_TEXT_CACHE_PATH') or DEFAULT_CACHE_PATH,
+                    max_documents=int(os.getenv('PDF_TEXT_CACHE_MAX_DOCUMENTS', str(DEFAULT_MAX_DOCUMENTS)))
+                )
+    return _store
@@ -0,0 +1,45 @@
+"""
+トークンバケット方式のレート制限
+
+Claude API への同時リクエストが一度に集中しないよう、1秒あたりの呼び出し回数を制限します。
+複数スレッドから同じインスタンスを共有して使えます。
+"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    """1秒あたり rate 回まで（瞬間的には burst 回まで）許可するトークンバケット"""
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst if burst is not None else max(1, rate)))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """トークンを1つ取得できれば0を、できなければ次に取得できるまでの秒数を返す"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, stop_event: threading.Event = None) -> bool:
+        """トークンを取得するまで待機（stop_event がセットされたら取得せずにFalse）"""
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return True
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
@@ -0,0 +1,169 @@
+"""
+参考資料（reference_docs/）のチャンク検索インデックス
+
+参考資料を全文連結して先頭10,000文字で切る代わりに、資料を数百文字ごとのチャンクに分け、
+ユーザーの質問に関係するチャンクだけを上位K件・文字数の上限内でプロンプトに入れます。
+
+- スコアは文字2-gramの BM25（日本語は空白で区切れないため n-gram を索引語にする）
+- インデックスは一度だけ構築し、資料ファイルの追加・削除・更新（更新時刻とサイズ）を検知したら作り直す
+- PDF のテキストは pdf_text のキャッシュから取り出し、チャンクにページ番号を付ける
+"""
+
+import heapq
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from pdf_text import get_pdf_text_store
+
+TEXT_EXTENSIONS = ('.txt', '.md', '.markdown')
+DEFAULT_CHUNK_CHARS = 600
+DEFAULT_OVERLAP_CHARS = 100
+DEFAULT_TOP_K = 5
+DEFAULT_BUDGET_CHARS = 3000  # プロンプトに入れる参考資料の上限（日本語はおおよそ1文字1トークン）
+
+
+def bigram_counts(text: str) -> Counter:
+    """空白を除いた文字2-gramの出現回数"""
+    text = ''.join(text.lower().split())
+    return Counter(text[i:i + 2] for i in range(len(text) - 1))
+
+
+def split_chunks(text: str, chunk_chars: int = DEFAULT_CHUNK_CHARS,
+                 overlap_chars: int = DEFAULT_OVERLAP_CHARS) -> List[Tuple[int, str]]:
+    """テキストを重なりのあるチャンクに分割（なるべく「。」か改行で区切る）。(開始位置, テキスト) のリスト"""
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(length, start + chunk_chars)
+        if end < length:
+            # 後ろ2割の範囲に文の区切りがあればそこで切る
+            boundary = max(text.rfind('。', start + chunk_chars * 4 // 5, end),
+                           text.rfind('\n', start + chunk_chars * 4 // 5, end))
+            if boundary > start:
+                end = boundary + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append((start, chunk))
+        if end >= length:
+            break
+        start = max(start + 1, end - overlap_chars)
+    return chunks
+
+
+class ReferenceIndex:
+    """参考資料チャンクの BM25 インデックス"""
+
+    def __init__(self, reference_dir: str, chunk_chars: int = DEFAULT_CHUNK_CHARS,
+                 overlap_chars: int = DEFAULT_OVERLAP_CHARS, k1: float = 1.5, b: float = 0.75):
+        self.reference_dir = reference_dir
+        self.chunk_chars = chunk_chars
+        self.overlap_chars = overlap_chars
+        self.k1 = k1
+        self.b = b
+        self.chunks: List[Dict] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+        self.average_length = 0.0
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def _directory_signature(self) -> tuple:
+        if not os.path.isdir(self.reference_dir):
+            return ()
+        entries = []
+        for filename in sorted(os.listdir(self.reference_dir)):
+            if not filename.endswith(TEXT_EXTENSIONS + ('.pdf',)):
+                continue
+            stat = os.stat(os.path.join(self.reference_dir, filename))
+            entries.append((filename, stat.st_mtime_ns, stat.st_size))
+        return tuple(entries)
+
+    def _read_documents(self) -> List[Dict]:
+        """資料ごとのチャンク（ファイル名・ページ番号付き）"""
+        chunks = []
+        for filename, _, _ in self._signature:
+            file_path = os.path.join(self.reference_dir, filename)
+            try:
+                if filename.endswith('.pdf'):
+                    document = get_pdf_text_store().get(file_path)
+                    for start, text in split_chunks(document.text, self.chunk_chars, self.overlap_chars):
+                        chunks.append({'source': filename, 'page': document.page_at(start) + 1, 'text': text})
+                else:
+                    try:
+                        with open(file_path, 'r', encoding='utf-8') as f:
+                            content = f.read()
+                    except UnicodeDecodeError:
+                        # UTF-8で読めない場合はcp932（Shift_JIS）で試す
+                        with open(file_path, 'r', encoding='cp932') as f:
+                            content = f.read()
+                    for _, text in split_chunks(content, self.chunk_chars, self.overlap_chars):
+                        chunks.append({'source': filename, 'page': None, 'text': text})
+            except Exception as e:
+                print(f"[WARNING] 参考資料の読み込みに失敗 {filename}: {e}")
+        return chunks
+
+    def refresh(self) -> bool:
+        """資料が変わっていればインデックスを作り直す（作り直した場合はTrue）"""
+        signature = self._directory_signature()
+        if signature == self._signature:
+            return False
+        with self._lock:
+            if signature == self._signature:
+                return False
+            self._signature = signature
+            chunks = self._read_documents()
+            postings = defaultdict(list)
+            lengths = []
+            for chunk_id, chunk in enumerate(chunks):
+                counts = bigram_counts(chunk['text'])
+                lengths.append(sum(counts.values()))
+                for term, tf in counts.items():
+                    postings[term].append((chunk_id, tf))
+            # 検索側は一度に差し替えたものだけを見る
+            self.chunks, self.postings, self.lengths = chunks, dict(postings), lengths
+            self.average_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        print(f"[INFO] 参考資料インデックスを構築: {len(signature)}ファイル, {len(chunks)}チャンク")
+        return True
+
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K, budget_chars: int = DEFAULT_BUDGET_CHARS) -> List[Dict]:
+        """質問に関係の深いチャンクを最大 top_k 件、合計 budget_chars 文字以内で返す（スコア順）"""
+        self.refresh()
+        chunks, postings, lengths, average_length = self.chunks, self.postings, self.lengths, self.average_length
+        total = len(chunks)
+        if total == 0:
+            return []
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term in bigram_counts(query):
+            rows = postings.get(term)
+            if not rows:
+                continue
+            idf = math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+            for chunk_id, tf in rows:
+                norm = self.k1 * (1 - self.b + self.b * lengths[chunk_id] / average_length)
+                scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        results = []
+        used = 0
+        for chunk_id, score in heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0])):
+            text = chunks[chunk_id]['text']
+            if used + len(text) > budget_chars:
+                if results:
+                    break
+                text = text[:budget_chars]  # 1件目が上限を超える場合は切り詰めて入れる
+            results.append(dict(chunks[chunk_id], text=text, score=round(score, 3)))
+            used += len(text)
+        return results
+
+
+def format_reference_context(chunks: List[Dict]) -> str:
+    """検索結果をプロンプト用の文字列にする"""
+    parts = []
+    for chunk in chunks:
+        location = f"{chunk['source']} p.{chunk['page']}" if chunk.get('page') else chunk['source']
+        parts.append(f"=== {location} ===\n{chunk['text']}")
+    return "\n\n".join(parts)
@@ -0,0 +1,259 @@
+"""
+FAQ検索用の文字n-gram転置インデックスとキーワードマッチャー
+
+日本語の質問は空白で単語に区切れないため、文字の2-gram/3-gramを索引語として使います。
+索引はFAQのIDをキーにしており、起動時に一度だけ構築した後は、FAQの追加・編集・削除の
+たびに該当FAQのn-gramだけを更新します。検索時は、質問と共有するn-gramの重みに
+キーワード欄・キーワードカテゴリのボーナスを加えた推定スコアの上位K件だけを候補として
+返します。候補の並べ替え（SequenceMatcher + キーワードスコア）は FAQSystem.search_faq 側で行います。
+
+キーワードスコアのカテゴリ（料金・時間・面接・書類・サービス）は、起動時に一つの
+正規表現にまとめてコンパイルしておき、FAQ側のカテゴリ判定は読み込み時に済ませます。
+"""
+
+import heapq
+import math
+import re
+from collections import defaultdict
+from typing import Dict, List
+
+
+def char_ngrams(text: str, sizes: tuple = (2, 3)) -> set:
+    """文字列から文字n-gramの集合を作成"""
+    grams = set()
+    for n in sizes:
+        if len(text) < n:
+            continue
+        for i in range(len(text) - n + 1):
+            grams.add(text[i:i + n])
+    return grams
+
+
+class NgramIndex:
+    """文字n-gram（とキーワード欄・キーワードカテゴリ）→ FAQ ID の転置インデックス
+
+    索引語は文字n-gramの文字列のほか、キーワード欄の各キーワード ('kw', キーワード) と
+    キーワードカテゴリ ('cat', カテゴリ) のタプルです。
+    更新（add / update / remove）は呼び出し側で直列化します。検索（candidates）はロックなしで
+    更新と同時に呼ばれてもよく、その場合は更新前後どちらかの内容で候補を返します。
+    """
+
+    def __init__(self, faq_data: list = (), sizes: tuple = (2, 3), max_df_ratio: float = 0.3):
+        self.sizes = sizes
+        self.max_df_ratio = max_df_ratio  # これより多くのFAQに出現するn-gramは候補が足りる限り無視
+        self.postings: Dict[object, List[int]] = defaultdict(list)
+        self.categories_of: Dict[int, frozenset] = {}  # FAQ ID → キーワードカテゴリ（候補のボーナス計算用）
+        self.max_keyword_length = 0  # 索引したキーワードの最大文字数（クエリ内のキーワード探索の範囲）
+        self.size = 0  # 索引済みのFAQ件数
+
+        for faq in faq_data:
+            for term in self._terms(faq):
+                self.postings[term].append(faq['id'])
+            self.size += 1
+        self.postings = dict(self.postings)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _terms(self, faq: dict) -> set:
+        """FAQの索引語（categories_of と max_keyword_length もここで更新する）"""
+        keywords = faq.get('keywords', '')
+        terms = char_ngrams(f"{faq['question']} {keywords}".lower(), self.sizes)
+        csv_keywords, _, categories = keyword_features(faq['question'], keywords)
+        for keyword in csv_keywords:
+            terms.add(('kw', keyword))
+            self.max_keyword_length = max(self.max_keyword_length, len(keyword))
+        for category in categories:
+            terms.add(('cat', category))
+        self.categories_of[faq['id']] = categories
+        return terms
+
+    def add(self, faq: dict) -> None:
+        self._index(faq['id'], self._terms(faq))
+        self.size += 1
+
+    def update(self, old: dict, new: dict) -> None:
+        """編集されたFAQの索引を更新（変わった索引語だけ付け替える）"""
+        previous, terms = self._terms(old), self._terms(new)
+        if terms != previous:
+            self._unindex(old['id'], previous - terms)
+            self._index(new['id'], terms - previous)
+
+    def remove(self, faq: dict) -> None:
+        self._unindex(faq['id'], self._terms(faq))
+        self.categories_of.pop(faq['id'], None)
+        self.size -= 1
+
+    def _index(self, faq_id: int, grams) -> None:
+        for gram in grams:
+            rows = self.postings.get(gram)
+            if rows is None:
+                self.postings[gram] = [faq_id]
+            else:
+                rows.append(faq_id)
+
+    def _unindex(self, faq_id: int, grams) -> None:
+        for gram in grams:
+            rows = self.postings.get(gram)
+            if rows is None:
+                continue
+            if len(rows) == 1 and rows[0] == faq_id:
+                del self.postings[gram]
+            elif faq_id in rows:
+                rows.remove(faq_id)
+
+    def candidates(self, query: str, limit: int) -> List[int]:
+        """推定スコアが大きい上位limit件のFAQ IDを返す
+
+        推定スコアは、クエリと共有するn-gramの重み（IDF）の合計をクエリ側の合計で割ったもの
+        （文字列類似度の目安、0〜1）に、search_faq と同じキーワード欄（+0.8）・カテゴリのボーナスを
+        足したものです。n-gramを共有しなくても、キーワード欄のキーワードを含むFAQは必ず候補にし、
+        カテゴリが一致するFAQは候補が limit 件に満たない場合に補います。
+        戻り値はIDの昇順（IDは追加順なので、全件走査と同じ順序で再スコアリングできる）。
+        """
+        total = self.size
+        if total == 0:
+            return []
+
+        query = query.lower()
+        postings = [(gram, self.postings.get(gram)) for gram in char_ngrams(query, self.sizes)]
+        postings = [(gram, rows) for gram, rows in postings if rows]
+        # 出現頻度の低い（情報量の多い）n-gramから処理
+        postings.sort(key=lambda item: len(item[1]))
+        max_df = max(1, int(total * self.max_df_ratio))
+
+        scores: Dict[int, float] = defaultdict(float)
+        query_weight = 0.0
+        for gram, rows in postings:
+            df = len(rows)
+            if not df:
+                continue
+            weight = math.log(1 + total / df)
+            query_weight += weight
+            if df > max_df and len(scores) >= limit:
+                # ありふれたn-gram（「ビザ」など）は候補が既に十分あれば走査しない
+                continue
+            for faq_id in rows:
+                scores[faq_id] += weight
+        if query_weight:
+            for faq_id in scores:
+                scores[faq_id] /= query_weight
+
+        # クエリに含まれるキーワード欄のキーワード（1つにつき +0.8）
+        longest = min(self.max_keyword_length, len(query))
+        keywords = {query[start:start + length] for length in range(1, longest + 1)
+                    for start in range(len(query) - length + 1)}
+        for keyword in keywords:
+            for faq_id in self.postings.get(('kw', keyword), ()):
+                scores[faq_id] += 0.8
+
+        # クエリとFAQの両方に出てくるキーワードカテゴリのボーナス
+        user_hits = KEYWORD_MATCHER.match(query)
+        rules = [(category, bonus) for category, bonus, _ in KEYWORD_RULES if category in user_hits]
+        if rules:
+            for category, _ in rules:
+                if len(scores) >= limit:
+                    break
+                for faq_id in self.postings.get(('cat', category), ()):
+                    scores.setdefault(faq_id, 0.0)
+            categories_of = self.categories_of
+            for faq_id in scores:
+                categories = categories_of.get(faq_id, ())
+                scores[faq_id] += sum(bonus for category, bonus in rules if category in categories)
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return sorted(faq_id for faq_id, _ in top)
+
+
+# キーワードカテゴリ（get_keyword_score で使用）
+KEYWORD_CATEGORIES = {
+    # 料金関連キーワード
+    'money': ['料金', '費用', 'お金', '金額', '価格', '値段', 'コスト', '費用'],
+    # 時間関連キーワード
+    'time': ['時間', '期間', '日数', 'いつ', '何日', '何週間', '何か月'],
+    # 面接関連キーワード
+    'interview': ['面接', '面談', 'インタビュー'],
+    # 書類関連キーワード
+    'document': ['書類', '必要', '資料', 'ドキュメント', '準備'],
+    # サービス関連キーワード
+    'service': ['サービス', '範囲', 'サポート', 'どこまで'],
+}
+
+# (カテゴリ, 一致時のボーナス, FAQ質問に含まれると減点するカテゴリ)
+# 加算順は従来の get_keyword_score と同じ（浮動小数点の結果を一致させるため）
+KEYWORD_RULES = [
+    ('money', 0.3, 'time'),
+    ('time', 0.3, 'money'),
+    ('interview', 0.3, None),
+    ('document', 0.2, None),
+    ('service', 0.2, None),
+]
+
+
+class KeywordMatcher:
+    """複数カテゴリのキーワードを1回の走査で検出するマッチャー"""
+
+    def __init__(self, categories: Dict[str, List[str]]):
+        keywords = sorted({kw for words in categories.values() for kw in words}, key=len, reverse=True)
+        # 先読みで各位置の最長キーワードを取得（重なったキーワードも取りこぼさない）
+        self.pattern = re.compile('(?=(' + '|'.join(re.escape(kw) for kw in keywords) + '))')
+        # 最長一致したキーワードの接頭辞になっている短いキーワードのカテゴリもまとめて引けるようにする
+        self.categories_by_keyword = {
+            keyword: frozenset(
+                category for category, words in categories.items()
+                if any(keyword.startswith(word) for word in words)
+            )
+            for keyword in keywords
+        }
+        self.category_count = len(categories)
+
+    def match(self, text: str) -> frozenset:
+        """テキストに含まれるキーワードのカテゴリ集合を返す"""
+        hits = set()
+        for m in self.pattern.finditer(text):
+            hits |= self.categories_by_keyword[m.group(1)]
+            if len(hits) == self.category_count:
+                break
+        return frozenset(hits)
+
+
+KEYWORD_MATCHER = KeywordMatcher(KEYWORD_CATEGORIES)
+
+
+def keyword_features(faq_question: str, faq_keywords: str = '') -> tuple:
+    """FAQ側のキーワード特徴量を計算（読み込み時に一度だけ）
+
+    戻り値: (CSVキーワードのリスト, 質問文のカテゴリ集合, 質問文+キーワード欄のカテゴリ集合)
+    """
+    csv_keywords = []
+    if faq_keywords:
+        # セミコロン区切りのキーワードを分割
+        csv_keywords = [kw for kw in (kw.strip().lower() for kw in faq_keywords.split(';')) if kw]
+    question_hits = KEYWORD_MATCHER.match(faq_question.lower())
+    keyword_hits = KEYWORD_MATCHER.match(faq_keywords.lower())
+    return (csv_keywords, question_hits, question_hits | keyword_hits)
+
+
+def keyword_score(user_lower: str, user_hits: frozenset, features: tuple) -> float:
+    """ユーザー質問のカテゴリ集合とFAQの特徴量からキーワードスコアを計算"""
+    csv_keywords, question_hits, faq_hits = features
+
+    # キーワードマッチのボーナススコア
+    score = 0.0
+
+    # CSVのキーワードフィールドを活用
+    for keyword in csv_keywords:
+        if keyword in user_lower:
+            score += 0.8  # CSVのキーワード完全マッチに高いスコア
+
+    if not user_hits:
+        return score
+
+    for category, bonus, conflicting in KEYWORD_RULES:
+        if category in user_hits:
+            if category in faq_hits:
+                score += bonus
+            elif conflicting is not None and conflicting in question_hits:
+                score -= 0.2
+
+    return score
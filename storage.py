@@ -0,0 +1,715 @@
+"""
+FAQ・承認待ちQ&A・不満足フィードバック・生成履歴の永続化
+
+Storage を共通インターフェースとして、次の2種類を用意しています。
+  - CSVStorage:    従来どおりのCSVファイル（FAQ・承認待ちの更新はファイル全体の書き直し）
+  - SQLiteStorage: SQLite（WALモード）の1ファイル。追加・更新・削除は1行ずつのトランザクションで、
+                   書き込み途中で落ちても直前の状態が残ります
+
+どちらを使うかは環境変数 FAQ_STORAGE=csv|sqlite で切り替えます（既定は csv）。
+SQLite を初めて開いたときは、同じディレクトリの既存CSVから自動で移行します。
+管理画面のバックアップ（ZIPのエクスポート/インポート）はどちらの場合もCSV形式です。
+FAQは id 列の整数IDで識別します（id 列の無い従来のCSVは読み込み時に行順でIDを振ります）。
+
+手動で移行する場合:
+    python storage.py faq_data-1.csv --db faq_data-1.sqlite3
+"""
+
+import csv
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+FAQ_FIELDS = ['id', 'question', 'answer', 'keywords', 'category']
+PENDING_FIELDS = ['id', 'question', 'answer', 'keywords', 'category', 'created_at', 'user_question', 'confirmation_request', 'comment']
+UNSATISFIED_FIELDS = ['timestamp', 'user_question', 'matched_question', 'matched_answer']
+HISTORY_FIELDS = ['timestamp', 'question', 'answer']
+
+# バックアップZIP内のファイル名（従来のCSVファイル名と同じ）
+BACKUP_FILES = {
+    'faq': 'faq_data-1.csv',
+    'pending': 'pending_qa.csv',
+    'unsatisfied': 'unsatisfied_qa.csv',
+}
+
+
+def _faq_id(value) -> Optional[int]:
+    try:
+        faq_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return faq_id if faq_id > 0 else None
+
+
+def _faq_row(row: Dict) -> Dict:
+    return {
+        'id': _faq_id(row.get('id')),
+        'question': (row.get('question') or '').strip(),
+        'answer': (row.get('answer') or '').strip(),
+        'keywords': (row.get('keywords') or '').strip(),
+        'category': (row.get('category') or '一般').strip()
+    }
+
+
+def assign_faq_ids(faqs: List[Dict], next_id: int = 1) -> int:
+    """IDの無い（または重複した）FAQに新しいIDを振り、次に使うIDを返す
+
+    IDの無い行は並び順に max(既存ID)+1 から振るので、同じCSVからはどのプロセスでも同じIDになります。
+    """
+    seen = set()
+    missing = []
+    for faq in faqs:
+        faq_id = _faq_id(faq.get('id'))
+        if faq_id is None or faq_id in seen:
+            missing.append(faq)
+        else:
+            faq['id'] = faq_id
+            seen.add(faq_id)
+    next_id = max(next_id, max(seen, default=0) + 1)
+    for faq in missing:
+        faq['id'] = next_id
+        next_id += 1
+    return next_id
+
+
+def _pending_row(row: Dict) -> Dict:
+    return {
+        'id': row.get('id') or '',
+        'question': (row.get('question') or '').strip(),
+        'answer': (row.get('answer') or '').strip(),
+        'keywords': (row.get('keywords') or '').strip(),
+        'category': (row.get('category') or '一般').strip(),
+        'created_at': row.get('created_at') or '',
+        'user_question': (row.get('user_question') or '').strip(),
+        'confirmation_request': (row.get('confirmation_request') or '0').strip(),
+        'comment': (row.get('comment') or '').strip()
+    }
+
+
+def _read_rows(raw: bytes) -> List[Dict]:
+    """BOM付きUTF-8のCSVを辞書のリストとして読む"""
+    return list(csv.DictReader(io.StringIO(raw.decode('utf-8-sig'), newline='')))
+
+
+def _write_rows(fieldnames: List[str], rows: List[Dict]) -> bytes:
+    """辞書のリストをBOM付きUTF-8のCSVにする（空でもヘッダーは書く）"""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({field: row.get(field, '') for field in fieldnames})
+    return output.getvalue().encode('utf-8-sig')
+
+
+def _get_file_signature(path: str):
+    """ファイルの(mtime, size)を取得（存在しない場合はNone）"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class Storage:
+    """永続化の共通インターフェース
+
+    FAQの追加・更新・削除はすぐに書き込まれるとは限りません。CSVStorage は
+    flush_faqs() でまとめてファイルに書き出し、SQLiteStorage は各操作の時点で書き込みます。
+    FAQには一意な整数ID（'id'）があり、insert_faq / approve_pending で追加したFAQには
+    ストレージがIDを振ります。
+    """
+
+    description = ''
+
+    # --- FAQ ---
+    def load_faqs(self) -> List[Dict]:
+        raise NotImplementedError
+
+    def faq_changed(self) -> bool:
+        """最後に読み込み・書き込みした後に、外部（別プロセス・手編集）でFAQが変更されたか"""
+        raise NotImplementedError
+
+    def insert_faq(self, faq: Dict) -> None:
+        """FAQを追加（faq['id'] に新しいIDを設定する）"""
+        raise NotImplementedError
+
+    def update_faq(self, faq: Dict) -> None:
+        raise NotImplementedError
+
+    def delete_faq(self, faq: Dict) -> None:
+        raise NotImplementedError
+
+    def delete_faqs(self, faqs: List[Dict]) -> None:
+        """複数のFAQをまとめて削除"""
+        for faq in faqs:
+            self.delete_faq(faq)
+
+    def flush_faqs(self, faqs: List[Dict]) -> None:
+        """未保存のFAQ変更を書き出す"""
+        raise NotImplementedError
+
+    def replace_faqs(self, faqs: List[Dict]) -> None:
+        """FAQ全体を置き換える（インポート・移行用）"""
+        raise NotImplementedError
+
+    # --- 承認待ちQ&A ---
+    def load_pending(self) -> List[Dict]:
+        raise NotImplementedError
+
+    def pending_changed(self) -> bool:
+        """最後に読み込み・書き込みした後に、外部で承認待ちQ&Aが変更されたか"""
+        raise NotImplementedError
+
+    def insert_pending(self, items: List[Dict]) -> None:
+        """複数件をまとめて1回の書き込みで追加"""
+        raise NotImplementedError
+
+    def update_pending(self, item: Dict, pending_qa: List[Dict]) -> None:
+        raise NotImplementedError
+
+    def delete_pending(self, qa_ids: List[str], pending_qa: List[Dict]) -> None:
+        raise NotImplementedError
+
+    def approve_pending(self, qa_ids: List[str], faqs: List[Dict], pending_qa: List[Dict]) -> None:
+        """承認待ちQ&A（qa_ids）の削除とFAQ（faqs）の追加をまとめて行う"""
+        raise NotImplementedError
+
+    def replace_pending(self, items: List[Dict]) -> None:
+        raise NotImplementedError
+
+    # --- 不満足フィードバック・生成履歴 ---
+    def load_unsatisfied(self) -> List[Dict]:
+        raise NotImplementedError
+
+    def append_unsatisfied(self, row: Dict) -> None:
+        raise NotImplementedError
+
+    def replace_unsatisfied(self, rows: List[Dict]) -> None:
+        raise NotImplementedError
+
+    def load_history(self) -> List[Dict]:
+        raise NotImplementedError
+
+    def append_history(self, rows: List[Dict]) -> None:
+        raise NotImplementedError
+
+    def clear_history(self) -> bool:
+        """生成履歴を削除（削除するものがあった場合はTrue）"""
+        raise NotImplementedError
+
+    # --- バックアップ（CSV形式） ---
+    def export_csv(self, kind: str) -> Optional[bytes]:
+        """kind（faq / pending / unsatisfied）をCSVとして返す（データが無い場合はNone）"""
+        if kind == 'faq':
+            return _write_rows(FAQ_FIELDS, self.load_faqs())
+        if kind == 'pending':
+            return _write_rows(PENDING_FIELDS, self.load_pending())
+        if kind == 'unsatisfied':
+            rows = self.load_unsatisfied()
+            return _write_rows(UNSATISFIED_FIELDS, rows) if rows else None
+        raise ValueError(f"不明なデータ種別です: {kind}")
+
+    def import_csv(self, kind: str, raw: bytes) -> None:
+        """CSVの内容で kind のデータを置き換える"""
+        rows = _read_rows(raw)
+        if kind == 'faq':
+            self.replace_faqs([_faq_row(row) for row in rows])
+        elif kind == 'pending':
+            self.replace_pending([_pending_row(row) for row in rows])
+        elif kind == 'unsatisfied':
+            self.replace_unsatisfied([{field: row.get(field) or '' for field in UNSATISFIED_FIELDS} for row in rows])
+        else:
+            raise ValueError(f"不明なデータ種別です: {kind}")
+
+
+class CSVStorage(Storage):
+    """CSVファイルによる永続化（従来方式）"""
+
+    def __init__(self, faq_file: str, pending_file: str = 'pending_qa.csv',
+                 unsatisfied_file: str = None, history_file: str = 'faq_generation_history.csv'):
+        self.faq_file = faq_file
+        self.pending_file = pending_file
+        self.unsatisfied_file = unsatisfied_file or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'unsatisfied_qa.csv')
+        self.history_file = history_file
+        self.description = faq_file
+        self._faq_signature = None  # 最後に読み込んだ/書き込んだFAQ CSVの(mtime, size)
+        self._faq_hash = None  # 同じく内容ハッシュ
+        self._pending_signature = None  # 最後に読み込んだ/書き込んだ承認待ちCSVの(mtime, size)
+        self._next_faq_id = 1  # 次に追加するFAQのID
+
+    # --- FAQ ---
+    def load_faqs(self) -> List[Dict]:
+        # 読み込みに失敗した場合も、同じファイル状態では再読み込みしない
+        self._faq_signature = _get_file_signature(self.faq_file)
+        self._faq_hash = None
+        with open(self.faq_file, 'rb') as file:
+            raw = file.read()
+        self._faq_hash = hashlib.sha1(raw).hexdigest()
+        faqs = [_faq_row(row) for row in _read_rows(raw)]
+        # ID列の無い従来のCSVは読み込み時にIDを振る（次の書き出しでファイルにも保存される）
+        self._next_faq_id = assign_faq_ids(faqs)
+        return faqs
+
+    def faq_changed(self) -> bool:
+        """mtime/sizeが前回と同じなら未変更。mtime/sizeだけが変わって内容ハッシュが同じ場合も未変更"""
+        signature = _get_file_signature(self.faq_file)
+        if signature == self._faq_signature:
+            return False
+
+        if signature is not None and self._faq_hash is not None:
+            try:
+                with open(self.faq_file, 'rb') as file:
+                    content_hash = hashlib.sha1(file.read()).hexdigest()
+                if content_hash == self._faq_hash:
+                    self._faq_signature = signature
+                    return False
+            except OSError:
+                pass
+        return True
+
+    # CSVは行単位で書き換えられないため、FAQの変更は flush_faqs でまとめて書き出す
+    def insert_faq(self, faq: Dict) -> None:
+        faq['id'] = self._next_faq_id
+        self._next_faq_id += 1
+
+    def update_faq(self, faq: Dict) -> None:
+        pass
+
+    def delete_faq(self, faq: Dict) -> None:
+        pass
+
+    def delete_faqs(self, faqs: List[Dict]) -> None:
+        pass
+
+    def flush_faqs(self, faqs: List[Dict]) -> None:
+        self.replace_faqs(faqs)
+
+    def replace_faqs(self, faqs: List[Dict]) -> None:
+        self._next_faq_id = assign_faq_ids(faqs, self._next_faq_id)
+        raw = _write_rows(FAQ_FIELDS, [_faq_row(faq) for faq in faqs])
+        self._write_file(self.faq_file, raw)
+        # 自分で書き込んだ内容なので、次回の faq_changed では変更扱いにしない
+        self._faq_signature = _get_file_signature(self.faq_file)
+        self._faq_hash = hashlib.sha1(raw).hexdigest()
+
+    # --- 承認待ちQ&A ---
+    def load_pending(self) -> List[Dict]:
+        self._pending_signature = _get_file_signature(self.pending_file)
+        with open(self.pending_file, 'rb') as file:
+            raw = file.read()
+        return [_pending_row(row) for row in _read_rows(raw)]
+
+    def pending_changed(self) -> bool:
+        return _get_file_signature(self.pending_file) != self._pending_signature
+
+    def insert_pending(self, items: List[Dict]) -> None:
+        """追加はファイル末尾への追記で済ませる（ファイルが無ければヘッダーから書く）"""
+        if not os.path.exists(self.pending_file):
+            self.replace_pending(items)
+            return
+        with open(self.pending_file, 'a', encoding='utf-8-sig', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=PENDING_FIELDS, extrasaction='ignore')
+            for item in items:
+                writer.writerow({field: item.get(field, '') for field in PENDING_FIELDS})
+            file.flush()
+            os.fsync(file.fileno())
+        self._pending_signature = _get_file_signature(self.pending_file)
+
+    def update_pending(self, item: Dict, pending_qa: List[Dict]) -> None:
+        self.replace_pending(pending_qa)
+
+    def delete_pending(self, qa_ids: List[str], pending_qa: List[Dict]) -> None:
+        self.replace_pending(pending_qa)
+
+    def approve_pending(self, qa_ids: List[str], faqs: List[Dict], pending_qa: List[Dict]) -> None:
+        # FAQ側は呼び出し元の flush_faqs で書き出す
+        for faq in faqs:
+            self.insert_faq(faq)
+        self.replace_pending(pending_qa)
+
+    def replace_pending(self, items: List[Dict]) -> None:
+        self._write_file(self.pending_file, _write_rows(PENDING_FIELDS, items))
+        self._pending_signature = _get_file_signature(self.pending_file)
+
+    # --- 不満足フィードバック・生成履歴 ---
+    def load_unsatisfied(self) -> List[Dict]:
+        return self._load_log(self.unsatisfied_file)
+
+    def append_unsatisfied(self, row: Dict) -> None:
+        self._append_log(self.unsatisfied_file, UNSATISFIED_FIELDS, [row])
+
+    def replace_unsatisfied(self, rows: List[Dict]) -> None:
+        self._write_file(self.unsatisfied_file, _write_rows(UNSATISFIED_FIELDS, rows))
+
+    def load_history(self) -> List[Dict]:
+        with open(self.history_file, 'rb') as file:
+            raw = file.read()
+        return [{field: (row.get(field) or '').strip() for field in HISTORY_FIELDS} for row in _read_rows(raw)]
+
+    def append_history(self, rows: List[Dict]) -> None:
+        self._append_log(self.history_file, HISTORY_FIELDS, rows)
+
+    def clear_history(self) -> bool:
+        if not os.path.exists(self.history_file):
+            return False
+        os.remove(self.history_file)
+        return True
+
+    def export_csv(self, kind: str) -> Optional[bytes]:
+        """バックアップはファイルをそのまま返す"""
+        path = {'faq': self.faq_file, 'pending': self.pending_file, 'unsatisfied': self.unsatisfied_file}.get(kind)
+        if path is None:
+            raise ValueError(f"不明なデータ種別です: {kind}")
+        try:
+            with open(path, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def import_csv(self, kind: str, raw: bytes) -> None:
+        """バックアップのファイルをそのまま書き戻す"""
+        path = {'faq': self.faq_file, 'pending': self.pending_file, 'unsatisfied': self.unsatisfied_file}.get(kind)
+        if path is None:
+            raise ValueError(f"不明なデータ種別です: {kind}")
+        self._write_file(path, raw)
+
+    @staticmethod
+    def _load_log(path: str) -> List[Dict]:
+        try:
+            with open(path, 'rb') as file:
+                return _read_rows(file.read())
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _append_log(path: str, fieldnames: List[str], rows: List[Dict]) -> None:
+        file_exists = os.path.exists(path)
+        with open(path, 'a', encoding='utf-8-sig', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction='ignore')
+            if not file_exists:
+                writer.writeheader()
+            for row in rows:
+                writer.writerow({field: row.get(field, '') for field in fieldnames})
+
+    @staticmethod
+    def _write_file(path: str, raw: bytes) -> None:
+        """一時ファイルに書いてから置き換える（書き込み途中で落ちても元のファイルが残る）"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(raw)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+
+class SQLiteStorage(Storage):
+    """SQLite（WALモード）による永続化
+
+    接続はスレッド・プロセスごとに作成します（fork後の子プロセスは親の接続を使いません）。
+    FAQ・承認待ちQ&Aを変更するたびに meta テーブルの faq_revision / pending_revision を
+    同じトランザクション内で増やし、別プロセスでの変更は faq_changed() / pending_changed() で検出します。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS faqs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            keywords TEXT NOT NULL DEFAULT '',
+            category TEXT NOT NULL DEFAULT '一般'
+        );
+        CREATE TABLE IF NOT EXISTS pending_qa (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            keywords TEXT NOT NULL DEFAULT '',
+            category TEXT NOT NULL DEFAULT '一般',
+            created_at TEXT NOT NULL DEFAULT '',
+            user_question TEXT NOT NULL DEFAULT '',
+            confirmation_request TEXT NOT NULL DEFAULT '0',
+            comment TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS unsatisfied_qa (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL DEFAULT '',
+            user_question TEXT NOT NULL DEFAULT '',
+            matched_question TEXT NOT NULL DEFAULT '',
+            matched_answer TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS generation_history (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL DEFAULT '',
+            question TEXT NOT NULL DEFAULT '',
+            answer TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.description = db_path
+        self._local = threading.local()
+        self._revisions = {'faq_revision': None, 'pending_revision': None}  # 最後に読み込んだ/書き込んだ時点の値
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            for key in self._revisions:
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, '0')", (key,))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._connect().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    @staticmethod
+    def _read_revision(conn: sqlite3.Connection, key: str) -> int:
+        return int(conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()['value'])
+
+    def _bump_revision(self, conn: sqlite3.Connection, key: str) -> None:
+        """変更と同じトランザクション内でリビジョンを進める
+
+        変更前のリビジョンが手元の値と違う場合は別プロセスの変更が挟まっているので、
+        手元の値は更新せず次回の faq_changed() / pending_changed() で再読み込みさせる。
+        """
+        before = self._read_revision(conn, key)
+        conn.execute('UPDATE meta SET value = ? WHERE key = ?', (str(before + 1), key))
+        if before == self._revisions[key]:
+            self._revisions[key] = before + 1
+
+    def _bump_faq_revision(self, conn: sqlite3.Connection) -> None:
+        self._bump_revision(conn, 'faq_revision')
+
+    def _bump_pending_revision(self, conn: sqlite3.Connection) -> None:
+        self._bump_revision(conn, 'pending_revision')
+
+    # --- FAQ ---
+    def load_faqs(self) -> List[Dict]:
+        conn = self._connect()
+        with conn:
+            revision = self._read_revision(conn, 'faq_revision')
+            rows = conn.execute('SELECT id, question, answer, keywords, category FROM faqs ORDER BY id').fetchall()
+        self._revisions['faq_revision'] = revision
+        return [dict(row) for row in rows]
+
+    def faq_changed(self) -> bool:
+        return self._read_revision(self._connect(), 'faq_revision') != self._revisions['faq_revision']
+
+    def insert_faq(self, faq: Dict) -> None:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO faqs (question, answer, keywords, category) VALUES (?, ?, ?, ?)',
+                (faq['question'], faq['answer'], faq.get('keywords', ''), faq.get('category', '一般')))
+            faq['id'] = cursor.lastrowid
+            self._bump_faq_revision(conn)
+
+    def update_faq(self, faq: Dict) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE faqs SET question = ?, answer = ?, keywords = ?, category = ? WHERE id = ?',
+                (faq['question'], faq['answer'], faq.get('keywords', ''), faq.get('category', '一般'), faq['id']))
+            self._bump_faq_revision(conn)
+
+    def delete_faq(self, faq: Dict) -> None:
+        self.delete_faqs([faq])
+
+    def delete_faqs(self, faqs: List[Dict]) -> None:
+        with self._connect() as conn:
+            conn.executemany('DELETE FROM faqs WHERE id = ?', [(faq['id'],) for faq in faqs])
+            self._bump_faq_revision(conn)
+
+    def flush_faqs(self, faqs: List[Dict]) -> None:
+        # 各操作の時点で書き込み済み
+        pass
+
+    def replace_faqs(self, faqs: List[Dict]) -> None:
+        """FAQ全体を置き換える（インポート・移行元のIDはそのまま引き継ぐ）"""
+        assign_faq_ids(faqs)
+        with self._connect() as conn:
+            conn.execute('DELETE FROM faqs')
+            conn.executemany(
+                'INSERT INTO faqs (id, question, answer, keywords, category) VALUES (?, ?, ?, ?, ?)',
+                [(faq['id'], faq['question'], faq['answer'], faq.get('keywords', ''), faq.get('category', '一般'))
+                 for faq in faqs])
+            self._bump_faq_revision(conn)
+
+    # --- 承認待ちQ&A ---
+    def load_pending(self) -> List[Dict]:
+        conn = self._connect()
+        with conn:
+            revision = self._read_revision(conn, 'pending_revision')
+            rows = conn.execute(f"SELECT {', '.join(PENDING_FIELDS)} FROM pending_qa ORDER BY seq").fetchall()
+        self._revisions['pending_revision'] = revision
+        return [dict(row) for row in rows]
+
+    def pending_changed(self) -> bool:
+        return self._read_revision(self._connect(), 'pending_revision') != self._revisions['pending_revision']
+
+    @staticmethod
+    def _insert_pending(conn: sqlite3.Connection, items: List[Dict]) -> None:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO pending_qa ({', '.join(PENDING_FIELDS)}) "
+            f"VALUES ({', '.join('?' for _ in PENDING_FIELDS)})",
+            [tuple(item.get(field) or '' for field in PENDING_FIELDS) for item in items])
+
+    def insert_pending(self, items: List[Dict]) -> None:
+        with self._connect() as conn:
+            self._insert_pending(conn, items)
+            self._bump_pending_revision(conn)
+
+    def update_pending(self, item: Dict, pending_qa: List[Dict]) -> None:
+        fields = [field for field in PENDING_FIELDS if field != 'id']
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE pending_qa SET {', '.join(field + ' = ?' for field in fields)} WHERE id = ?",
+                tuple(item.get(field) or '' for field in fields) + (item['id'],))
+            self._bump_pending_revision(conn)
+
+    def delete_pending(self, qa_ids: List[str], pending_qa: List[Dict]) -> None:
+        with self._connect() as conn:
+            conn.executemany('DELETE FROM pending_qa WHERE id = ?', [(qa_id,) for qa_id in qa_ids])
+            self._bump_pending_revision(conn)
+
+    def approve_pending(self, qa_ids: List[str], faqs: List[Dict], pending_qa: List[Dict]) -> None:
+        """承認待ちの削除とFAQの追加を1トランザクションで行う"""
+        with self._connect() as conn:
+            conn.executemany('DELETE FROM pending_qa WHERE id = ?', [(qa_id,) for qa_id in qa_ids])
+            for faq in faqs:
+                cursor = conn.execute(
+                    'INSERT INTO faqs (question, answer, keywords, category) VALUES (?, ?, ?, ?)',
+                    (faq['question'], faq['answer'], faq.get('keywords', ''), faq.get('category', '一般')))
+                faq['id'] = cursor.lastrowid
+            self._bump_pending_revision(conn)
+            self._bump_faq_revision(conn)
+
+    def replace_pending(self, items: List[Dict]) -> None:
+        with self._connect() as conn:
+            conn.execute('DELETE FROM pending_qa')
+            self._insert_pending(conn, items)
+            self._bump_pending_revision(conn)
+
+    # --- 不満足フィードバック・生成履歴 ---
+    def load_unsatisfied(self) -> List[Dict]:
+        rows = self._connect().execute(
+            f"SELECT {', '.join(UNSATISFIED_FIELDS)} FROM unsatisfied_qa ORDER BY seq").fetchall()
+        return [dict(row) for row in rows]
+
+    def append_unsatisfied(self, row: Dict) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO unsatisfied_qa ({', '.join(UNSATISFIED_FIELDS)}) VALUES (?, ?, ?, ?)",
+                tuple(row.get(field) or '' for field in UNSATISFIED_FIELDS))
+
+    def replace_unsatisfied(self, rows: List[Dict]) -> None:
+        with self._connect() as conn:
+            conn.execute('DELETE FROM unsatisfied_qa')
+            conn.executemany(
+                f"INSERT INTO unsatisfied_qa ({', '.join(UNSATISFIED_FIELDS)}) VALUES (?, ?, ?, ?)",
+                [tuple(row.get(field) or '' for field in UNSATISFIED_FIELDS) for row in rows])
+
+    def load_history(self) -> List[Dict]:
+        rows = self._connect().execute(
+            f"SELECT {', '.join(HISTORY_FIELDS)} FROM generation_history ORDER BY seq").fetchall()
+        return [dict(row) for row in rows]
+
+    def append_history(self, rows: List[Dict]) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO generation_history ({', '.join(HISTORY_FIELDS)}) VALUES (?, ?, ?)",
+                [tuple(row.get(field) or '' for field in HISTORY_FIELDS) for row in rows])
+
+    def clear_history(self) -> bool:
+        with self._connect() as conn:
+            deleted = conn.execute('DELETE FROM generation_history').rowcount
+        return deleted > 0
+
+    # --- 移行 ---
+    def migrate_from(self, source: Storage) -> Dict[str, int]:
+        """別のストレージ（通常はCSVStorage）の内容をすべて取り込み、件数を返す"""
+        counts = {}
+        try:
+            faqs = source.load_faqs()
+        except FileNotFoundError:
+            faqs = []
+        self.replace_faqs(faqs)
+        counts['faq'] = len(faqs)
+
+        try:
+            pending = source.load_pending()
+        except FileNotFoundError:
+            pending = []
+        self.replace_pending(pending)
+        counts['pending'] = len(pending)
+
+        unsatisfied = source.load_unsatisfied()
+        self.replace_unsatisfied(unsatisfied)
+        counts['unsatisfied'] = len(unsatisfied)
+
+        try:
+            history = source.load_history()
+        except FileNotFoundError:
+            history = []
+        with self._connect() as conn:
+            conn.execute('DELETE FROM generation_history')
+        self.append_history(history)
+        counts['history'] = len(history)
+
+        self.set_meta('migrated_from', source.description)
+        return counts
+
+
+def create_storage(csv_file: str, pending_file: str = 'pending_qa.csv') -> Storage:
+    """設定に応じたストレージを作成（FAQ_STORAGE=csv|sqlite、既定はcsv）
+
+    sqlite の場合、データベースは FAQ_DB_PATH（既定は <CSV名>.sqlite3）に作成し、
+    新規作成時は既存のCSVから自動で移行します。
+    """
+    kind = os.getenv('FAQ_STORAGE', 'csv').lower()
+    csv_storage = CSVStorage(csv_file, pending_file)
+    if kind != 'sqlite':
+        return csv_storage
+
+    db_path = os.getenv('FAQ_DB_PATH') or os.path.splitext(csv_file)[0] + '.sqlite3'
+    storage = SQLiteStorage(db_path)
+    if storage.get_meta('migrated_from') is None:
+        counts = storage.migrate_from(csv_storage)
+        print(f"[INFO] CSVからSQLiteへ移行しました: {db_path} {counts}")
+    return storage
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='CSVのデータをSQLiteに移行')
+    parser.add_argument('csv_file', help='FAQのCSVファイル（例: faq_data-1.csv）')
+    parser.add_argument('--pending', default='pending_qa.csv', help='承認待ちQ&AのCSVファイル')
+    parser.add_argument('--db', help='移行先のSQLiteファイル（既定は <CSV名>.sqlite3）')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.splitext(args.csv_file)[0] + '.sqlite3'
+    counts = SQLiteStorage(db_path).migrate_from(CSVStorage(args.csv_file, args.pending))
+    print(f"移行しました: {db_path} {counts}")
+
+
+if __name__ == '__main__':
+    main()
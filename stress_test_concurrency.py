@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+FAQSystem の並行アクセスのストレステスト（ローカルのスタブサーバーを使用、通信は外に出ません）
+
+検索・承認/却下/編集・FAQ自動生成・再読み込みを複数スレッドで同時に実行し、次を確認します。
+
+- 検索・一覧表示の途中でリストが変わって例外になったり、読み込み途中のリストが見えたりしない
+- 承認待ちのIDが重複しない、承認したQ&Aが失われない
+- 終了後にストレージから読み直した内容がメモリ上の内容と一致する
+- --semantic: セマンティック検索の類似度が、返された質問文の埋め込みから計算し直した値と一致する
+  （埋め込み行列の差分更新中に別の行のベクトルを読んでいない）。埋め込みは文字の出現頻度による
+  決定的な疑似モデルで計算し、重複判定も近傍検索インデックス経由にする
+
+データは一時ディレクトリにコピーして使うので、リポジトリのCSVは変更しません。
+
+使い方:
+    python stress_test_concurrency.py
+    python stress_test_concurrency.py --seconds 20 --search-threads 8 --generate 20
+    python stress_test_concurrency.py --semantic
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, APP_DIR)
+
+
+class Counter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.errors = []
+
+    def add(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def error(self, message: str) -> None:
+        with self.lock:
+            self.errors.append(message)
+
+
+class CharacterModel:
+    """文字の出現頻度をベクトルにする疑似埋め込みモデル（同じ文は必ず同じベクトル）"""
+
+    dimensions = 256
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for char in text:
+                vectors[row, ord(char) % self.dimensions] += 1.0
+        return vectors
+
+    def similarity(self, text1: str, text2: str) -> float:
+        vector1, vector2 = self.encode([text1, text2])
+        norm = float(np.linalg.norm(vector1) * np.linalg.norm(vector2))
+        return float(vector1 @ vector2) / norm if norm else 0.0
+
+
+def run(args) -> int:
+    work_dir = tempfile.mkdtemp(prefix='faq_stress_')
+    previous_dir = os.getcwd()
+    try:
+        shutil.copy(os.path.join(APP_DIR, args.faq_csv), os.path.join(work_dir, 'faq.csv'))
+        os.chdir(work_dir)  # pending_qa.csv などは作業ディレクトリからの相対パス
+        os.environ.update({
+            'LLM_CACHE': '0',
+            'WINDOW_CATALOGUE': '0',
+            'DUPLICATE_LOG_PATH': os.path.join(work_dir, 'duplicate_log.sqlite3'),
+            'PDF_TEXT_CACHE_PATH': os.path.join(work_dir, 'pdf_text.sqlite3'),
+            'GENERATION_RATE_LIMIT': '0',
+        })
+
+        from llm_stub_server import start_stub_server
+        server, stub_state = start_stub_server(latency=args.latency)
+        os.environ['ANTHROPIC_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}"
+
+        from faq_system import FAQSystem
+
+        # 各スレッドのログは捨てる（redirect_stdout はスレッドごとに使えないため、まとめて差し替える）
+        report = sys.stdout
+        sys.stdout = io.StringIO() if args.verbose else open(os.devnull, 'w')
+        faq_system = FAQSystem('faq.csv')
+        faq_system.claude_api_key = 'dummy'
+        model = None
+        if args.semantic:
+            model = faq_system.semantic_model = CharacterModel()
+            faq_system.vector_search_threshold = 0  # 重複判定も近傍検索インデックスを使う
+        initial_faqs = len(faq_system.faq_data)
+        questions = [faq['question'] for faq in faq_system.faq_data] or ['ビザの申請方法は？']
+        initial_ids = [faq['id'] for faq in faq_system.faq_data]
+        pdf_path = os.path.join(APP_DIR, 'reference_docs', '第2章.pdf')
+
+        # スレッドの切り替えを頻繁にして、競合するタイミングを踏みやすくする
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        counter = Counter()
+        stop = threading.Event()
+        approved_questions = []
+        approved_lock = threading.Lock()
+
+        def worker(name, body):
+            def loop():
+                while not stop.is_set():
+                    try:
+                        body()
+                    except Exception:
+                        counter.error(f"{name}: {traceback.format_exc()}")
+            return threading.Thread(target=loop, name=name, daemon=True)
+
+        def search():
+            faq_data = faq_system.faq_data
+            question = random.choice(questions)
+            query = question[:random.randint(4, max(4, len(question)))]
+            semantic = model is not None and random.random() < 0.5
+            for result in faq_system.search_faq(query, mode='semantic' if semantic else 'string'):
+                if not result.get('question') or 'answer' not in result:
+                    counter.error(f"検索結果が不完全: {result}")
+                elif semantic and abs(result['similarity'] - model.similarity(query, result['question'])) > 1e-4:
+                    counter.error(f"セマンティック検索の類似度が質問文と一致しません: {query} → {result['question']}")
+            if semantic:
+                counter.add('semantic_search')
+            # 一覧表示と同じく、スナップショットを最後まで走査する
+            if len(faq_data) != sum(1 for _ in faq_data):
+                counter.error('FAQ一覧の走査中に件数が変わりました')
+            pending_qa = faq_system.pending_qa
+            ids = [item['id'] for item in pending_qa]
+            if len(ids) != len(set(ids)):
+                counter.error('承認待ちIDが重複しています')
+            counter.add('search')
+
+        def review():
+            pending_qa = faq_system.pending_qa
+            if not pending_qa:
+                time.sleep(0.01)
+                return
+            item = random.choice(pending_qa)
+            action = random.random()
+            if action < 0.4:
+                if faq_system.approve_pending_qa(item['id']):
+                    with approved_lock:
+                        approved_questions.append(item['question'].strip())
+                    counter.add('approve')
+            elif action < 0.6:
+                if faq_system.reject_pending_qa(item['id']):
+                    counter.add('reject')
+            elif action < 0.8:
+                faq_system.edit_pending_qa(item['id'], answer=item['answer'] + '（編集）')
+                counter.add('edit')
+            else:
+                faq_system.toggle_confirmation_request(item['id'])
+                counter.add('toggle')
+            time.sleep(0.005)
+
+        def generate():
+            faqs = faq_system.generate_faqs_from_document(
+                pdf_path, args.generate, on_faq=lambda faq: faq_system.add_pending_qa_batch([faq], category='AI生成')
+            )
+            counter.add('generated', len(faqs))
+            counter.add('generation_runs')
+
+        def edit_faq():
+            # 初期FAQの質問文に印を付けたり外したりする（件数は変えずに埋め込みの行を入れ替えさせる）
+            if not initial_ids:
+                stop.wait(1)
+                return
+            faq = faq_system.get_faq(random.choice(initial_ids))
+            if faq is not None:
+                question = faq['question']
+                question = question[:-len('（改）')] if question.endswith('（改）') else question + '（改）'
+                if faq_system.edit_faq(faq['id'], question=question):
+                    faq_system.save_faq_data()  # 管理画面と同じく編集後に書き出す（CSVは行単位で更新しない）
+                    counter.add('faq_edit')
+            time.sleep(0.01)
+
+        def reload():
+            faq_system.refresh_faq_data()
+            faq_system.refresh_pending_qa()
+            if random.random() < 0.2:
+                faq_system.load_pending_qa()
+                counter.add('reload')
+            time.sleep(0.05)
+
+        threads = [worker(f'search-{i}', search) for i in range(args.search_threads)]
+        threads += [worker(f'review-{i}', review) for i in range(args.review_threads)]
+        threads += [worker('generate', generate), worker('reload', reload), worker('faq-edit', edit_faq)]
+
+        print(f"FAQ {initial_faqs}件, 承認待ち {len(faq_system.pending_qa)}件, {args.seconds}秒間実行します "
+              f"(検索 {args.search_threads}, 承認 {args.review_threads}, 生成 1, 再読み込み 1, FAQ編集 1 スレッド)", file=report)
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        faq_system.generation_interrupted = True
+        for thread in threads:
+            thread.join(timeout=30)
+        elapsed = time.time() - start
+        sys.setswitchinterval(switch_interval)
+        server.shutdown()
+
+        # 終了後の整合性: 承認したQ&AがFAQにあり、ストレージから読み直した内容と一致する
+        faq_questions = {faq['question'] for faq in faq_system.faq_data}
+        missing = [question for question in approved_questions if question not in faq_questions]
+        if missing:
+            counter.error(f"承認したQ&AがFAQにありません: {len(missing)}件")
+        if len(faq_system.faq_data) != initial_faqs + len(approved_questions):
+            counter.error(f"FAQ件数が合いません: {len(faq_system.faq_data)} != {initial_faqs} + {len(approved_questions)}")
+        reloaded = FAQSystem('faq.csv')
+        log, sys.stdout = sys.stdout, report
+        if [faq['question'] for faq in reloaded.faq_data] != [faq['question'] for faq in faq_system.faq_data]:
+            counter.error('保存されたFAQがメモリ上の内容と一致しません')
+        if {item['id'] for item in reloaded.pending_qa} != {item['id'] for item in faq_system.pending_qa}:
+            counter.error('保存された承認待ちQ&Aがメモリ上の内容と一致しません')
+
+        print(f"{elapsed:.1f}秒, API呼び出し {stub_state.counts['requests']}回")
+        for name, count in sorted(counter.counts.items()):
+            print(f"  {name:<16} {count:>8} ({count / elapsed:.1f}/秒)")
+        if counter.errors:
+            print(f"NG: {len(counter.errors)}件のエラー")
+            for message in counter.errors[:5]:
+                print(message)
+            if args.verbose:
+                print(log.getvalue()[-5000:])
+            return 1
+        print('OK: 不整合・例外なし')
+        return 0
+    finally:
+        if sys.stdout is not sys.__stdout__ and 'report' in locals():
+            sys.stdout = report
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FAQSystem の並行アクセスのストレステスト')
+    parser.add_argument('--seconds', type=float, default=10, help='実行時間（秒）')
+    parser.add_argument('--search-threads', type=int, default=4, help='検索スレッド数')
+    parser.add_argument('--review-threads', type=int, default=2, help='承認・却下・編集スレッド数')
+    parser.add_argument('--generate', type=int, default=10, help='1回の自動生成で作るFAQ数')
+    parser.add_argument('--latency', type=float, default=0.02, help='スタブAPIの応答時間（秒）')
+    parser.add_argument('--faq-csv', default='faq_data.csv', help='初期データにするFAQのCSV（一時ディレクトリにコピーして使用）')
+    parser.add_argument('--semantic', action='store_true', help='疑似埋め込みモデルでセマンティック検索・重複判定も並行実行')
+    parser.add_argument('--verbose', action='store_true', help='エラー時にログの末尾も表示')
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
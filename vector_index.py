@@ -0,0 +1,250 @@
+"""
+埋め込みベクトルの近傍検索インデックス
+
+VectorIndex を共通インターフェースとして、次の2種類を用意しています。
+  - ExactIndex: 全件との内積を計算する厳密検索（件数が少ないときの標準・フォールバック）
+  - IVFIndex:   k-meansでベクトルをクラスタ（リスト）に分け、クエリに近い nprobe 個の
+                リストだけを走査する近似検索（FAQ + 承認待ち + 生成履歴が数十万件規模になった場合用）
+
+どちらも正規化済みベクトル（内積 = コサイン類似度）を前提とし、追加・削除は差分で行います。
+"""
+
+import math
+import os
+from typing import Dict, Hashable, List, Tuple
+
+import numpy as np
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """スコアの大きい順に上位k件の位置を返す"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+class VectorIndex:
+    """ベクトル索引の共通インターフェース"""
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def add(self, keys: List[Hashable], vectors) -> None:
+        """キーとベクトルを追加（既存キーは置き換え）"""
+        raise NotImplementedError
+
+    def remove(self, keys: List[Hashable]) -> None:
+        """キーを削除（存在しないキーは無視）"""
+        raise NotImplementedError
+
+    def search(self, query, k: int) -> List[Tuple[Hashable, float]]:
+        """クエリとの類似度が高い順に最大k件の (キー, 類似度) を返す"""
+        raise NotImplementedError
+
+
+class _VectorList:
+    """キーとベクトルを容量倍増で追記していく可変長リスト（削除は末尾と入れ替え）"""
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.keys: List[Hashable] = []
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def append(self, key: Hashable, vector) -> int:
+        size = len(self.keys)
+        if size == len(self.vectors):
+            grown = np.zeros((max(16, size * 2), self.vectors.shape[1]), dtype=np.float32)
+            grown[:size] = self.vectors[:size]
+            self.vectors = grown
+        self.vectors[size] = vector
+        self.keys.append(key)
+        return size
+
+    def pop(self, position: int):
+        """positionの要素を削除し、末尾から移動したキー（なければNone）を返す"""
+        last = len(self.keys) - 1
+        moved = None
+        if position != last:
+            moved = self.keys[last]
+            self.keys[position] = moved
+            self.vectors[position] = self.vectors[last]
+        self.keys.pop()
+        return moved
+
+    def view(self) -> np.ndarray:
+        return self.vectors[:len(self.keys)]
+
+
+class ExactIndex(VectorIndex):
+    """全件走査による厳密な近傍検索"""
+
+    def __init__(self):
+        self._list = None
+        self._position: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._position)
+
+    def add(self, keys, vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self._list is None and len(vectors):
+            self._list = _VectorList(vectors.shape[1])
+        for key, vector in zip(keys, vectors):
+            position = self._position.get(key)
+            if position is not None:
+                self._list.vectors[position] = vector
+            else:
+                self._position[key] = self._list.append(key, vector)
+
+    def remove(self, keys) -> None:
+        for key in keys:
+            position = self._position.pop(key, None)
+            if position is None:
+                continue
+            moved = self._list.pop(position)
+            if moved is not None:
+                self._position[moved] = position
+
+    def items(self):
+        """(キーのリスト, ベクトル行列) を返す"""
+        if self._list is None:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        return list(self._list.keys), self._list.view()
+
+    def search(self, query, k: int):
+        if not self._position:
+            return []
+        scores = self._list.view() @ np.asarray(query, dtype=np.float32)
+        return [(self._list.keys[i], float(scores[i])) for i in _top_k(scores, k)]
+
+
+class IVFIndex(VectorIndex):
+    """転置ファイル（IVF）方式の近似近傍検索
+
+    件数が min_train_size 未満の間は ExactIndex として動作し、それを超えた時点で
+    k-means（球面k-means）でクラスタ中心を学習して各リストに振り分けます。
+    以降の追加は最も近いクラスタのリストへの追記、削除はリスト内の入れ替えで済みます。
+    """
+
+    def __init__(self, n_lists: int = None, nprobe: int = 8, min_train_size: int = 10000,
+                 train_iterations: int = 10, seed: int = 0):
+        self.n_lists = n_lists  # Noneの場合は sqrt(件数) から決める
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.train_iterations = train_iterations
+        self.seed = seed
+        self.centroids = None
+        self._exact = ExactIndex()  # 学習前のバッファ
+        self._lists: List[_VectorList] = []
+        self._location: Dict[Hashable, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        if self.centroids is None:
+            return len(self._exact)
+        return len(self._location)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """各ベクトルに最も近いクラスタ番号を返す（メモリを抑えるため分割して計算）"""
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), 8192):
+            chunk = vectors[start:start + 8192]
+            labels[start:start + 8192] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return labels
+
+    def train(self, vectors: np.ndarray) -> None:
+        """球面k-meansでクラスタ中心を学習"""
+        rng = np.random.default_rng(self.seed)
+        n_lists = self.n_lists or max(1, int(math.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        sample_size = min(len(vectors), n_lists * 64)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        self.centroids = centroids
+        for _ in range(self.train_iterations):
+            labels = self._assign(sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            empty = counts == 0
+            if empty.any():
+                # 空のクラスタはランダムなサンプルで再初期化
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+            self.centroids = centroids
+
+    def _rebuild(self) -> None:
+        """バッファの内容でクラスタを学習し、全件をリストに振り分ける"""
+        keys, vectors = self._exact.items()
+        vectors = vectors.copy()
+        self.train(vectors)
+        dim = vectors.shape[1]
+        self._lists = [_VectorList(dim) for _ in range(len(self.centroids))]
+        self._location = {}
+        for key, vector, label in zip(keys, vectors, self._assign(vectors)):
+            self._location[key] = (int(label), self._lists[label].append(key, vector))
+        self._exact = ExactIndex()
+        print(f"[INFO] IVFインデックスを構築しました（{len(keys)}件, リスト数 {len(self._lists)}）")
+
+    def add(self, keys, vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not self.trained:
+            self._exact.add(keys, vectors)
+            if len(self._exact) >= self.min_train_size:
+                self._rebuild()
+            return
+
+        self.remove([key for key in keys if key in self._location])
+        for key, vector, label in zip(keys, vectors, self._assign(vectors)):
+            self._location[key] = (int(label), self._lists[label].append(key, vector))
+
+    def remove(self, keys) -> None:
+        if not self.trained:
+            self._exact.remove(keys)
+            return
+        for key in keys:
+            location = self._location.pop(key, None)
+            if location is None:
+                continue
+            label, position = location
+            moved = self._lists[label].pop(position)
+            if moved is not None:
+                self._location[moved] = (label, position)
+
+    def search(self, query, k: int):
+        if not self.trained:
+            return self._exact.search(query, k)
+        query = np.asarray(query, dtype=np.float32)
+        probe = _top_k(self.centroids @ query, min(self.nprobe, len(self._lists)))
+
+        keys = []
+        blocks = []
+        for label in probe:
+            vector_list = self._lists[label]
+            if len(vector_list):
+                keys.extend(vector_list.keys)
+                blocks.append(vector_list.view())
+        if not blocks:
+            return []
+        scores = np.vstack(blocks) @ query
+        return [(keys[i], float(scores[i])) for i in _top_k(scores, k)]
+
+
+def create_vector_index(kind: str = None) -> VectorIndex:
+    """設定に応じたインデックスを作成（VECTOR_INDEX=exact|ivf、既定はivf）
+
+    ivf は件数が少ない間は厳密検索として動作するため、既定でも小規模データの結果は変わりません。
+    """
+    kind = (kind or os.getenv('VECTOR_INDEX', 'ivf')).lower()
+    if kind == 'exact':
+        return ExactIndex()
+    return IVFIndex(nprobe=int(os.getenv('VECTOR_INDEX_NPROBE', '8')))
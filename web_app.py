@@ -1,9 +1,15 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, make_response
-from faq_system import FAQSystem, find_similar_faqs
+import time
+startup_time = time.time()
+
+from flask import Flask, render_template, request, jsonify, redirect, url_for, make_response, Response, stream_with_context
+from faq_system import FAQSystem, find_similar_faqs, warm_up_semantic_model
+from storage import BACKUP_FILES
+from llm_cache import get_llm_cache
+from job_queue import JobQueue
+from event_broker import EventBroker, stream_events
 import json
 import datetime
 import os
-import threading
 from dotenv import load_dotenv
 
 # .envファイルから環境変数を読み込む
@@ -13,20 +19,168 @@ app = Flask(__name__)
 faq_system = FAQSystem('faq_data-1.csv')
 faq_system.claude_api_key = os.getenv('CLAUDE_API_KEY')
 
-# FAQ生成の進捗状況を保存するグローバル変数
-generation_progress = {
+# 本番サーバー（wsgi.py + gunicorn.conf.py）では、fork 前にモデル・インデックスを読み込み、
+# ジョブのワーカースレッドは fork 後に各ワーカーで起動する（APP_PRELOAD=1）
+APP_PRELOAD = os.getenv('APP_PRELOAD') == '1'
+
+# セマンティックモデルは初回使用時にロードされる。起動をブロックしないよう裏で先読みしておく
+if os.getenv('SEMANTIC_MODEL_WARMUP', '1') == '1' and not APP_PRELOAD:
+    warm_up_semantic_model()
+
+# FAQ自動生成はジョブキューで実行する（ジョブID・進捗・結果はSQLiteに保存され、再起動しても残る）
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+JOB_UPLOAD_DIR = os.getenv('JOB_UPLOAD_DIR') or os.path.join(APP_DIR, 'job_uploads')  # アップロードPDFの保存先（ジョブ終了で削除）
+job_queue = JobQueue(os.getenv('JOB_DB_PATH') or os.path.join(APP_DIR, 'jobs.sqlite3'),
+                     workers=int(os.getenv('JOB_WORKERS', '2')),
+                     stale_after=float(os.getenv('JOB_STALE_AFTER', '60')))  # ハートビートが途絶えてから再実行するまでの秒数
+
+# 生成の進捗・ログ・採用/却下の候補を SSE で画面へ送る（トピック: "job:<ジョブID>" と全体の "generation"）
+event_broker = EventBroker()
+FINISHED_GENERATION_STATUSES = ('idle', 'completed', 'interrupted', 'error')
+SSE_MAX_SECONDS = float(os.getenv('SSE_MAX_SECONDS', '300'))  # SSE の1接続の最長時間（過ぎたらブラウザが再接続する）
+
+def publish_generation_event(job_id, event_type, data):
+    event_broker.publish(f'job:{job_id}', event_type, data)
+    event_broker.publish('generation', event_type, dict(data, job_id=job_id))
+
+def publish_generation_progress(job_id):
+    publish_generation_event(job_id, 'progress', generation_progress_view(job_queue.get(job_id)))
+
+# 生成ジョブの進捗の初期値（画面が参照する項目）
+INITIAL_GENERATION_PROGRESS = {
+    'phase': 'queued',  # queued, extracting, generating
     'current': 0,
     'total': 0,
-    'status': 'idle',  # idle, generating, completed, error
     'retry_count': 0,  # 現在のウィンドウリトライ回数
     'max_retries': 10,  # 最大リトライ回数（ウィンドウごと）
     'excluded_windows': 0,  # 除外されたウィンドウ数
     'total_windows': 0,  # 総ウィンドウ数
     'question_range': '',  # 質問ウィンドウ範囲
     'answer_range': '',  # 回答ウィンドウ範囲
-    'logs': []  # 最新10件のログメッセージ
+    'extract_pages_done': 0,  # PDF抽出済みページ数
+    'extract_pages_total': 0,  # PDFの総ページ数
 }
 
+def run_faq_generation_job(job):
+    """FAQ自動生成ジョブ（採用したFAQは1件ずつ承認待ちに追加し、ジョブの結果にも記録する）"""
+    params = job.params
+    num_questions = params['num_questions']
+    category = params['category']
+    already = job.result_count  # 再起動前の実行で保存済みの件数（続きから生成する）
+    remaining = num_questions - already
+    if remaining <= 0:
+        return
+    if already:
+        print(f"[INFO] ジョブ {job.id}: 保存済み {already}件の続きから生成します（残り {remaining}件）")
+        publish_generation_event(job.id, 'log', {'message': f'保存済み {already}件の続きから生成します（残り {remaining}件）'})
+    else:
+        publish_generation_event(job.id, 'log', {'message': f"{params['source_name']} から {num_questions}件の生成を開始しました"})
+    publish_generation_progress(job.id)
+
+    def update_progress(current, total, retry_count=0, excluded_windows=0, total_windows=0, question_range='', answer_range=''):
+        job.update_progress(phase='generating', current=already + current, total=num_questions,
+                            retry_count=retry_count, excluded_windows=excluded_windows, total_windows=total_windows,
+                            question_range=question_range, answer_range=answer_range)
+        publish_generation_progress(job.id)
+        print(f"[DEBUG] 進捗更新: {already + current}/{num_questions}, ウィンドウリトライ: {retry_count}, 除外ウィンドウ: {excluded_windows}/{total_windows}, 質問範囲: {question_range}")
+
+    def update_extraction_progress(done_pages, total_pages):
+        job.update_progress(phase='extracting', extract_pages_done=done_pages, extract_pages_total=total_pages)
+        publish_generation_progress(job.id)
+
+    user_question = f"[自動生成] {params['source_name']}から生成"
+    saved = set()
+
+    def save_faq(faq):
+        qa_ids = faq_system.add_pending_qa_batch([faq], category=category, user_question=user_question)
+        job.add_result(dict(faq, pending_id=qa_ids[0] if qa_ids else None))
+        saved.add(id(faq))
+        publish_generation_event(job.id, 'accepted', {'question': faq.get('question', '')})
+
+    def report_rejected(duplicate):
+        publish_generation_event(job.id, 'rejected', {'question': duplicate['question'], 'reason': duplicate['reason']})
+
+    generated_faqs = faq_system.generate_faqs_from_document(
+        params['pdf_path'], remaining, category, params.get('pdf_extractor'),
+        progress_callback=update_progress,
+        extraction_progress_callback=update_extraction_progress,
+        should_stop=job.is_cancelled,
+        on_faq=save_faq,
+        on_rejected=report_rejected,
+        run_id=job.id
+    )
+
+    # モック生成など、逐次保存を通らなかったFAQをまとめて追加
+    rest = [faq for faq in generated_faqs if id(faq) not in saved]
+    if rest:
+        qa_ids = faq_system.add_pending_qa_batch(rest, category=category, user_question=user_question)
+        for faq, qa_id in zip(rest, qa_ids):
+            job.add_result(dict(faq, pending_id=qa_id))
+    print(f"[DEBUG] ジョブ {job.id}: {job.result_count}件のFAQを承認待ちキューに追加済み")
+
+    job.update_progress(current=job.result_count)
+    if job.result_count == 0 and not job.is_cancelled():
+        raise RuntimeError(faq_system.last_error_message or '生成されたFAQがありません')
+
+def finish_generation_job(job):
+    """ジョブが終わったら最終状態を配信し、アップロードされたPDFを削除"""
+    progress = generation_progress_view(job)
+    publish_generation_event(job['id'], 'log', {'message': f"生成ジョブが終了しました（{progress['status']}、{job['result_count']}件）"})
+    publish_generation_event(job['id'], 'progress', progress)
+    pdf_path = job['params'].get('pdf_path')
+    if job['params'].get('delete_after') and pdf_path and os.path.exists(pdf_path):
+        os.remove(pdf_path)
+        print(f"[DEBUG] 一時ファイル削除: {pdf_path}")
+
+job_queue.register('faq_generation', run_faq_generation_job, on_finish=finish_generation_job)
+
+# 不満足フィードバックからのQ&A改善も、リクエストの外（別のワーカー）で実行する
+# 同じDBを使うが、長い生成ジョブに待たされないようワーカーは別に持つ
+feedback_queue = JobQueue(job_queue.db_path, workers=int(os.getenv('FEEDBACK_WORKERS', '2')),
+                          stale_after=float(os.getenv('JOB_STALE_AFTER', '60')))
+FEEDBACK_COALESCE_SECONDS = float(os.getenv('FEEDBACK_COALESCE_SECONDS', '600'))  # 同じ質問の改善をまとめる時間
+
+def feedback_dedupe_key(user_question):
+    """同じ質問とみなすためのキー（前後の空白・大文字小文字・連続する空白の違いは無視）"""
+    return ' '.join(user_question.lower().split())
+
+def run_feedback_improvement_job(job):
+    """不満足だったQ&Aの改善案を生成して承認待ちに追加"""
+    params = job.params
+    print(f"[DEBUG] フィードバック改善ジョブ {job.id}: {params['user_question']}")
+    if not faq_system.auto_improve_qa(params['user_question'], params.get('matched_question'), params.get('matched_answer')):
+        raise RuntimeError('改善案の生成に失敗しました')
+    job.add_result({'user_question': params['user_question']})
+
+feedback_queue.register('feedback_improvement', run_feedback_improvement_job)
+
+def start_background_workers():
+    """ジョブのワーカースレッドを起動（スレッドは fork で引き継がれないため、本番サーバーでは fork 後に呼ぶ）"""
+    job_queue.start()
+    feedback_queue.start()
+
+if not APP_PRELOAD:
+    start_background_workers()
+
+def generation_progress_view(job):
+    """ジョブの状態を画面用の進捗に変換（status: idle, queued, extracting, generating, completed, interrupted, error）"""
+    if job is None:
+        return dict(INITIAL_GENERATION_PROGRESS, status='idle')
+    progress = dict(INITIAL_GENERATION_PROGRESS, **job['progress'])
+    if job['status'] == 'queued':
+        status = 'queued'
+    elif job['status'] == 'running':
+        status = 'extracting' if progress['phase'] == 'extracting' else 'generating'
+    elif job['status'] == 'completed':
+        status = 'completed'
+    elif job['status'] in ('cancelled', 'interrupted'):
+        status = 'interrupted'
+    else:
+        status = 'error'
+    progress.update(status=status, job_id=job['id'], job_status=job['status'],
+                    current=job['result_count'], error=job['error'])
+    return progress
+
 @app.route('/')
 def index():
     """メインページ"""
@@ -37,13 +191,17 @@ def search():
     """FAQ検索API"""
     data = request.get_json()
     question = data.get('question', '').strip()
+    # 検索方式: string（文字列類似度+キーワード）または semantic（埋め込みベクトル）
+    mode = data.get('mode') or os.getenv('SEARCH_MODE', 'string')
+    if mode not in ('string', 'semantic'):
+        mode = 'string'
 
     if not question:
         return jsonify({'error': '質問を入力してください'}), 400
 
-    # 最新データを再読み込み
-    faq_system.load_faq_data('faq_data-1.csv')
-    result, needs_confirmation = faq_system.get_best_answer(question)
+    # CSVが変更されている場合のみ再読み込み（未変更ならメモリ上のスナップショットを使用）
+    faq_system.refresh_faq_data()
+    result, needs_confirmation = faq_system.get_best_answer(question, mode=mode)
 
     if needs_confirmation:
         return jsonify({
@@ -68,8 +226,8 @@ def backup_page():
 def admin():
     """管理画面"""
     try:
-        # 最新データを再読み込み
-        faq_system.load_faq_data('faq_data-1.csv')
+        # 最新データを再読み込み（変更がある場合のみ）
+        faq_system.refresh_faq_data()
         faqs = faq_system.faq_data
         print(f"[DEBUG] 管理画面: FAQデータ件数 = {len(faqs)}")
         print(f"[DEBUG] 最初の3件: {[faq.get('question', '')[:30] for faq in faqs[:3]]}")
@@ -98,12 +256,9 @@ def auto_generate_faq_page():
 @app.route('/admin/clear_history', methods=['POST'])
 def clear_generation_history():
     """FAQ生成履歴をクリア（デバッグ用）"""
-    import os
-    history_file = 'faq_generation_history.csv'
     try:
-        if os.path.exists(history_file):
-            os.remove(history_file)
-            print(f"[DEBUG] FAQ生成履歴を削除: {history_file}")
+        if faq_system.storage.clear_history():
+            print(f"[DEBUG] FAQ生成履歴を削除: {faq_system.storage.description}")
             return jsonify({'success': True, 'message': 'FAQ生成履歴を削除しました'})
         else:
             return jsonify({'success': True, 'message': '履歴ファイルは存在しません'})
@@ -124,23 +279,30 @@ def add_faq():
 
     return redirect(url_for('add_faq_page') + '?success=true')
 
-@app.route('/admin/edit/<int:index>', methods=['POST'])
-def edit_faq(index):
+@app.route('/admin/edit/<int:faq_id>', methods=['POST'])
+def edit_faq(faq_id):
     """FAQ編集"""
     question = request.form.get('question', '').strip()
     answer = request.form.get('answer', '').strip()
     category = request.form.get('category', '').strip()
 
-    if faq_system.edit_faq(index, question if question else None, answer if answer else None, category if category else None):
+    # 他のプロセスで追加されたFAQも編集できるように、変更がある場合は先に再読み込み
+    faq_system.refresh_faq_data()
+    if faq_system.edit_faq(faq_id, question if question else None, answer if answer else None, category if category else None):
         faq_system.save_faq_data()
+    else:
+        print(f"[DEBUG] FAQ編集スキップ: ID {faq_id} は存在しません")
 
     return redirect(url_for('admin'))
 
-@app.route('/admin/delete/<int:index>', methods=['POST'])
-def delete_faq(index):
+@app.route('/admin/delete/<int:faq_id>', methods=['POST'])
+def delete_faq(faq_id):
     """FAQ削除"""
-    faq_system.delete_faq(index)
-    faq_system.save_faq_data()
+    faq_system.refresh_faq_data()
+    if faq_system.delete_faq(faq_id):
+        faq_system.save_faq_data()
+    else:
+        print(f"[DEBUG] FAQ削除スキップ: ID {faq_id} は存在しません")
     return redirect(url_for('admin'))
 
 @app.route('/admin/export_all', methods=['GET'])
@@ -149,8 +311,6 @@ def export_all():
     import io
     import zipfile
     from datetime import datetime
-    import shutil
-    import os
 
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
 
@@ -158,17 +318,14 @@ def export_all():
     zip_buffer = io.BytesIO()
 
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        # FAQ データを追加
-        if os.path.exists('faq_data-1.csv'):
-            zip_file.write('faq_data-1.csv', 'faq_data-1.csv')
-
-        # 承認待ちデータを追加
-        if os.path.exists('pending_qa.csv'):
-            zip_file.write('pending_qa.csv', 'pending_qa.csv')
-
-        # 不満足データを追加（あれば）
-        if os.path.exists('unsatisfied_qa.csv'):
-            zip_file.write('unsatisfied_qa.csv', 'unsatisfied_qa.csv')
+        # FAQ・承認待ち・不満足データ（あれば）をCSVとして追加（ストレージがSQLiteでも同じ形式）
+        for kind, filename in BACKUP_FILES.items():
+            try:
+                content = faq_system.storage.export_csv(kind)
+            except FileNotFoundError:
+                content = None
+            if content is not None:
+                zip_file.writestr(filename, content)
 
     zip_buffer.seek(0)
 
@@ -184,8 +341,8 @@ def export_pending_faq():
     import io
     from datetime import datetime
 
-    # 最新データを再読み込み
-    faq_system.load_pending_qa()
+    # 最新データを再読み込み（変更がある場合のみ）
+    faq_system.refresh_pending_qa()
 
     # CSVデータを作成
     output = io.StringIO()
@@ -242,32 +399,21 @@ def import_all():
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
             zip_ref.extractall(temp_dir)
 
-        # 各CSVファイルを復元
+        # 各CSVファイルをストレージに復元
         restored_files = []
-
-        # FAQデータ
-        faq_file = os.path.join(temp_dir, 'faq_data-1.csv')
-        if os.path.exists(faq_file):
-            shutil.copy(faq_file, 'faq_data-1.csv')
-            restored_files.append('FAQ')
-
-        # 承認待ちデータ
-        pending_file = os.path.join(temp_dir, 'pending_qa.csv')
-        if os.path.exists(pending_file):
-            shutil.copy(pending_file, 'pending_qa.csv')
-            restored_files.append('承認待ち')
-
-        # 不満足データ
-        unsatisfied_file = os.path.join(temp_dir, 'unsatisfied_qa.csv')
-        if os.path.exists(unsatisfied_file):
-            shutil.copy(unsatisfied_file, 'unsatisfied_qa.csv')
-            restored_files.append('不満足')
+        labels = {'faq': 'FAQ', 'pending': '承認待ち', 'unsatisfied': '不満足'}
+        for kind, filename in BACKUP_FILES.items():
+            backup_file = os.path.join(temp_dir, filename)
+            if os.path.exists(backup_file):
+                with open(backup_file, 'rb') as f:
+                    faq_system.storage.import_csv(kind, f.read())
+                restored_files.append(labels[kind])
 
         # 一時ファイルを削除
         shutil.rmtree(temp_dir)
 
         # データを再読み込み
-        faq_system.load_faq_data('faq_data-1.csv')
+        faq_system.load_faq_data()
         faq_system.load_pending_qa()
 
         restored_str = '、'.join(restored_files)
@@ -284,43 +430,32 @@ def import_all():
 @app.route('/admin/batch_delete', methods=['POST'])
 def batch_delete_faq():
     """複数のFAQをまとめて削除"""
-    print(f"[DEBUG] 受信したフォームデータ全体: {dict(request.form)}")
-    print(f"[DEBUG] request.form.getlist('faq_indices'): {request.form.getlist('faq_indices')}")
-    print(f"[DEBUG] request.form.keys(): {list(request.form.keys())}")
-
-    faq_indices = request.form.getlist('faq_indices')
+    faq_ids = []
+    for value in request.form.getlist('faq_ids'):
+        try:
+            faq_ids.append(int(value))
+        except ValueError:
+            print(f"[DEBUG] FAQ削除スキップ: 不正なID {value!r}")
 
-    if not faq_indices:
+    if not faq_ids:
         print("[DEBUG] まとめて削除: 選択されたFAQがありません")
         return redirect(url_for('admin'))
 
-    # 最新データを再読み込み
-    faq_system.load_faq_data('faq_data-1.csv')
-
-    # インデックスを降順にソートして削除（大きい方から削除しないとインデックスがずれる）
-    indices = sorted([int(idx) for idx in faq_indices], reverse=True)
+    # 最新データを再読み込み（変更がある場合のみ）。IDで指定するので、表示後に一覧が変わっていても対象はずれない
+    faq_system.refresh_faq_data()
 
-    print(f"[DEBUG] まとめて削除開始 - 対象インデックス: {indices}")
+    print(f"[DEBUG] まとめて削除開始 - 対象ID: {faq_ids}")
     print(f"[DEBUG] 削除前のFAQ件数: {len(faq_system.faq_data)}")
 
-    success_count = 0
-    for idx in indices:
-        try:
-            if 0 <= idx < len(faq_system.faq_data):
-                deleted_question = faq_system.faq_data[idx].get('question', '')[:30]
-                faq_system.delete_faq(idx)
-                success_count += 1
-                print(f"[DEBUG] FAQ削除成功: インデックス {idx} - {deleted_question}")
-            else:
-                print(f"[DEBUG] FAQ削除スキップ: インデックス {idx} は範囲外")
-        except Exception as e:
-            print(f"[DEBUG] FAQ削除失敗: インデックス {idx}, エラー: {e}")
-
-    faq_system.save_faq_data()
-    # 削除後に最新データを再読み込み
-    faq_system.load_faq_data('faq_data-1.csv')
+    deleted_ids = faq_system.delete_faqs(faq_ids)
+    skipped = sorted(set(faq_ids) - set(deleted_ids))
+    if skipped:
+        print(f"[DEBUG] FAQ削除スキップ: ID {skipped} は存在しません")
+    if deleted_ids:
+        faq_system.save_faq_data()
+
     print(f"[DEBUG] 削除後のFAQ件数: {len(faq_system.faq_data)}")
-    print(f"[DEBUG] まとめて削除完了 - 成功: {success_count}件")
+    print(f"[DEBUG] まとめて削除完了 - 成功: {len(deleted_ids)}件")
     return redirect(url_for('admin'))
 
 @app.route('/interactive_improvement')
@@ -331,8 +466,8 @@ def interactive_improvement():
 @app.route('/admin/review')
 def review_pending():
     """承認待ちQ&A一覧"""
-    # 最新データを再読み込み
-    faq_system.load_pending_qa()
+    # 最新データを再読み込み（変更がある場合のみ）
+    faq_system.refresh_pending_qa()
     pending_items = faq_system.pending_qa
     print(f"[DEBUG] 承認待ち画面: 承認待ちアイテム数 = {len(pending_items)}")
     return render_template('review_pending.html', pending_items=pending_items)
@@ -341,7 +476,6 @@ def review_pending():
 def approve_qa(qa_id):
     """Q&Aを承認してFAQに追加"""
     if faq_system.approve_pending_qa(qa_id):
-        faq_system.save_faq_data()
         print(f"[DEBUG] Q&A承認成功: {qa_id}")
     else:
         print(f"[DEBUG] Q&A承認失敗: {qa_id}")
@@ -365,20 +499,29 @@ def batch_reject_qa():
         print("[DEBUG] まとめて却下: 選択されたQ&Aがありません")
         return redirect(url_for('review_pending'))
 
-    success_count = 0
-    fail_count = 0
-
-    for qa_id in qa_ids:
-        if faq_system.reject_pending_qa(qa_id):
-            success_count += 1
-            print(f"[DEBUG] Q&A却下成功: {qa_id}")
-        else:
-            fail_count += 1
-            print(f"[DEBUG] Q&A却下失敗: {qa_id}")
+    rejected_ids = faq_system.reject_pending_qa_batch(qa_ids)
+    success_count = len(rejected_ids)
+    fail_count = len(set(qa_ids)) - success_count
 
     print(f"[DEBUG] まとめて却下完了 - 成功: {success_count}, 失敗: {fail_count}")
     return redirect(url_for('review_pending'))
 
+@app.route('/admin/batch_approve', methods=['POST'])
+def batch_approve_qa():
+    """複数のQ&Aをまとめて承認してFAQに追加"""
+    qa_ids = request.form.getlist('qa_ids')
+
+    if not qa_ids:
+        print("[DEBUG] まとめて承認: 選択されたQ&Aがありません")
+        return redirect(url_for('review_pending'))
+
+    approved_ids = faq_system.approve_pending_qa_batch(qa_ids)
+    success_count = len(approved_ids)
+    fail_count = len(set(qa_ids)) - success_count
+
+    print(f"[DEBUG] まとめて承認完了 - 成功: {success_count}, 失敗: {fail_count}")
+    return redirect(url_for('review_pending'))
+
 @app.route('/admin/edit_pending/<qa_id>', methods=['POST'])
 def edit_pending_qa(qa_id):
     """承認待ちQ&Aを編集"""
@@ -408,20 +551,16 @@ def toggle_confirmation_request(qa_id):
 def check_duplicates(qa_id):
     """承認待ちQ&Aの重複チェック"""
     try:
-        # 承認待ちQ&Aを取得
-        faq_system.load_pending_qa()
-        pending_item = None
-        for item in faq_system.pending_qa:
-            if item['id'] == qa_id:
-                pending_item = item
-                break
+        # 承認待ちQ&Aを取得（変更がある場合のみ再読み込み）
+        faq_system.refresh_pending_qa()
+        pending_item = faq_system.get_pending_qa(qa_id)
 
         if not pending_item:
             print(f"[DEBUG] 承認待ちアイテムが見つかりません: {qa_id}")
             return redirect(url_for('review_pending'))
 
         # 類似FAQ検索
-        faq_system.load_faq_data('faq_data-1.csv')
+        faq_system.refresh_faq_data()
         similar_faqs = find_similar_faqs(faq_system, pending_item['question'])
 
         print(f"[DEBUG] 重複チェック - 質問: {pending_item['question']}")
@@ -438,132 +577,142 @@ def check_duplicates(qa_id):
 
 @app.route('/admin/generation_progress', methods=['GET'])
 def get_generation_progress():
-    """FAQ生成の進捗状況を取得"""
-    return jsonify(generation_progress)
+    """FAQ生成の進捗状況を取得（job_id 未指定なら最新の生成ジョブ）"""
+    job_id = request.args.get('job_id')
+    job = job_queue.get(job_id) if job_id else job_queue.latest('faq_generation')
+    return jsonify(generation_progress_view(job))
+
+def sse_response(stream):
+    """SSE のレスポンス（プロキシにバッファされないようにする）"""
+    return Response(stream_with_context(stream), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def last_event_id():
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return int(value) if value and value.isdigit() else None
+
+@app.route('/admin/generation_events', methods=['GET'])
+def generation_events():
+    """FAQ生成の進捗を SSE で配信（job_id 未指定なら最新の生成ジョブ）。ジョブが終わったら閉じる
+
+    ジョブが別のプロセスで動いている場合にも追従できるよう、イベントが来ない間はDBの状態も確認する
+    """
+    job_id = request.args.get('job_id')
+    if not job_id:
+        latest = job_queue.latest('faq_generation')
+        job_id = latest['id'] if latest else None
+    if job_id is None:
+        return jsonify(generation_progress_view(None))
+
+    subscription = event_broker.subscribe(f'job:{job_id}', last_event_id=last_event_id())
+    return sse_response(stream_events(
+        subscription,
+        snapshot=lambda: generation_progress_view(job_queue.get(job_id)),
+        is_finished=lambda progress: progress.get('status') in FINISHED_GENERATION_STATUSES,
+        max_duration=SSE_MAX_SECONDS
+    ))
+
+@app.route('/admin/events', methods=['GET'])
+def admin_events():
+    """全生成ジョブのイベント（log / accepted / rejected / progress）を SSE で配信
+
+    別のワーカーで動くジョブのイベントはこのプロセスに届かないので、イベントが来ない間は
+    最新の生成ジョブの状態と重複判定ログの最新IDを progress として送る。
+    生成ジョブが動いていなければその状態を送って閉じる（画面側は通常のポーリングに戻る）
+    """
+    subscription = event_broker.subscribe('generation', last_event_id=last_event_id())
+    return sse_response(stream_events(
+        subscription,
+        snapshot=lambda: dict(generation_progress_view(job_queue.latest('faq_generation')),
+                              latest_duplicate_id=faq_system.duplicate_log.last_id()),
+        is_finished=lambda progress: progress.get('status') in FINISHED_GENERATION_STATUSES,
+        max_duration=SSE_MAX_SECONDS
+    ))
+
+@app.route('/admin/jobs', methods=['GET'])
+def list_jobs():
+    """ジョブの一覧（新しい順、limit は1〜100。数値でなければ既定の20）"""
+    limit = min(100, max(1, request.args.get('limit', 20, type=int)))
+    return jsonify({'jobs': job_queue.list_jobs(kind=request.args.get('kind'), status=request.args.get('status'), limit=limit)})
+
+@app.route('/admin/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """ジョブの状態と、保存済みの結果"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    job['results'] = job_queue.results(job_id)
+    return jsonify(job)
+
+@app.route('/admin/llm_cache_stats', methods=['GET'])
+def llm_cache_stats():
+    """Claude APIレスポンスキャッシュのヒット数・件数（監視用）"""
+    cache = get_llm_cache()
+    if cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(cache.get_stats(), enabled=True))
 
 @app.route('/admin/get_duplicates', methods=['GET'])
 def get_duplicate_faqs():
-    """重複判定されたFAQのリストを取得（デバッグ用）"""
+    """重複判定されたFAQを新しい順に取得（デバッグ用）
+
+    クエリ: run_id（生成ジョブID）, reason（理由の部分一致）, min_similarity / max_similarity, offset, limit（最大200）
+    """
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(200, max(1, int(request.args.get('limit', 50))))
+        min_similarity = request.args.get('min_similarity', type=float)
+        max_similarity = request.args.get('max_similarity', type=float)
+    except ValueError:
+        return jsonify({'error': 'offset / limit は整数で指定してください'}), 400
+    duplicates, total = faq_system.duplicate_log.query(
+        run_id=request.args.get('run_id'), reason=request.args.get('reason'),
+        min_similarity=min_similarity, max_similarity=max_similarity, offset=offset, limit=limit
+    )
     return jsonify({
-        'duplicates': faq_system.duplicate_faqs,
-        'total': len(faq_system.duplicate_faqs)
+        'duplicates': duplicates,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'capacity': faq_system.duplicate_log.capacity
     })
 
 @app.route('/admin/clear_duplicates', methods=['POST'])
 def clear_duplicate_faqs():
-    """重複FAQリストをクリア（デバッグ用）"""
-    faq_system.duplicate_faqs = []
+    """重複FAQリストをクリア（デバッグ用、記録自体は保存上限まで残す）"""
+    faq_system.duplicate_log.clear()
     print("[DEBUG] 重複FAQリストをクリアしました")
     return jsonify({'success': True, 'message': '重複FAQリストをクリアしました'})
 
 @app.route('/admin/interrupt_generation', methods=['POST'])
 def interrupt_generation():
-    """FAQ生成を中断"""
-    faq_system.generation_interrupted = True
-    generation_progress['status'] = 'interrupted'
-    print("[INFO] FAQ生成の中断リクエストを受信")
-    return jsonify({'success': True, 'message': 'FAQ生成を中断しました'})
+    """FAQ生成を中断（job_id 未指定なら実行中・待機中の生成ジョブすべて）"""
+    job_id = request.values.get('job_id') or (request.get_json(silent=True) or {}).get('job_id')
+    if job_id:
+        cancelled = 1 if job_queue.cancel(job_id) else 0
+    else:
+        cancelled = job_queue.cancel_all('faq_generation')
+    print(f"[DEBUG] FAQ生成の中断を要求: {job_id or 'すべて'}（{cancelled}件）")
+    return jsonify({'success': True, 'message': 'FAQ生成を中断しました', 'cancelled': cancelled})
 
 @app.route('/admin/auto_generate', methods=['POST'])
 def auto_generate_faqs():
-    """FAQ自動生成API"""
+    """FAQ自動生成API（生成ジョブを登録して、ジョブIDを返す）"""
     try:
         # デバッグモード: 第2章.pdfを固定で使用
-        import os
         DEBUG_MODE = True
+        pdf_extractor = request.form.get('pdf_extractor') or None  # pypdf2 / pdfminer
 
         if DEBUG_MODE:
             print("[DEBUG] デバッグモード: 第2章.pdfを使用")
-            pdf_path = os.path.join(os.path.dirname(__file__), 'reference_docs', '第2章.pdf')
+            pdf_path = os.path.join(APP_DIR, 'reference_docs', '第2章.pdf')
             num_questions = int(request.form.get('num_questions', 10))
             category = 'AI生成'
+            source_name = '第2章.pdf'
+            delete_after = False
 
             if not os.path.exists(pdf_path):
                 return jsonify({'success': False, 'message': f'デバッグ用PDFが見つかりません: {pdf_path}'})
-
-            print(f"[DEBUG] FAQ自動生成開始 - ファイル: 第2章.pdf, 数: {num_questions}")
-
-            # 進捗状況を初期化
-            generation_progress['current'] = 0
-            generation_progress['total'] = num_questions
-            generation_progress['status'] = 'generating'
-            generation_progress['retry_count'] = 0
-            generation_progress['max_retries'] = 10  # ウィンドウごとの最大リトライ回数
-            generation_progress['excluded_windows'] = 0
-            generation_progress['total_windows'] = 0
-            generation_progress['question_range'] = ''
-            generation_progress['answer_range'] = ''
-
-            # 中断フラグをリセット
-            faq_system.generation_interrupted = False
-
-            # 進捗更新用コールバックを設定
-            def update_progress(current, total, retry_count=0, excluded_windows=0, total_windows=0, question_range='', answer_range=''):
-                generation_progress['current'] = current
-                generation_progress['total'] = total
-                generation_progress['status'] = 'generating'
-                generation_progress['retry_count'] = retry_count
-                generation_progress['excluded_windows'] = excluded_windows
-                generation_progress['total_windows'] = total_windows
-                generation_progress['question_range'] = question_range
-                generation_progress['answer_range'] = answer_range
-                print(f"[DEBUG] 進捗更新: {current}/{total}, ウィンドウリトライ: {retry_count}, 除外ウィンドウ: {excluded_windows}/{total_windows}, 質問範囲: {question_range}")
-
-            faq_system.progress_callback = update_progress
-
-            # バックグラウンドスレッドでFAQ生成を実行
-            def generate_in_background():
-                try:
-                    print("[DEBUG] バックグラウンドスレッドでFAQ生成開始")
-                    generated_faqs = faq_system.generate_faqs_from_document(pdf_path, num_questions, category)
-
-                    # 生成完了（中断された場合もFAQがあれば保存）
-                    if faq_system.generation_interrupted:
-                        generation_progress['status'] = 'interrupted'
-                        print(f"[DEBUG] FAQ生成が中断されました（生成済み: {len(generated_faqs)}件）")
-                    else:
-                        generation_progress['status'] = 'completed'
-
-                    if not generated_faqs:
-                        generation_progress['status'] = 'error' if not faq_system.generation_interrupted else 'interrupted'
-                        print("[DEBUG] FAQ生成失敗: 生成されたFAQがありません")
-                        return
-
-                    # 生成されたFAQを承認待ちキューに追加（中断されても実行）
-                    added_count = 0
-                    total_generated = len(generated_faqs)
-                    for faq in generated_faqs:
-                        try:
-                            qa_id = faq_system.add_pending_qa(
-                                question=faq.get('question', ''),
-                                answer=faq.get('answer', ''),
-                                keywords=faq.get('keywords', ''),
-                                category=faq.get('category', category),
-                                user_question=f"[自動生成] 第2章.pdfから生成"
-                            )
-                            added_count += 1
-                            print(f"[DEBUG] 承認待ちQ&Aに追加: {qa_id}")
-                        except Exception as e:
-                            print(f"[DEBUG] 承認待ちQ&A追加エラー: {e}")
-
-                    print(f"[DEBUG] {added_count}件のFAQを承認待ちキューに追加しました")
-
-                except Exception as e:
-                    print(f"[DEBUG] バックグラウンドFAQ生成エラー: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    generation_progress['status'] = 'error'
-
-            # スレッドを起動
-            thread = threading.Thread(target=generate_in_background)
-            thread.daemon = True
-            thread.start()
-
-            # 即座にレスポンスを返す（Railway タイムアウト回避）
-            return jsonify({
-                'success': True,
-                'message': 'FAQ生成を開始しました。進捗は画面で確認できます。'
-            })
         else:
             # 通常モード: ファイルアップロードの処理
             uploaded_file = request.files.get('source_file')
@@ -587,107 +736,32 @@ def auto_generate_faqs():
             if file_size > 10 * 1024 * 1024:  # 10MB
                 return jsonify({'success': False, 'message': 'ファイルサイズが10MBを超えています'})
 
-            # 一時ファイルとして保存
-            import tempfile
+            # ジョブが再起動後に続きから実行できるよう、一時ディレクトリではなくアプリ側に保存
             import uuid
 
-            temp_dir = tempfile.gettempdir()
-            temp_filename = f"uploaded_pdf_{uuid.uuid4().hex[:8]}_{uploaded_file.filename}"
-            pdf_path = os.path.join(temp_dir, temp_filename)
-
-            # アップロードされたファイルを保存
+            os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+            pdf_path = os.path.join(JOB_UPLOAD_DIR, f"uploaded_pdf_{uuid.uuid4().hex[:8]}_{os.path.basename(uploaded_file.filename)}")
             uploaded_file.save(pdf_path)
-            print(f"[DEBUG] FAQ自動生成開始 - ファイル: {uploaded_file.filename}, 数: {num_questions}")
-
-            # 進捗状況を初期化
-            generation_progress['current'] = 0
-            generation_progress['total'] = num_questions
-            generation_progress['status'] = 'generating'
-            generation_progress['retry_count'] = 0
-            generation_progress['max_retries'] = 10
-            generation_progress['excluded_windows'] = 0
-            generation_progress['total_windows'] = 0
-            generation_progress['question_range'] = ''
-            generation_progress['answer_range'] = ''
-
-            # 中断フラグをリセット
-            faq_system.generation_interrupted = False
-
-            # 進捗更新用コールバックを設定
-            def update_progress(current, total, retry_count=0, excluded_windows=0, total_windows=0, question_range='', answer_range=''):
-                generation_progress['current'] = current
-                generation_progress['total'] = total
-                generation_progress['status'] = 'generating'
-                generation_progress['retry_count'] = retry_count
-                generation_progress['excluded_windows'] = excluded_windows
-                generation_progress['total_windows'] = total_windows
-                generation_progress['question_range'] = question_range
-                generation_progress['answer_range'] = answer_range
-                print(f"[DEBUG] 進捗更新: {current}/{total}, ウィンドウリトライ: {retry_count}, 除外ウィンドウ: {excluded_windows}/{total_windows}, 質問範囲: {question_range}")
-
-            faq_system.progress_callback = update_progress
-
-            # バックグラウンドスレッドでFAQ生成を実行
-            def generate_in_background():
-                try:
-                    print("[DEBUG] バックグラウンドスレッドでFAQ生成開始（通常モード）")
-                    generated_faqs = faq_system.generate_faqs_from_document(pdf_path, num_questions, category)
-
-                    # 一時ファイルをクリーンアップ
-                    try:
-                        if os.path.exists(pdf_path):
-                            os.remove(pdf_path)
-                            print(f"[DEBUG] 一時ファイル削除: {pdf_path}")
-                    except Exception as cleanup_error:
-                        print(f"[DEBUG] 一時ファイル削除エラー: {cleanup_error}")
-
-                    # 生成完了（中断された場合もFAQがあれば保存）
-                    if faq_system.generation_interrupted:
-                        generation_progress['status'] = 'interrupted'
-                        print(f"[DEBUG] FAQ生成が中断されました（生成済み: {len(generated_faqs)}件）")
-                    else:
-                        generation_progress['status'] = 'completed'
-
-                    if not generated_faqs:
-                        generation_progress['status'] = 'error' if not faq_system.generation_interrupted else 'interrupted'
-                        print("[DEBUG] FAQ生成失敗: 生成されたFAQがありません")
-                        return
-
-                    # 生成されたFAQを承認待ちキューに追加（中断されても実行）
-                    added_count = 0
-                    total_generated = len(generated_faqs)
-                    for faq in generated_faqs:
-                        try:
-                            qa_id = faq_system.add_pending_qa(
-                                question=faq.get('question', ''),
-                                answer=faq.get('answer', ''),
-                                keywords=faq.get('keywords', ''),
-                                category=faq.get('category', category),
-                                user_question=f"[自動生成] {uploaded_file.filename}から生成"
-                            )
-                            added_count += 1
-                            print(f"[DEBUG] 承認待ちQ&Aに追加: {qa_id}")
-                        except Exception as e:
-                            print(f"[DEBUG] 承認待ちQ&A追加エラー: {e}")
-
-                    print(f"[DEBUG] {added_count}件のFAQを承認待ちキューに追加しました")
-
-                except Exception as e:
-                    print(f"[DEBUG] バックグラウンドFAQ生成エラー: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    generation_progress['status'] = 'error'
-
-            # スレッドを起動
-            thread = threading.Thread(target=generate_in_background)
-            thread.daemon = True
-            thread.start()
-
-            # 即座にレスポンスを返す（Railway タイムアウト回避）
-            return jsonify({
-                'success': True,
-                'message': 'FAQ生成を開始しました。進捗は画面で確認できます。'
-            })
+            source_name = uploaded_file.filename
+            delete_after = True
+
+        job_id = job_queue.submit('faq_generation', {
+            'pdf_path': pdf_path,
+            'source_name': source_name,
+            'num_questions': num_questions,
+            'category': category,
+            'pdf_extractor': pdf_extractor,
+            'delete_after': delete_after
+        }, progress=dict(INITIAL_GENERATION_PROGRESS, total=num_questions))
+        print(f"[DEBUG] FAQ自動生成ジョブを登録: {job_id} - ファイル: {source_name}, 数: {num_questions}")
+        publish_generation_progress(job_id)
+
+        # 即座にレスポンスを返す（Railway タイムアウト回避）
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'message': 'FAQ生成を開始しました。進捗は画面で確認できます。'
+        })
 
     except Exception as e:
         print(f"[DEBUG] FAQ自動生成エラー: {e}")
@@ -697,7 +771,7 @@ def auto_generate_faqs():
 
 @app.route('/feedback', methods=['POST'])
 def feedback():
-    """ユーザーフィードバックを処理"""
+    """ユーザーフィードバックを処理（不満足の場合は記録し、改善はジョブとして後で実行する）"""
     data = request.get_json()
     satisfied = data.get('satisfied')
     user_question = data.get('user_question')
@@ -710,62 +784,39 @@ def feedback():
         # 不満足なQ&Aを記録
         faq_system.save_unsatisfied_qa(user_question, matched_question, matched_answer, timestamp)
 
-        # Claude API が設定されているかチェック
-        import os
-        api_key = os.getenv('CLAUDE_API_KEY')
-        print(f"[DEBUG] CLAUDE_API_KEY exists: {bool(api_key)}")
-        if api_key:
-            print(f"[DEBUG] API key starts with: {api_key[:10] if len(api_key) > 10 else 'too short'}")
-
-        if api_key:
-            # Claude で自動改善を試行
-            try:
-                print(f"[DEBUG] Claude API で自動改善開始: {user_question}")
-                improvement_success = faq_system.auto_improve_qa(user_question, matched_question, matched_answer)
-                if improvement_success:
-                    print(f"[DEBUG] 自動改善成功")
-                    return jsonify({
-                        'status': 'success',
-                        'message': 'フィードバックありがとうございます。【Claude API】が改善されたQ&Aを自動生成しました。管理者による承認後にFAQに追加されます。'
-                    })
-                else:
-                    print(f"[DEBUG] 自動改善失敗")
-                    return jsonify({
-                        'status': 'success',
-                        'message': 'フィードバックありがとうございます。改善案の生成に失敗しましたが、記録いたしました。'
-                    })
-            except Exception as e:
-                print(f"自動改善エラー: {e}")
-                return jsonify({
-                    'status': 'success',
-                    'message': 'フィードバックありがとうございます。記録いたしました。（Claude API エラー）'
-                })
-        else:
-            # Claude API キー未設定の場合、モック機能を使用
-            print(f"[DEBUG] Claude API キー未設定。モック改善機能を使用します")
-            try:
-                improvement_success = faq_system.auto_improve_qa(user_question, matched_question, matched_answer)
-                if improvement_success:
-                    print(f"[DEBUG] モック改善成功")
-                    return jsonify({
-                        'status': 'success',
-                        'message': 'フィードバックありがとうございます。【モック機能】が改善されたQ&Aを自動生成しました。管理者による承認後にFAQに追加されます。'
-                    })
-                else:
-                    print(f"[DEBUG] モック改善失敗")
-                    return jsonify({
-                        'status': 'success',
-                        'message': 'フィードバックありがとうございます。改善案の生成に失敗しましたが、記録いたしました。'
-                    })
-            except Exception as e:
-                print(f"モック改善エラー: {e}")
-                return jsonify({
-                    'status': 'success',
-                    'message': 'フィードバックありがとうございます。記録いたしました。（モック機能エラー）'
-                })
+        # 自動改善（Claude API、未設定ならモック）はワーカーで実行。同じ質問の改善が進行中・直近に完了していればまとめる
+        job_id, coalesced = feedback_queue.submit_coalesced('feedback_improvement', feedback_dedupe_key(user_question), {
+            'user_question': user_question,
+            'matched_question': matched_question,
+            'matched_answer': matched_answer
+        }, window=FEEDBACK_COALESCE_SECONDS)
+        print(f"[DEBUG] 自動改善ジョブ{'にまとめました' if coalesced else 'を登録'}: {job_id} - {user_question}")
+        return jsonify({
+            'status': 'success',
+            'job_id': job_id,
+            'coalesced': coalesced,
+            'message': 'フィードバックありがとうございます。改善されたQ&Aを自動生成し、管理者による承認後にFAQに追加されます。'
+        })
 
     return jsonify({'status': 'success'})
 
+@app.route('/admin/feedback_jobs', methods=['GET'])
+def list_feedback_jobs():
+    """フィードバック改善ジョブの一覧（新しい順、status で絞り込み可、limit は /admin/jobs と同じ）"""
+    limit = min(100, max(1, request.args.get('limit', 20, type=int)))
+    return jsonify({'jobs': feedback_queue.list_jobs(kind='feedback_improvement', status=request.args.get('status'), limit=limit)})
+
+@app.route('/admin/feedback_jobs/<job_id>', methods=['GET'])
+def get_feedback_job(job_id):
+    """フィードバック改善ジョブの状態（coalesced: まとめられた同じ質問のフィードバック数）"""
+    job = feedback_queue.get(job_id)
+    if job is None or job['kind'] != 'feedback_improvement':
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    job['results'] = feedback_queue.results(job_id)
+    return jsonify(job)
+
+print(f"[STARTUP] アプリ初期化時間: {time.time() - startup_time:.2f}秒")
+
 if __name__ == '__main__':
     import os
     # 起動時に環境変数をチェック
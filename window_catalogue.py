@@ -0,0 +1,316 @@
+"""
+資料ごとのウィンドウカタログ（FAQ自動生成のウィンドウ選択用）
+
+生成のたびに全ウィンドウ位置のリストを作り直し、1回選ぶごとに除外済みを除いたリストを作る代わりに、
+ウィンドウの一覧を一度だけ作り、選択・返却・除外をそれぞれ O(1) で行います。
+
+- ウィンドウは回答用テキストの内容ハッシュで識別し、採用数・却下数・除外の統計を SQLite に残す
+  （アップロードごとにファイル名が変わっても、同じ内容の資料なら前回までの結果を引き継ぐ）
+- 採用されたFAQの質問範囲は「カバー済み」とし、質問範囲が重なるウィンドウは後回しにする
+- 前回までに除外された・何度リクエストしても採用されなかったウィンドウは最後に回す
+- WINDOW_CATALOGUE=0 で統計の保存を無効化（選択はこの生成の中だけで行う）
+"""
+
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_CATALOGUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'window_catalogue.sqlite3')
+DEFAULT_MAX_ENTRIES = 200000
+LOW_YIELD_REQUESTS = 5  # この回数リクエストして1件も採用されなければ後回しにする
+
+FRESH, COVERED, EXHAUSTED = 0, 1, 2  # 選択の優先順（小さいほど先に選ぶ）
+
+
+def window_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+class WindowSampler:
+    """1回の生成で使うウィンドウの選択状態
+
+    ウィンドウは番号（0, 1, ...）で扱い、開始位置は 番号 × step。
+    優先度ごとの配列と「番号 → 配列内の位置」の対応を持ち、末尾との入れ替えで O(1) で取り出す。
+    """
+
+    def __init__(self, hashes: List[str], step: int, answer_window: int, question_window: int,
+                 stats: Dict[str, Dict] = None, catalogue: 'WindowCatalogue' = None, rng: random.Random = None):
+        self.hashes = hashes
+        self.step = step
+        self.question_offset = (answer_window - question_window) // 2
+        self.question_window = question_window
+        self.catalogue = catalogue
+        self.rng = rng or random
+        self.stats = stats or {}  # 前回までの統計（内容ハッシュ → requests / accepted / rejected / exhausted）
+        self.deltas: Dict[str, Dict] = {}  # この生成で増えた分（flush で保存）
+
+        count = len(hashes)
+        self.total = count
+        self.excluded_count = 0
+        self._pools: Tuple[List[int], ...] = ([], [], [])
+        self._slot: List[Optional[Tuple[int, int]]] = [None] * count  # 番号 → (優先度, 配列内の位置)。取り出し中・除外済みはNone
+        self._excluded = bytearray(count)
+        self._covered_blocks = bytearray((count * step + answer_window) // step + 1)
+        self._cover_count = [0] * count  # 質問範囲に含まれるカバー済みブロック数
+
+        # 前回までに採用があったウィンドウの質問範囲をカバー済みにしてから、各ウィンドウを優先度別に振り分ける
+        for index, key in enumerate(hashes):
+            if self.stats.get(key, {}).get('accepted'):
+                self._cover(index, reassign=False)
+        for index in range(count):
+            self._put(index)
+
+    # --- 選択 ---
+
+    def __len__(self) -> int:
+        return sum(len(pool) for pool in self._pools)
+
+    def position(self, index: int) -> int:
+        return index * self.step
+
+    def index(self, position: int) -> int:
+        return position // self.step
+
+    def take(self) -> Optional[int]:
+        """優先度の高い順にウィンドウを1つ取り出して開始位置を返す（なければNone）"""
+        for pool in self._pools:
+            if pool:
+                chosen = self.rng.randrange(len(pool))
+                index = pool[chosen]
+                self._remove(index)
+                return self.position(index)
+        return None
+
+    def release(self, position: int) -> None:
+        """取り出したウィンドウを戻す（除外されていなければ、次に選ばれうる）"""
+        index = self.index(position)
+        if not self._excluded[index] and self._slot[index] is None:
+            self._put(index)
+
+    def exclude(self, position: int) -> None:
+        """この生成では二度と選ばない（次回以降も後回しにする）"""
+        index = self.index(position)
+        if self._excluded[index]:
+            return
+        if self._slot[index] is not None:
+            self._remove(index)
+        self._excluded[index] = 1
+        self.excluded_count += 1
+        self._count(index, 'exhausted', 1)
+
+    def is_excluded(self, position: int) -> bool:
+        return bool(self._excluded[self.index(position)])
+
+    # --- 統計 ---
+
+    def record_request(self, position: int) -> None:
+        self._count(self.index(position), 'requests', 1)
+
+    def record_rejected(self, position: int) -> None:
+        self._count(self.index(position), 'rejected', 1)
+
+    def record_accepted(self, position: int) -> None:
+        """FAQが採用された：質問範囲をカバー済みにし、範囲が重なるウィンドウを後回しにする"""
+        index = self.index(position)
+        self._count(index, 'accepted', 1)
+        self._cover(index, reassign=True)
+
+    def coverage(self) -> float:
+        """資料のうち、採用されたFAQの質問範囲でカバーされた割合"""
+        return sum(self._covered_blocks) / len(self._covered_blocks) if self._covered_blocks else 0.0
+
+    def flush(self) -> None:
+        """この生成の統計をカタログに保存"""
+        if self.catalogue is not None and self.deltas:
+            self.catalogue.save(self.deltas)
+        self.deltas = {}
+
+    # --- 内部処理 ---
+
+    def _count(self, index: int, field: str, amount: int) -> None:
+        key = self.hashes[index]
+        delta = self.deltas.setdefault(key, {'requests': 0, 'accepted': 0, 'rejected': 0, 'exhausted': 0})
+        delta[field] += amount
+
+    def _tier(self, index: int) -> int:
+        key = self.hashes[index]
+        previous = self.stats.get(key, {})
+        current = self.deltas.get(key, {})
+        requests = previous.get('requests', 0) + current.get('requests', 0)
+        accepted = previous.get('accepted', 0) + current.get('accepted', 0)
+        if previous.get('exhausted') or (requests >= LOW_YIELD_REQUESTS and not accepted):
+            return EXHAUSTED
+        return COVERED if self._cover_count[index] else FRESH
+
+    def _put(self, index: int) -> None:
+        tier = self._tier(index)
+        pool = self._pools[tier]
+        self._slot[index] = (tier, len(pool))
+        pool.append(index)
+
+    def _remove(self, index: int) -> None:
+        tier, slot = self._slot[index]
+        pool = self._pools[tier]
+        last = pool.pop()
+        if last != index:
+            pool[slot] = last
+            self._slot[last] = (tier, slot)
+        self._slot[index] = None
+
+    def _question_blocks(self, index: int) -> range:
+        start = index * self.step + self.question_offset
+        return range(start // self.step, -(-(start + self.question_window) // self.step))
+
+    def _cover(self, index: int, reassign: bool) -> None:
+        blocks = self._question_blocks(index)
+        reach = len(blocks)
+        for block in blocks:
+            if self._covered_blocks[block]:
+                continue
+            self._covered_blocks[block] = 1
+            # このブロックを質問範囲に含むウィンドウ（前後 reach 個の範囲だけ見ればよい）
+            first = max(0, block - reach - self.question_offset // self.step)
+            last = min(self.total - 1, block - self.question_offset // self.step + 1)
+            for other in range(first, last + 1):
+                if block not in self._question_blocks(other):
+                    continue
+                self._cover_count[other] += 1
+                if reassign and self._cover_count[other] == 1 and self._slot[other] is not None \
+                        and self._slot[other][0] == FRESH:
+                    self._remove(other)
+                    self._put(other)
+
+
+class WindowCatalogue:
+    """ウィンドウの内容ハッシュごとの統計（SQLite）と、資料ごとのウィンドウ一覧（メモリ）"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS windows (
+            hash TEXT PRIMARY KEY,
+            requests INTEGER NOT NULL DEFAULT 0,
+            accepted INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            exhausted INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS windows_updated ON windows (updated_at);
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CATALOGUE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_documents: int = 8):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_documents = max_documents
+        self._local = threading.local()
+        self._layouts: 'OrderedDict[tuple, List[str]]' = OrderedDict()
+        self._layouts_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def layout(self, text: str, answer_window: int, step: int) -> List[str]:
+        """資料のウィンドウ（開始位置 = 番号 × step）ごとの内容ハッシュ。同じ資料は2回目からメモリ上の一覧を使う"""
+        key = (window_hash(text), len(text), answer_window, step)
+        with self._layouts_lock:
+            hashes = self._layouts.get(key)
+            if hashes is not None:
+                self._layouts.move_to_end(key)
+                return hashes
+        hashes = build_layout(text, answer_window, step)
+        with self._layouts_lock:
+            self._layouts[key] = hashes
+            while len(self._layouts) > self.max_documents:
+                self._layouts.popitem(last=False)
+        return hashes
+
+    def load(self, hashes: List[str]) -> Dict[str, Dict]:
+        """内容ハッシュごとの保存済み統計"""
+        stats = {}
+        unique = list(set(hashes))
+        conn = self._connect()
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            for row in conn.execute(f'SELECT hash, requests, accepted, rejected, exhausted FROM windows WHERE hash IN ({placeholders})', batch):
+                stats[row[0]] = {'requests': row[1], 'accepted': row[2], 'rejected': row[3], 'exhausted': row[4]}
+        return stats
+
+    def save(self, deltas: Dict[str, Dict]) -> None:
+        """統計の増分を加算して保存し、上限を超えた分を古い順に削除"""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    'INSERT INTO windows (hash, requests, accepted, rejected, exhausted, updated_at) VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT(hash) DO UPDATE SET requests = requests + excluded.requests, '
+                    'accepted = accepted + excluded.accepted, rejected = rejected + excluded.rejected, '
+                    'exhausted = MAX(exhausted, excluded.exhausted), updated_at = excluded.updated_at',
+                    [(key, d['requests'], d['accepted'], d['rejected'], min(1, d['exhausted']), now) for key, d in deltas.items()]
+                )
+                conn.execute('DELETE FROM windows WHERE hash IN '
+                             '(SELECT hash FROM windows ORDER BY updated_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+        except sqlite3.Error as e:
+            print(f"[WARNING] ウィンドウカタログの保存に失敗: {e}")
+
+    def sampler(self, text: str, answer_window: int, question_window: int, step: int) -> WindowSampler:
+        hashes = self.layout(text, answer_window, step)
+        try:
+            stats = self.load(hashes)
+        except sqlite3.Error as e:
+            print(f"[WARNING] ウィンドウカタログの読み込みに失敗（統計なしで続行）: {e}")
+            stats = {}
+        return WindowSampler(hashes, step, answer_window, question_window, stats=stats, catalogue=self)
+
+    def clear(self) -> int:
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM windows').rowcount
+
+
+def build_layout(text: str, answer_window: int, step: int) -> List[str]:
+    max_start = max(0, len(text) - answer_window)
+    return [window_hash(text[position:position + answer_window]) for position in range(0, max_start, step)]
+
+
+def open_window_sampler(text: str, answer_window: int, question_window: int, step: int) -> WindowSampler:
+    """資料のウィンドウ選択を開始（カタログが無効なら統計なし）"""
+    catalogue = get_window_catalogue()
+    if catalogue is not None:
+        return catalogue.sampler(text, answer_window, question_window, step)
+    return WindowSampler(build_layout(text, answer_window, step), step, answer_window, question_window)
+
+
+_catalogue: Optional[WindowCatalogue] = None
+_catalogue_lock = threading.Lock()
+
+
+def get_window_catalogue() -> Optional[WindowCatalogue]:
+    """プロセス共有のカタログ（WINDOW_CATALOGUE=0 なら None）"""
+    global _catalogue
+    if os.getenv('WINDOW_CATALOGUE', '1').lower() in ('0', 'false', 'off'):
+        return None
+    if _catalogue is None:
+        with _catalogue_lock:
+            if _catalogue is None:
+                try:
+                    _catalogue = WindowCatalogue(
+                        os.getenv('WINDOW_CATALOGUE_PATH') or DEFAULT_CATALOGUE_PATH,
+                        max_entries=int(os.getenv('WINDOW_CATALOGUE_MAX_ENTRIES', str(DEFAULT_MAX_ENTRIES)))
+                    )
+                except Exception as e:
+                    print(f"[WARNING] ウィンドウカタログを開けませんでした（統計なしで続行）: {e}")
+                    return None
+    return _catalogue
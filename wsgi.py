@@ -0,0 +1,19 @@
+"""
+本番用のWSGIエントリーポイント
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py の設定（preload_app, APP_PRELOAD=1）では、マスタープロセスでこのモジュールを読み込み、
+FAQデータ・検索インデックス・埋め込み・セマンティックモデルを準備してからワーカーを fork します。
+読み込んだメモリはコピーオンライトで全ワーカーに共有されます。
+"""
+
+import gc
+import os
+
+from web_app import app, faq_system
+
+if os.getenv('APP_PRELOAD') == '1':
+    faq_system.preload()
+    # 以降のGCで共有ページに書き込まないよう、読み込み済みのオブジェクトをGCの対象から外す
+    gc.freeze()